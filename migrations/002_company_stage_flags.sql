@@ -0,0 +1,20 @@
+-- Funding Round Collection Engine V2 - Denormalize Stage 2/3 flags onto companies
+-- PostgreSQL version (init_database() applies the same change automatically)
+
+ALTER TABLE companies ADD COLUMN IF NOT EXISTS stage2_sec_collected BOOLEAN DEFAULT FALSE NOT NULL;
+ALTER TABLE companies ADD COLUMN IF NOT EXISTS stage3_search_extracted BOOLEAN DEFAULT FALSE NOT NULL;
+
+-- Backfill from processing_status
+UPDATE companies c
+SET stage2_sec_collected = ps.stage2_sec_collected,
+    stage3_search_extracted = ps.stage3_search_extracted
+FROM processing_status ps
+WHERE ps.company_id = c.id;
+
+-- Partial indexes for the pending-company scans (only unfinished rows are indexed)
+CREATE INDEX IF NOT EXISTS ix_companies_stage2_pending ON companies(id) WHERE NOT stage2_sec_collected;
+CREATE INDEX IF NOT EXISTS ix_companies_stage3_pending ON companies(id) WHERE NOT stage3_search_extracted;
+
+-- Superseded by the indexes above
+DROP INDEX IF EXISTS ix_processing_status_stage2_pending;
+DROP INDEX IF EXISTS ix_processing_status_stage3_pending;
@@ -0,0 +1,52 @@
+-- Funding Round Collection Engine V2 - Index cleanup for hot query predicates
+-- PostgreSQL version (init_database() creates the new indexes automatically)
+
+-- The old SELECT-then-INSERT logger could race and leave duplicate provider/model/day rows:
+-- fold them into the oldest row (summed counters, min/max latency, call-weighted average) first
+WITH merged AS (
+    SELECT MIN(id) AS keep_id,
+           SUM(total_calls) AS total_calls,
+           SUM(successful_calls) AS successful_calls,
+           SUM(failed_calls) AS failed_calls,
+           SUM(rate_limited_calls) AS rate_limited_calls,
+           SUM(total_input_tokens) AS total_input_tokens,
+           SUM(total_output_tokens) AS total_output_tokens,
+           SUM(average_latency_ms * total_calls)
+               / NULLIF(SUM(CASE WHEN average_latency_ms IS NOT NULL THEN total_calls END), 0) AS average_latency_ms,
+           MIN(min_latency_ms) AS min_latency_ms,
+           MAX(max_latency_ms) AS max_latency_ms
+    FROM llm_usage
+    GROUP BY provider_name, model_name, date
+    HAVING COUNT(*) > 1
+)
+UPDATE llm_usage u
+SET total_calls = m.total_calls,
+    successful_calls = m.successful_calls,
+    failed_calls = m.failed_calls,
+    rate_limited_calls = m.rate_limited_calls,
+    total_input_tokens = m.total_input_tokens,
+    total_output_tokens = m.total_output_tokens,
+    average_latency_ms = m.average_latency_ms,
+    min_latency_ms = m.min_latency_ms,
+    max_latency_ms = m.max_latency_ms,
+    updated_at = NOW()
+FROM merged m
+WHERE u.id = m.keep_id;
+
+DELETE FROM llm_usage u
+USING llm_usage keeper
+WHERE keeper.provider_name = u.provider_name
+  AND keeper.model_name = u.model_name
+  AND keeper.date = u.date
+  AND keeper.id < u.id;
+
+-- One row per provider/model/day; target of the LLM usage upsert
+CREATE UNIQUE INDEX IF NOT EXISTS ux_llm_usage_provider_model_date ON llm_usage(provider_name, model_name, date);
+
+-- Partial indexes for the Stage 1/4 pending lookups (only unfinished rows are indexed)
+CREATE INDEX IF NOT EXISTS ix_processing_status_stage1_pending ON processing_status(company_id) WHERE NOT stage1_resolved;
+CREATE INDEX IF NOT EXISTS ix_processing_status_stage4_pending ON processing_status(company_id) WHERE NOT stage4_merged;
+
+-- Redundant: provider_name is the leading column of ux_llm_usage_provider_model_date
+DROP INDEX IF EXISTS idx_llm_usage_provider;
+DROP INDEX IF EXISTS ix_llm_usage_provider_name;
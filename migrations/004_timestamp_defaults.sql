@@ -0,0 +1,42 @@
+-- Funding Round Collection Engine V2 - Database-side timestamps
+-- PostgreSQL version (created_at/updated_at/stageN_completed_at are now set with now() in SQL)
+
+-- Existing values were written with datetime.utcnow(); interpret them as UTC
+ALTER TABLE companies
+    ALTER COLUMN created_at TYPE TIMESTAMPTZ USING created_at AT TIME ZONE 'UTC',
+    ALTER COLUMN updated_at TYPE TIMESTAMPTZ USING updated_at AT TIME ZONE 'UTC',
+    ALTER COLUMN created_at SET DEFAULT now(),
+    ALTER COLUMN updated_at SET DEFAULT now();
+
+ALTER TABLE investors
+    ALTER COLUMN created_at TYPE TIMESTAMPTZ USING created_at AT TIME ZONE 'UTC',
+    ALTER COLUMN updated_at TYPE TIMESTAMPTZ USING updated_at AT TIME ZONE 'UTC',
+    ALTER COLUMN created_at SET DEFAULT now(),
+    ALTER COLUMN updated_at SET DEFAULT now();
+
+-- COPY into funding_rounds relies on these defaults
+ALTER TABLE funding_rounds
+    ALTER COLUMN created_at TYPE TIMESTAMPTZ USING created_at AT TIME ZONE 'UTC',
+    ALTER COLUMN updated_at TYPE TIMESTAMPTZ USING updated_at AT TIME ZONE 'UTC',
+    ALTER COLUMN created_at SET DEFAULT now(),
+    ALTER COLUMN updated_at SET DEFAULT now();
+
+ALTER TABLE sources
+    ALTER COLUMN created_at TYPE TIMESTAMPTZ USING created_at AT TIME ZONE 'UTC',
+    ALTER COLUMN created_at SET DEFAULT now();
+
+ALTER TABLE processing_status
+    ALTER COLUMN stage1_completed_at TYPE TIMESTAMPTZ USING stage1_completed_at AT TIME ZONE 'UTC',
+    ALTER COLUMN stage2_completed_at TYPE TIMESTAMPTZ USING stage2_completed_at AT TIME ZONE 'UTC',
+    ALTER COLUMN stage3_completed_at TYPE TIMESTAMPTZ USING stage3_completed_at AT TIME ZONE 'UTC',
+    ALTER COLUMN stage4_completed_at TYPE TIMESTAMPTZ USING stage4_completed_at AT TIME ZONE 'UTC',
+    ALTER COLUMN created_at TYPE TIMESTAMPTZ USING created_at AT TIME ZONE 'UTC',
+    ALTER COLUMN updated_at TYPE TIMESTAMPTZ USING updated_at AT TIME ZONE 'UTC',
+    ALTER COLUMN created_at SET DEFAULT now(),
+    ALTER COLUMN updated_at SET DEFAULT now();
+
+ALTER TABLE llm_usage
+    ALTER COLUMN created_at TYPE TIMESTAMPTZ USING created_at AT TIME ZONE 'UTC',
+    ALTER COLUMN updated_at TYPE TIMESTAMPTZ USING updated_at AT TIME ZONE 'UTC',
+    ALTER COLUMN created_at SET DEFAULT now(),
+    ALTER COLUMN updated_at SET DEFAULT now();
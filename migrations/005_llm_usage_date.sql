@@ -0,0 +1,4 @@
+-- Funding Round Collection Engine V2 - Native DATE for llm_usage.date
+-- PostgreSQL version (values were stored as 'YYYY-MM-DD' strings; init_database() applies the same change automatically)
+
+ALTER TABLE llm_usage ALTER COLUMN date TYPE DATE USING date::date;
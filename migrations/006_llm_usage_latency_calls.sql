@@ -0,0 +1,8 @@
+-- Funding Round Collection Engine V2 - Weight for llm_usage.average_latency_ms
+-- PostgreSQL version (init_database() applies the same change automatically)
+
+-- Calls covered by average_latency_ms (failed calls may report no latency)
+ALTER TABLE llm_usage ADD COLUMN IF NOT EXISTS latency_calls INTEGER DEFAULT 0 NOT NULL;
+
+-- Existing averages are assumed to cover every call of their row
+UPDATE llm_usage SET latency_calls = total_calls WHERE average_latency_ms IS NOT NULL AND latency_calls = 0;
@@ -5,61 +5,84 @@ With parallel processing, database storage, and multiple LLM/SEC accounts
 """
 
 import argparse
+import atexit
 import csv
 import logging
 import os
+import queue
 import sys
-import yaml
+import time
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from datetime import datetime
-from threading import Lock
+from datetime import datetime, timedelta
+from itertools import islice
+from logging.handlers import QueueHandler, QueueListener
 
-from dotenv import load_dotenv
+from sqlalchemy import func, select
 
 # Add src to path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
-from src.database import DatabaseManager
+from src.config import get_config, get_env
+from src.database import Company, CompanyRef, DatabaseManager
 from src.deduplicator_v2 import DeduplicatorV2
 from src.exporter_v2 import ExporterV2
 from src.llm_router_v2 import LLMRouterV2
 from src.search_extractor_v2 import SearchExtractorV2
 from src.sec_collector_v2 import SECCollectorV2
 
-# Setup logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s.%(msecs)03d | %(levelname)-8s | %(name)s | %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S'
-)
 logger = logging.getLogger(__name__)
 
-# Global lock for database writes
-db_write_lock = Lock()
+# Log progress every N completed companies
+PROGRESS_LOG_INTERVAL = 50
 
 
-def load_config():
-    """Load configuration from YAML file"""
-    config_path = os.path.join(os.path.dirname(__file__), 'config', 'config.yaml')
-    with open(config_path, 'r') as f:
-        return yaml.safe_load(f)
+def setup_logging():
+    """
+    Setup logging. Worker threads only enqueue records; a background listener
+    thread formats and writes them, keeping log I/O off the processing path.
+    """
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(logging.Formatter(
+        '%(asctime)s.%(msecs)03d | %(levelname)-8s | %(name)s | %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    ))
+
+    # Records are rendered to their final message (incl. traceback) before queueing
+    log_queue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.setFormatter(logging.Formatter('%(message)s'))
+    logging.basicConfig(level=logging.INFO, handlers=[queue_handler])
+
+    listener = QueueListener(log_queue, console_handler)
+    listener.start()
+    atexit.register(listener.stop)
+
+
+def iter_companies_from_csv(csv_path: str):
+    """Yield unique company names from CSV file (first occurrence wins), one row at a time"""
+    with open(csv_path, 'r', encoding='utf-8-sig', newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+
+        # Name columns in preference order; each row uses the first one it has a value in
+        name_columns = [header.index(name) for name in ('Companies', 'company', 'Company') if name in header]
+        if not name_columns:
+            return
+
+        seen = set()
+        for row in reader:
+            company_name = next((row[idx] for idx in name_columns if idx < len(row) and row[idx]), '').strip()
+            if company_name and company_name not in seen:
+                seen.add(company_name)
+                yield company_name
 
 
 def load_companies_from_csv(csv_path: str, limit: int = None) -> list:
     """Load companies from CSV file"""
-    companies = []
-
     if not os.path.exists(csv_path):
         raise FileNotFoundError(f"CSV file not found: {csv_path}")
 
-    with open(csv_path, 'r', encoding='utf-8-sig') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            company_name = row.get('Companies') or row.get('company') or row.get('Company')
-            if company_name:
-                companies.append(company_name.strip())
-
-    return companies[:limit] if limit else companies
+    return list(islice(iter_companies_from_csv(csv_path), limit))
 
 
 def run_stage1(db_manager: DatabaseManager, companies: list):
@@ -68,149 +91,182 @@ def run_stage1(db_manager: DatabaseManager, companies: list):
     logger.info("STAGE 1: COMPANY LOADING")
     logger.info("=" * 100)
 
-    with db_manager.session_scope() as session:
-        for company_name in companies:
-            db_manager.get_or_create_company(session, company_name)
+    # One transaction for the whole load (single commit/fsync)
+    with db_manager.bulk_session_scope() as session:
+        created = db_manager.bulk_create_companies(session, companies)
 
-        logger.info(f"✓ Loaded {len(companies)} companies into database")
+        logger.info(f"✓ Loaded {len(companies)} companies into database ({created} new)")
 
 
-def process_company_stage2(company_id: int, db_manager: DatabaseManager, sec_collector: SECCollectorV2):
-    """Process a single company in Stage 2 (SEC)"""
-    with db_manager.session_scope() as session:
-        company = session.query(db_manager.engine).get(company_id)
-        if company:
-            return sec_collector.process_company(session, company)
-    return 0
+def batch_size_for(total: int, workers: int, batch_size: int) -> int:
+    """Companies per task: at most batch_size, but small enough to keep every worker busy"""
+    return max(1, min(batch_size, -(-total // workers)))
 
 
-def process_company_stage2_worker(company_id: int, company_name: str, db_manager: DatabaseManager, sec_collector: SECCollectorV2):
-    """Worker function for Stage 2 - processes a single company in its own session"""
-    with db_manager.session_scope() as session:
-        from src.database.models import Company
-        company = session.query(Company).filter(Company.id == company_id).first()
-        if company:
-            return sec_collector.process_company(session, company)
-        return 0
+def process_companies_stage2_worker(companies: list, db_manager: DatabaseManager, sec_collector: SECCollectorV2):
+    """Worker function for Stage 2 - processes a batch of CompanyRefs, committing each company on its own"""
+    rounds_found = 0
+    for company in companies:
+        try:
+            # Short transaction per company: SQLite's single write lock is released
+            # before the next company's SEC requests
+            with db_manager.session_scope() as session:
+                rounds_found += sec_collector.process_company(session, company)
+        except Exception as e:
+            logger.error("  Error processing %s: %s", company.name, e)
+    return rounds_found
 
 
-def run_stage2_parallel(db_manager: DatabaseManager, sec_collector: SECCollectorV2, workers: int):
+def run_stage2_parallel(db_manager: DatabaseManager, sec_collector: SECCollectorV2, workers: int,
+                        batch_size: int = 50):
     """Stage 2: SEC EDGAR Form D collection (parallel)"""
     logger.info("")
     logger.info("=" * 100)
     logger.info(f"STAGE 2: SEC EDGAR FORM D COLLECTION ({workers} workers)")
     logger.info("=" * 100)
 
-    # Get company IDs and names that need Stage 2 (avoid detached instances)
+    # Companies that need Stage 2, as plain (id, name, cik) rows (avoid detached instances)
+    pending = select(Company.id, Company.name, Company.cik).where(~Company.stage2_sec_collected)
+
     with db_manager.session_scope() as session:
-        from src.database.models import Company, ProcessingStatus
-        company_data = session.query(Company.id, Company.name).join(ProcessingStatus).filter(
-            ~ProcessingStatus.stage2_sec_collected
-        ).all()
+        total = session.scalar(select(func.count()).select_from(pending.subquery()))
 
-    if not company_data:
+    if not total:
         logger.info("All companies already processed for Stage 2")
         return
 
-    logger.info(f"Processing {len(company_data)} companies...")
+    logger.info(f"Processing {total} companies...")
 
     total_rounds = 0
+    chunk_size = batch_size_for(total, workers, batch_size)
 
     with ThreadPoolExecutor(max_workers=workers) as executor:
         futures = {}
 
-        for company_id, company_name in company_data:
-            future = executor.submit(process_company_stage2_worker, company_id, company_name, db_manager, sec_collector)
-            futures[future] = company_name
+        # Stream companies in batch-sized partitions straight into the pool
+        with db_manager.session_scope() as session:
+            result = session.execute(pending.execution_options(yield_per=chunk_size))
+            for rows in result.partitions():
+                chunk = [CompanyRef(*row) for row in rows]
+                future = executor.submit(process_companies_stage2_worker, chunk, db_manager, sec_collector)
+                futures[future] = len(chunk)
 
         completed = 0
         for future in as_completed(futures):
-            company_name = futures[future]
             try:
-                rounds_found = future.result()
-                total_rounds += rounds_found
-                completed += 1
-
-                if completed % 10 == 0:
-                    logger.info(f"  Progress: {completed}/{len(company_data)} ({completed/len(company_data)*100:.1f}%)")
-
+                total_rounds += future.result()
             except Exception as e:
-                logger.error(f"  Error processing {company_name}: {str(e)}")
-                completed += 1
+                logger.error("  Error processing batch of %d companies: %s", futures[future], e)
+
+            previous = completed
+            completed += futures[future]
+            if (completed // PROGRESS_LOG_INTERVAL > previous // PROGRESS_LOG_INTERVAL
+                    and logger.isEnabledFor(logging.INFO)):
+                logger.info("  Progress: %d/%d (%.1f%%)", completed, total, completed / total * 100)
 
     logger.info(f"✓ Stage 2 complete: {total_rounds} rounds from SEC")
 
 
-def process_company_stage3_worker(company_id: int, company_name: str, db_manager: DatabaseManager, search_extractor: SearchExtractorV2):
-    """Worker function for Stage 3 - processes a single company in its own session"""
-    with db_manager.session_scope() as session:
-        from src.database.models import Company
-        company = session.query(Company).filter(Company.id == company_id).first()
-        if company:
-            return search_extractor.process_company(session, company)
-        return 0
+def process_companies_stage3_worker(companies: list, db_manager: DatabaseManager, search_extractor: SearchExtractorV2):
+    """Worker function for Stage 3 - processes a batch of CompanyRefs (one transaction per company)"""
+    # Several companies share each LLM call; each one's results are committed on their own
+    return search_extractor.process_companies(companies)
 
 
-def run_stage3_parallel(db_manager: DatabaseManager, search_extractor: SearchExtractorV2, workers: int):
+def run_stage3_parallel(db_manager: DatabaseManager, search_extractor: SearchExtractorV2, workers: int,
+                        batch_size: int = 50):
     """Stage 3: Search-based extraction (parallel)"""
     logger.info("")
     logger.info("=" * 100)
     logger.info(f"STAGE 3: SEARCH-BASED EXTRACTION ({workers} workers)")
     logger.info("=" * 100)
 
-    # Get company IDs and names that need Stage 3 (avoid detached instances)
+    # Companies that need Stage 3, as plain (id, name, cik) rows (avoid detached instances)
+    pending = select(Company.id, Company.name, Company.cik).where(~Company.stage3_search_extracted)
+
     with db_manager.session_scope() as session:
-        from src.database.models import Company, ProcessingStatus
-        company_data = session.query(Company.id, Company.name).join(ProcessingStatus).filter(
-            ~ProcessingStatus.stage3_search_extracted
-        ).all()
+        total = session.scalar(select(func.count()).select_from(pending.subquery()))
 
-    if not company_data:
+    if not total:
         logger.info("All companies already processed for Stage 3")
         return
 
-    logger.info(f"Processing {len(company_data)} companies...")
+    logger.info(f"Processing {total} companies...")
 
     total_rounds = 0
+    chunk_size = batch_size_for(total, workers, batch_size)
 
     with ThreadPoolExecutor(max_workers=workers) as executor:
         futures = {}
 
-        for company_id, company_name in company_data:
-            future = executor.submit(process_company_stage3_worker, company_id, company_name, db_manager, search_extractor)
-            futures[future] = company_name
+        # Stream companies in batch-sized partitions straight into the pool
+        with db_manager.session_scope() as session:
+            result = session.execute(pending.execution_options(yield_per=chunk_size))
+            for rows in result.partitions():
+                chunk = [CompanyRef(*row) for row in rows]
+                future = executor.submit(process_companies_stage3_worker, chunk, db_manager, search_extractor)
+                futures[future] = len(chunk)
 
         completed = 0
         for future in as_completed(futures):
-            company_name = futures[future]
             try:
-                rounds_found = future.result()
-                total_rounds += rounds_found
-                completed += 1
-
-                if completed % 10 == 0:
-                    logger.info(f"  Progress: {completed}/{len(company_data)} ({completed/len(company_data)*100:.1f}%)")
-
+                total_rounds += future.result()
             except Exception as e:
-                logger.error(f"  Error processing {company_name}: {str(e)}")
-                completed += 1
+                logger.error("  Error processing batch of %d companies: %s", futures[future], e)
+
+            previous = completed
+            completed += futures[future]
+            if (completed // PROGRESS_LOG_INTERVAL > previous // PROGRESS_LOG_INTERVAL
+                    and logger.isEnabledFor(logging.INFO)):
+                logger.info("  Progress: %d/%d (%.1f%%)", completed, total, completed / total * 100)
 
     logger.info(f"✓ Stage 3 complete: {total_rounds} rounds from search")
 
 
-def run_stage4(db_manager: DatabaseManager, deduplicator: DeduplicatorV2):
-    """Stage 4: Deduplication"""
+def dedupe_shard_worker(shard: int, num_shards: int, db_manager: DatabaseManager, deduplicator: DeduplicatorV2):
+    """Worker function for Stage 4 - deduplicates one company_id shard in its own session/transaction"""
+    with db_manager.session_scope() as session:
+        return deduplicator.deduplicate_shard(session, shard, num_shards)
+
+
+def run_stage4(db_manager: DatabaseManager, deduplicator: DeduplicatorV2, workers: int = 1):
+    """Stage 4: Deduplication (parallel, sharded by company_id)"""
+    # SQLite allows a single writer; shards would only queue on the database lock
+    if db_manager.engine.dialect.name == 'sqlite':
+        workers = 1
+
     logger.info("")
     logger.info("=" * 100)
-    logger.info("STAGE 4: DEDUPLICATION")
+    logger.info(f"STAGE 4: DEDUPLICATION ({workers} workers)")
     logger.info("=" * 100)
 
+    total_companies = 0
+    total_duplicates = 0
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(dedupe_shard_worker, shard, workers, db_manager, deduplicator)
+            for shard in range(workers)
+        ]
+        for future in as_completed(futures):
+            shard_stats = future.result()
+            total_companies += shard_stats['total_companies']
+            total_duplicates += shard_stats['duplicates_removed']
+
     with db_manager.session_scope() as session:
-        stats = deduplicator.deduplicate_all(session)
+        stats = deduplicator.summarize(session, total_companies, total_duplicates)
 
     logger.info(f"✓ Stage 4 complete: {stats['unique_rounds']} unique rounds")
 
 
+def run_export(db_manager: DatabaseManager, exporter: ExporterV2):
+    """Export results in a dedicated session; returns (export files, elapsed time)"""
+    export_start = time.perf_counter()
+    with db_manager.session_scope() as session:
+        export_files = exporter.export_all_formats(session)
+    return export_files, timedelta(seconds=time.perf_counter() - export_start)
+
+
 def main():
     """Run the V2 parallel pipeline"""
     parser = argparse.ArgumentParser(description='Funding Round Data Collection Engine V2')
@@ -224,14 +280,23 @@ def main():
                        help='Reset processing status and reprocess all companies (use after bug fixes)')
     args = parser.parse_args()
 
+    setup_logging()
+
     # Load environment and configuration
-    load_dotenv(os.path.join(os.path.dirname(__file__), '..', '.env'))
-    config = load_config()
+    get_env()
+    config = get_config()
 
     # Override workers from config if specified
     if 'parallel' in config and 'max_workers' in config['parallel']:
         args.workers = config['parallel']['max_workers']
 
+    # Stage 2 is bounded by the SEC rate limit, Stage 3 by search/LLM limits,
+    # so each stage can size its own pool (defaults to max_workers)
+    parallel_config = config.get('parallel', {})
+    stage2_workers = parallel_config.get('stage2_workers') or args.workers
+    stage3_workers = parallel_config.get('stage3_workers') or args.workers
+    batch_size = parallel_config.get('batch_size', 50)
+
     # Determine run mode
     if args.full:
         run_mode = f"FULL RUN ({args.workers} workers)"
@@ -264,23 +329,22 @@ def main():
     logger.info("")
     logger.info("Initializing components...")
 
+    # SEC/search/LLM clients are created later, only for stages that still have work
     db_manager = DatabaseManager(config)
-    llm_router = LLMRouterV2(config, db_manager)
-    sec_collector = SECCollectorV2(config, db_manager)
-    search_extractor = SearchExtractorV2(config, llm_router, db_manager)
     deduplicator = DeduplicatorV2(config, db_manager)
     exporter = ExporterV2(config, db_manager)
+    llm_router = None
 
-    logger.info(f"✓ All components initialized")
-    logger.info(f"✓ Parallel workers: {args.workers}")
+    logger.info(f"✓ Core components initialized")
+    logger.info(f"✓ Parallel workers: {args.workers} (Stage 2: {stage2_workers}, Stage 3: {stage3_workers})")
 
-    start_time = datetime.now()
+    start_time = time.perf_counter()
 
     try:
         # Stage 1: Load companies
-        stage1_start = datetime.now()
+        stage1_start = time.perf_counter()
         run_stage1(db_manager, companies)
-        stage1_elapsed = datetime.now() - stage1_start
+        stage1_elapsed = timedelta(seconds=time.perf_counter() - stage1_start)
         logger.info(f"Stage 1 complete in {stage1_elapsed}")
 
         # Reset processing status if requested (use after bug fixes to reprocess)
@@ -288,35 +352,54 @@ def main():
             logger.info("⚠  --reset flag set: resetting processing status for all companies")
             db_manager.reset_processing_status(stages=[2, 3, 4])
 
+        # Skip client construction and stage runs when nothing is pending (idempotent re-runs)
+        initial_progress = db_manager.get_processing_progress()
+        stage2_pending = initial_progress['total_companies'] - initial_progress['stage2_completed']
+        stage3_pending = initial_progress['total_companies'] - initial_progress['stage3_completed']
+
         # Stage 2: SEC collection (parallel)
-        stage2_start = datetime.now()
-        run_stage2_parallel(db_manager, sec_collector, args.workers)
-        stage2_elapsed = datetime.now() - stage2_start
+        if stage2_pending:
+            sec_collector = SECCollectorV2(config, db_manager)
+            stage2_start = time.perf_counter()
+            run_stage2_parallel(db_manager, sec_collector, stage2_workers, batch_size)
+            stage2_elapsed = timedelta(seconds=time.perf_counter() - stage2_start)
+        else:
+            logger.info("All companies already processed for Stage 2")
+            stage2_elapsed = timedelta(0)
         logger.info(f"Stage 2 complete in {stage2_elapsed}")
 
         # Stage 3: Search extraction (parallel)
-        stage3_start = datetime.now()
-        run_stage3_parallel(db_manager, search_extractor, args.workers)
-        stage3_elapsed = datetime.now() - stage3_start
+        if stage3_pending:
+            llm_router = LLMRouterV2(config, db_manager)
+            search_extractor = SearchExtractorV2(config, llm_router, db_manager)
+            stage3_start = time.perf_counter()
+            run_stage3_parallel(db_manager, search_extractor, stage3_workers, batch_size)
+            stage3_elapsed = timedelta(seconds=time.perf_counter() - stage3_start)
+        else:
+            logger.info("All companies already processed for Stage 3")
+            stage3_elapsed = timedelta(0)
         logger.info(f"Stage 3 complete in {stage3_elapsed}")
 
         # Stage 4: Deduplication
-        stage4_start = datetime.now()
-        run_stage4(db_manager, deduplicator)
-        stage4_elapsed = datetime.now() - stage4_start
+        stage4_start = time.perf_counter()
+        run_stage4(db_manager, deduplicator, args.workers)
+        stage4_elapsed = timedelta(seconds=time.perf_counter() - stage4_start)
         logger.info(f"Stage 4 complete in {stage4_elapsed}")
 
-        # Export results
-        export_start = datetime.now()
-        with db_manager.session_scope() as session:
-            export_files = exporter.export_all_formats(session)
-        export_elapsed = datetime.now() - export_start
+        # Write any buffered LLM usage before the final statistics
+        db_manager.flush_llm_usage()
+
+        # Export results while the final statistics queries run (each in its own session)
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            export_future = executor.submit(run_export, db_manager, exporter)
+            stats_future = executor.submit(db_manager.get_statistics)
+            progress_future = executor.submit(db_manager.get_processing_progress)
 
-        # Get final statistics
-        stats = db_manager.get_statistics()
-        progress = db_manager.get_processing_progress()
+            export_files, export_elapsed = export_future.result()
+            stats = stats_future.result()
+            progress = progress_future.result()
 
-        elapsed = datetime.now() - start_time
+        elapsed = timedelta(seconds=time.perf_counter() - start_time)
         end_time = datetime.now()
 
         logger.info("")
@@ -344,7 +427,8 @@ def main():
         logger.info("")
 
         # LLM stats
-        llm_router.log_stats()
+        if llm_router:
+            llm_router.log_stats()
 
     except KeyboardInterrupt:
         logger.warning("\n\n⚠️  Pipeline interrupted by user")
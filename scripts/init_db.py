@@ -6,23 +6,15 @@ Initializes the database schema based on config.yaml
 
 import os
 import sys
-import yaml
-from dotenv import load_dotenv
-
-# Load environment variables from parent directory
-load_dotenv(os.path.join(os.path.dirname(__file__), '..', '..', '.env'))
 
 # Add parent directory to path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
+from src.config import get_config, get_env
 from src.database import DatabaseManager, init_database, create_db_engine
 
-
-def load_config():
-    """Load configuration from YAML file"""
-    config_path = os.path.join(os.path.dirname(__file__), '..', 'config', 'config.yaml')
-    with open(config_path, 'r') as f:
-        return yaml.safe_load(f)
+# Load environment variables from parent directory
+get_env()
 
 
 def main():
@@ -33,7 +25,7 @@ def main():
     print()
 
     # Load configuration
-    config = load_config()
+    config = get_config()
     db_config = config['database']
     db_type = db_config.get('type', 'sqlite')
 
@@ -5,13 +5,12 @@ Test database connection for Oracle Cloud deployment
 
 import os
 import sys
-import yaml
 from pathlib import Path
 
 # Add v2_parallel_db directory to path (where src/ is located)
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from dotenv import load_dotenv
+from src.config import CONFIG_PATH, ENV_PATH, get_config, get_env
 
 def test_connection():
     """Test database connection"""
@@ -21,25 +20,22 @@ def test_connection():
     print()
 
     # Load environment (.env is in parent of v2_parallel_db)
-    env_path = Path(__file__).parent.parent.parent / '.env'
-    if not env_path.exists():
-        print(f"❌ ERROR: .env file not found at {env_path}")
+    if not os.path.exists(ENV_PATH):
+        print(f"❌ ERROR: .env file not found at {ENV_PATH}")
         print("   Please create .env file with DATABASE_URL and API keys")
         return False
 
-    load_dotenv(env_path)
-    print(f"✓ Loaded environment from {env_path}")
+    get_env()
+    print(f"✓ Loaded environment from {ENV_PATH}")
 
     # Load config
-    config_path = Path(__file__).parent.parent / 'config' / 'config.yaml'
-    if not config_path.exists():
-        print(f"❌ ERROR: config.yaml not found at {config_path}")
+    if not os.path.exists(CONFIG_PATH):
+        print(f"❌ ERROR: config.yaml not found at {CONFIG_PATH}")
         return False
 
-    with open(config_path, 'r') as f:
-        config = yaml.safe_load(f)
+    config = get_config()
 
-    print(f"✓ Loaded configuration from {config_path}")
+    print(f"✓ Loaded configuration from {CONFIG_PATH}")
     print()
 
     # Test database connection
@@ -127,12 +123,8 @@ def test_llm_providers():
     print()
 
     try:
-        env_path = Path(__file__).parent.parent.parent / '.env'
-        load_dotenv(env_path)
-
-        config_path = Path(__file__).parent.parent / 'config' / 'config.yaml'
-        with open(config_path, 'r') as f:
-            config = yaml.safe_load(f)
+        get_env()
+        config = get_config()
 
         from src.database import DatabaseManager
         from src.llm_router_v2 import LLMRouterV2
@@ -174,12 +166,8 @@ def test_sec_agents():
     print()
 
     try:
-        env_path = Path(__file__).parent.parent.parent / '.env'
-        load_dotenv(env_path)
-
-        config_path = Path(__file__).parent.parent / 'config' / 'config.yaml'
-        with open(config_path, 'r') as f:
-            config = yaml.safe_load(f)
+        get_env()
+        config = get_config()
 
         from src.database import DatabaseManager
         from src.sec_collector_v2 import SECCollectorV2
@@ -0,0 +1,33 @@
+"""
+Configuration loading for Funding Round Collection Engine V2
+Parses config.yaml and loads .env once per process
+"""
+
+import os
+from functools import lru_cache
+
+import yaml
+from dotenv import load_dotenv
+
+try:
+    from yaml import CSafeLoader as SafeLoader  # libyaml bindings
+except ImportError:
+    from yaml import SafeLoader
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONFIG_PATH = os.path.join(PROJECT_ROOT, 'config', 'config.yaml')
+ENV_PATH = os.path.join(os.path.dirname(PROJECT_ROOT), '.env')
+
+
+@lru_cache(maxsize=1)
+def get_env():
+    """Load environment variables from .env (once) and return os.environ"""
+    load_dotenv(ENV_PATH)
+    return os.environ
+
+
+@lru_cache(maxsize=1)
+def get_config() -> dict:
+    """Load configuration from YAML file (parsed once, shared by all callers)"""
+    with open(CONFIG_PATH, 'r') as f:
+        return yaml.load(f, Loader=SafeLoader)
@@ -4,20 +4,22 @@ Database package for Funding Round Collection Engine V2
 
 from .db_manager import DatabaseManager
 from .models import (
-    Base, Company, FundingRound, Investor, LLMUsage, ProcessingStatus, Source,
-    create_db_engine, get_session, init_database
+    Base, Company, CompanyRef, FundingRound, Investor, LLMUsage, ProcessingStatus, Source,
+    create_db_engine, create_session_factory, get_session, init_database
 )
 
 __all__ = [
     'DatabaseManager',
     'Base',
     'Company',
+    'CompanyRef',
     'FundingRound',
     'Investor',
     'LLMUsage',
     'ProcessingStatus',
     'Source',
     'create_db_engine',
+    'create_session_factory',
     'get_session',
     'init_database',
 ]
@@ -3,22 +3,112 @@ Database Manager for Funding Round Collection Engine V2
 Provides CRUD operations and transaction management
 """
 
+import atexit
+import io
+import json
 import logging
+import threading
+import time
+from collections import OrderedDict
 from contextlib import contextmanager
-from datetime import datetime
-from typing import Dict, List, Optional
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
 
-from sqlalchemy import and_, func, or_
-from sqlalchemy.exc import IntegrityError
-from sqlalchemy.orm import Session
+from sqlalchemy import JSON, case, event, func, insert, or_, select, text, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session, joinedload, raiseload, selectinload
 
 from .models import (
     Company, FundingRound, Investor, LLMUsage, ProcessingStatus, Source,
-    create_db_engine, get_session, init_database, round_investors
+    create_db_engine, create_session_factory, init_database, round_investors
 )
 
 logger = logging.getLogger(__name__)
 
+# Rows per bulk INSERT statement (keeps SQLite under its bound-parameter limit)
+BULK_INSERT_PAGE_SIZE = 5000
+
+# Eager loads for rounds returned outside their session: relationships are fetched up front
+# (one SELECT ... IN per collection) and any other lazy load raises instead of querying per row
+ROUND_LOAD_OPTIONS = (
+    joinedload(FundingRound.company),
+    selectinload(FundingRound.investors),
+    selectinload(FundingRound.sources),
+    raiseload('*'),
+)
+
+# Rows fetched per round-trip when streaming whole tables
+STREAM_BATCH_SIZE = 1000
+
+# LLM usage is buffered in memory and upserted when either limit is reached
+LLM_USAGE_FLUSH_EVENTS = 100
+LLM_USAGE_FLUSH_SECONDS = 30.0
+
+# round_data keys already stored as FundingRound columns / investor links (kept out of raw_data)
+PROJECTED_ROUND_FIELDS = frozenset({
+    'round_name', 'date', 'amount_raised_usd', 'pre_money_valuation_usd', 'post_money_valuation_usd',
+    'lead_investor', 'notes', 'all_investors',
+})
+
+# Upper bound on cached name -> id entries per entity type
+ID_CACHE_SIZE = 10000
+
+
+def _count_where(condition):
+    """COUNT of rows matching condition, as an aggregate usable alongside others (0 on empty tables)"""
+    return func.coalesce(func.sum(case((condition, 1), else_=0)), 0)
+
+
+def _stage_pending(stage: int):
+    """(id column, predicate) selecting companies that haven't completed a stage; matches the partial "pending" indexes"""
+    if stage == 1:
+        return ProcessingStatus.company_id, ~ProcessingStatus.stage1_resolved
+    if stage == 2:
+        return Company.id, ~Company.stage2_sec_collected
+    if stage == 3:
+        return Company.id, ~Company.stage3_search_extracted
+    if stage == 4:
+        return ProcessingStatus.company_id, ~ProcessingStatus.stage4_merged
+    raise ValueError(f"Unknown stage: {stage}")
+
+
+class IdCache:
+    """Thread-safe, bounded (least recently used evicted) name -> id map"""
+
+    def __init__(self, maxsize: int = ID_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._ids = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> Optional[int]:
+        """Cached id for name, or None"""
+        with self._lock:
+            entity_id = self._ids.get(name)
+            if entity_id is not None:
+                self._ids.move_to_end(name)
+            return entity_id
+
+    def get_many(self, names: List[str]) -> Dict[str, int]:
+        """Cached ids for whichever of names are present"""
+        with self._lock:
+            found = {}
+            for name in names:
+                entity_id = self._ids.get(name)
+                if entity_id is not None:
+                    self._ids.move_to_end(name)
+                    found[name] = entity_id
+            return found
+
+    def update(self, ids: Dict[str, int]):
+        """Add name -> id entries, evicting the least recently used beyond maxsize"""
+        with self._lock:
+            for name, entity_id in ids.items():
+                self._ids[name] = entity_id
+                self._ids.move_to_end(name)
+            while len(self._ids) > self.maxsize:
+                self._ids.popitem(last=False)
+
 
 class DatabaseManager:
     """Manage database operations with transaction support"""
@@ -26,17 +116,37 @@ class DatabaseManager:
     def __init__(self, config: dict):
         """Initialize database connection"""
         self.config = config
-        self.engine = create_db_engine(config['database'])
+
+        # Every parallel worker holds a connection for its batch; leave headroom
+        parallel_config = config.get('parallel', {})
+        workers = max(parallel_config.get(key) or 0 for key in ('max_workers', 'stage2_workers', 'stage3_workers'))
+        self.engine = create_db_engine(config['database'], pool_size=max(workers * 2, 10))
         init_database(self.engine)
+        self.Session = create_session_factory(self.engine)
+
+        # Name -> id caches (names are UNIQUE). IDs resolved in a session are only
+        # published after it commits; any rollback (incl. savepoints) discards them
+        self._company_ids = IdCache()
+        self._investor_ids = IdCache()
+        event.listen(self.Session, 'after_soft_rollback', self._discard_pending_ids)
+
+        # Pending LLM usage deltas keyed by (provider, model, date)
+        self._usage_buffer = {}
+        self._usage_events = 0
+        self._usage_last_flush = time.monotonic()
+        self._usage_lock = threading.Lock()
+        atexit.register(self.flush_llm_usage)
+
         logger.info(f"✓ Database initialized: {config['database']['type']}")
 
     @contextmanager
     def session_scope(self):
         """Provide a transactional scope for database operations"""
-        session = get_session(self.engine)
+        session = self.Session()
         try:
             yield session
             session.commit()
+            self._publish_pending_ids(session)
         except Exception as e:
             session.rollback()
             logger.error(f"Database transaction failed: {str(e)}")
@@ -44,22 +154,80 @@ class DatabaseManager:
         finally:
             session.close()
 
+    @contextmanager
+    def bulk_session_scope(self):
+        """
+        Transactional scope for bulk loads: everything is committed once at the end.
+        On SQLite, fsyncs are disabled (synchronous=OFF) for the load and restored afterwards.
+        """
+        is_sqlite = self.engine.dialect.name == 'sqlite'
+        with self.engine.connect() as conn:
+            if is_sqlite:
+                conn.exec_driver_sql('PRAGMA synchronous=OFF')
+                conn.commit()
+
+            session = self.Session(bind=conn)
+            try:
+                yield session
+                session.commit()
+                self._publish_pending_ids(session)
+            except Exception as e:
+                session.rollback()
+                logger.error(f"Database transaction failed: {str(e)}")
+                raise
+            finally:
+                session.close()
+                if is_sqlite:
+                    conn.exec_driver_sql('PRAGMA synchronous=NORMAL')
+                    conn.commit()
+
+    @staticmethod
+    def _stage_ids(session: Session, cache: IdCache, ids: Dict[str, int]):
+        """Remember ids resolved in this session until it commits"""
+        if ids:
+            session.info.setdefault('pending_ids', []).append((cache, ids))
+
+    @staticmethod
+    def _publish_pending_ids(session: Session):
+        """Move ids staged by a committed session into the shared caches"""
+        for cache, ids in session.info.pop('pending_ids', []):
+            cache.update(ids)
+
+    @staticmethod
+    def _discard_pending_ids(session: Session, previous_transaction):
+        """Drop staged ids on rollback: they may refer to rows that no longer exist"""
+        session.info.pop('pending_ids', None)
+
+    def _insert_ignore(self, model, index_elements: List[str]):
+        """INSERT that silently skips rows conflicting on index_elements (ON CONFLICT DO NOTHING)"""
+        if self.engine.dialect.name == 'postgresql':
+            stmt = pg_insert(model)
+        else:
+            stmt = sqlite_insert(model)
+        return stmt.on_conflict_do_nothing(index_elements=index_elements)
+
     # ===== COMPANY OPERATIONS =====
 
     def get_or_create_company(self, session: Session, name: str, cik: Optional[str] = None,
                                official_name: Optional[str] = None) -> Company:
-        """Get existing company or create new one"""
-        company = session.query(Company).filter_by(name=name).first()
-
-        if not company:
-            company = Company(name=name, cik=cik, official_name=official_name)
-            session.add(company)
-            session.flush()  # Get ID without committing
-
+        """Get existing company or create new one (race-free across workers)"""
+        company_id = self._company_ids.get(name)
+        if company_id is not None:
+            company = session.get(Company, company_id)
+            created = False
+        else:
+            result = session.execute(
+                self._insert_ignore(Company, ['name']).values(name=name, cik=cik, official_name=official_name)
+            )
+            created = bool(result.rowcount)
+            company = session.query(Company).filter_by(name=name).one()
+            self._stage_ids(session, self._company_ids, {name: company.id})
+
+        if created:
             # Create processing status
-            status = ProcessingStatus(company_id=company.id)
-            session.add(status)
-            session.flush()
+            session.execute(
+                self._insert_ignore(ProcessingStatus, ['company_id']).values(company_id=company.id)
+            )
 
             logger.debug(f"Created new company: {name} (CIK: {cik})")
         else:
@@ -71,15 +239,54 @@ class DatabaseManager:
 
         return company
 
+    def bulk_create_companies(self, session: Session, names: List[str]) -> int:
+        """
+        Insert companies that don't exist yet, plus their processing status rows.
+        Uses bulk INSERT ... ON CONFLICT DO NOTHING instead of per-row get_or_create_company calls,
+        so concurrent loaders can't collide on the unique name.
+        Returns number of companies created.
+        """
+        existing = set(session.scalars(select(Company.name)))
+        new_names = [name for name in dict.fromkeys(names) if name not in existing]
+
+        for start in range(0, len(new_names), BULK_INSERT_PAGE_SIZE):
+            page = new_names[start:start + BULK_INSERT_PAGE_SIZE]
+            session.execute(self._insert_ignore(Company, ['name']), [{'name': name} for name in page])
+
+            new_ids = dict(session.execute(select(Company.name, Company.id).where(Company.name.in_(page))).all())
+            session.execute(
+                self._insert_ignore(ProcessingStatus, ['company_id']),
+                [{'company_id': company_id} for company_id in new_ids.values()]
+            )
+            self._stage_ids(session, self._company_ids, new_ids)
+
+        logger.debug(f"Created {len(new_names)} new companies ({len(existing)} already present)")
+        return len(new_names)
+
+    def update_company_identifiers(self, session: Session, company_id: int, cik: str,
+                                   official_name: Optional[str] = None):
+        """Set SEC identifiers for a company with a single UPDATE (no ORM load)"""
+        session.execute(
+            update(Company)
+            .where(Company.id == company_id)
+            .values(cik=cik, official_name=official_name)
+        )
+
     def get_company_by_name(self, name: str) -> Optional[Company]:
         """Get company by name"""
         with self.session_scope() as session:
-            return session.query(Company).filter_by(name=name).first()
+            company = session.query(Company).filter_by(name=name).first()
+            session.expunge_all()
+            return company
+
+    def iter_all_companies(self) -> Iterator[Company]:
+        """Stream all companies in batches (session stays open while the caller iterates)"""
+        with self.session_scope() as session:
+            yield from session.query(Company).execution_options(stream_results=True).yield_per(STREAM_BATCH_SIZE)
 
     def get_all_companies(self) -> List[Company]:
         """Get all companies"""
-        with self.session_scope() as session:
-            return session.query(Company).all()
+        return list(self.iter_all_companies())
 
     # ===== PROCESSING STATUS OPERATIONS =====
 
@@ -88,39 +295,59 @@ class DatabaseManager:
         status = session.query(ProcessingStatus).filter_by(company_id=company_id).first()
         if not status:
             status = ProcessingStatus(company_id=company_id)
-            session.add(status)
-            session.flush()
+            session.add(status)  # Written by the next (auto)flush
         return status
 
+    def _update_status(self, session: Session, company_id: int, **fields):
+        """Update processing status columns with a single UPDATE (creates the row if missing)"""
+        result = session.execute(
+            update(ProcessingStatus)
+            .where(ProcessingStatus.company_id == company_id)
+            .values(**fields)
+            .execution_options(synchronize_session=False)
+        )
+        if not result.rowcount:
+            session.add(ProcessingStatus(company_id=company_id, **fields))
+
     def update_stage1_status(self, session: Session, company_id: int, completed: bool = True):
         """Update Stage 1 (Resolution) status"""
-        status = self.get_processing_status(session, company_id)
-        status.stage1_resolved = completed
-        status.stage1_completed_at = datetime.utcnow() if completed else None
+        self._update_status(
+            session, company_id,
+            stage1_resolved=completed,
+            stage1_completed_at=func.now() if completed else None,
+        )
 
     def update_stage2_status(self, session: Session, company_id: int, rounds_found: int,
                              completed: bool = True):
         """Update Stage 2 (SEC) status"""
-        status = self.get_processing_status(session, company_id)
-        status.stage2_sec_collected = completed
-        status.stage2_completed_at = datetime.utcnow() if completed else None
-        status.stage2_rounds_found = rounds_found
+        self._update_status(
+            session, company_id,
+            stage2_sec_collected=completed,
+            stage2_completed_at=func.now() if completed else None,
+            stage2_rounds_found=rounds_found,
+        )
+        session.execute(update(Company).where(Company.id == company_id).values(stage2_sec_collected=completed))
 
     def update_stage3_status(self, session: Session, company_id: int, rounds_found: int,
                              completed: bool = True):
         """Update Stage 3 (Search) status"""
-        status = self.get_processing_status(session, company_id)
-        status.stage3_search_extracted = completed
-        status.stage3_completed_at = datetime.utcnow() if completed else None
-        status.stage3_rounds_found = rounds_found
+        self._update_status(
+            session, company_id,
+            stage3_search_extracted=completed,
+            stage3_completed_at=func.now() if completed else None,
+            stage3_rounds_found=rounds_found,
+        )
+        session.execute(update(Company).where(Company.id == company_id).values(stage3_search_extracted=completed))
 
     def update_stage4_status(self, session: Session, company_id: int, unique_rounds: int,
                              completed: bool = True):
         """Update Stage 4 (Merge) status"""
-        status = self.get_processing_status(session, company_id)
-        status.stage4_merged = completed
-        status.stage4_completed_at = datetime.utcnow() if completed else None
-        status.stage4_unique_rounds = unique_rounds
+        self._update_status(
+            session, company_id,
+            stage4_merged=completed,
+            stage4_completed_at=func.now() if completed else None,
+            stage4_unique_rounds=unique_rounds,
+        )
 
     def reset_processing_status(self, stages: List[int] = None):
         """Reset processing status flags so companies get reprocessed.
@@ -128,47 +355,75 @@ class DatabaseManager:
         if stages is None:
             stages = [2, 3, 4]
         with self.session_scope() as session:
-            records = session.query(ProcessingStatus).all()
-            for status in records:
-                if 2 in stages:
-                    status.stage2_sec_collected = False
-                    status.stage2_completed_at = None
-                    status.stage2_rounds_found = 0
-                if 3 in stages:
-                    status.stage3_search_extracted = False
-                    status.stage3_completed_at = None
-                    status.stage3_rounds_found = 0
-                if 4 in stages:
-                    status.stage4_merged = False
-                    status.stage4_completed_at = None
-                    status.stage4_unique_rounds = 0
-            logger.info(f"✓ Reset processing status for {len(records)} companies (stages {stages})")
+            # Keep the denormalized Company flags in sync
+            company_flags = {}
+            if 2 in stages:
+                company_flags['stage2_sec_collected'] = False
+            if 3 in stages:
+                company_flags['stage3_search_extracted'] = False
+            if company_flags:
+                session.execute(update(Company).values(**company_flags))
+
+            status_fields = {}
+            if 2 in stages:
+                status_fields.update(stage2_sec_collected=False, stage2_completed_at=None, stage2_rounds_found=0)
+            if 3 in stages:
+                status_fields.update(stage3_search_extracted=False, stage3_completed_at=None, stage3_rounds_found=0)
+            if 4 in stages:
+                status_fields.update(stage4_merged=False, stage4_completed_at=None, stage4_unique_rounds=0)
+
+            # One bulk UPDATE instead of loading every row
+            reset_count = 0
+            if status_fields:
+                result = session.execute(
+                    update(ProcessingStatus)
+                    .values(**status_fields)
+                    .execution_options(synchronize_session=False)
+                )
+                reset_count = result.rowcount
+            logger.info(f"✓ Reset processing status for {reset_count} companies (stages {stages})")
+
+    def iter_company_ids_needing_stage(self, stage: int, batch_size: int = STREAM_BATCH_SIZE) -> Iterator[int]:
+        """
+        Stream IDs of companies that haven't completed a stage, in ID order.
+        Keyset-paginated: each page is a short index-only query in its own session.
+        """
+        id_column, pending = _stage_pending(stage)
+        last_id = 0
+        while True:
+            with self.session_scope() as session:
+                ids = session.scalars(
+                    select(id_column).where(pending, id_column > last_id).order_by(id_column).limit(batch_size)
+                ).all()
+            yield from ids
+            if len(ids) < batch_size:
+                return
+            last_id = ids[-1]
 
     def get_companies_needing_stage(self, stage: int) -> List[Company]:
         """Get companies that haven't completed a specific stage"""
+        id_column, pending = _stage_pending(stage)
         with self.session_scope() as session:
-            query = session.query(Company).join(ProcessingStatus)
-
-            if stage == 1:
-                query = query.filter(ProcessingStatus.stage1_resolved == False)
-            elif stage == 2:
-                query = query.filter(ProcessingStatus.stage2_sec_collected == False)
-            elif stage == 3:
-                query = query.filter(ProcessingStatus.stage3_search_extracted == False)
-            elif stage == 4:
-                query = query.filter(ProcessingStatus.stage4_merged == False)
-
-            return query.all()
+            query = session.query(Company)
+            if id_column is ProcessingStatus.company_id:
+                query = query.join(ProcessingStatus)
+            companies = query.filter(pending).order_by(Company.id).all()
+            session.expunge_all()
+            return companies
 
     def get_processing_progress(self) -> Dict:
         """Get overall processing progress statistics"""
         with self.session_scope() as session:
-            total = session.query(Company).count()
-
-            stage1_done = session.query(ProcessingStatus).filter_by(stage1_resolved=True).count()
-            stage2_done = session.query(ProcessingStatus).filter_by(stage2_sec_collected=True).count()
-            stage3_done = session.query(ProcessingStatus).filter_by(stage3_search_extracted=True).count()
-            stage4_done = session.query(ProcessingStatus).filter_by(stage4_merged=True).count()
+            # One round-trip, one pass over processing_status
+            total, stage1_done, stage2_done, stage3_done, stage4_done = session.execute(
+                select(
+                    select(func.count(Company.id)).scalar_subquery(),
+                    _count_where(ProcessingStatus.stage1_resolved),
+                    _count_where(ProcessingStatus.stage2_sec_collected),
+                    _count_where(ProcessingStatus.stage3_search_extracted),
+                    _count_where(ProcessingStatus.stage4_merged),
+                ).select_from(ProcessingStatus)
+            ).one()
 
             return {
                 'total_companies': total,
@@ -184,85 +439,247 @@ class DatabaseManager:
 
     # ===== FUNDING ROUND OPERATIONS =====
 
+    @staticmethod
+    def _funding_round_row(company_id: int, round_data: dict, source_type: str, confidence_score: str,
+                           source_urls: Optional[List[str]] = None) -> dict:
+        """Column values for a new funding round"""
+        return {
+            'company_id': company_id,
+            'round_name': round_data.get('round_name'),
+            'date': round_data.get('date'),
+            'amount_raised_usd': round_data.get('amount_raised_usd'),
+            'pre_money_valuation_usd': round_data.get('pre_money_valuation_usd'),
+            'post_money_valuation_usd': round_data.get('post_money_valuation_usd'),
+            'lead_investor': round_data.get('lead_investor'),
+            'source_type': source_type,
+            'confidence_score': confidence_score,
+            'source_urls': source_urls,
+            'notes': round_data.get('notes'),
+            'raw_data': {key: value for key, value in round_data.items() if key not in PROJECTED_ROUND_FIELDS} or None,
+        }
+
     def add_funding_round(self, session: Session, company_id: int, round_data: dict,
                           source_type: str, confidence_score: str,
                           source_urls: Optional[List[str]] = None) -> FundingRound:
         """Add a new funding round"""
         funding_round = FundingRound(
-            company_id=company_id,
-            round_name=round_data.get('round_name'),
-            date=round_data.get('date'),
-            amount_raised_usd=round_data.get('amount_raised_usd'),
-            pre_money_valuation_usd=round_data.get('pre_money_valuation_usd'),
-            post_money_valuation_usd=round_data.get('post_money_valuation_usd'),
-            lead_investor=round_data.get('lead_investor'),
-            source_type=source_type,
-            confidence_score=confidence_score,
-            source_urls=source_urls,
-            notes=round_data.get('notes'),
-            raw_data=round_data
+            **self._funding_round_row(company_id, round_data, source_type, confidence_score, source_urls)
         )
 
         session.add(funding_round)
         session.flush()
 
-        # Add investors if provided
+        # Add investors if provided (resolved in bulk, linked with one multi-row INSERT)
         if 'all_investors' in round_data and round_data['all_investors']:
-            for investor_name in round_data['all_investors']:
-                if investor_name and investor_name.strip():
-                    investor = self.get_or_create_investor(session, investor_name.strip())
-                    funding_round.investors.append(investor)
+            investor_names = [name.strip() for name in round_data['all_investors'] if name and name.strip()]
+            investor_ids = self.get_or_create_investors(session, investor_names)
+            if investor_ids:
+                session.execute(
+                    insert(round_investors),
+                    [{'round_id': funding_round.id, 'investor_id': investor_id}
+                     for investor_id in investor_ids.values()]
+                )
 
         return funding_round
 
+    def bulk_load_funding_rounds(self, session: Session, rounds: List[dict]) -> List[int]:
+        """
+        Insert many funding rounds (plus their investor links) at once.
+        Each item holds add_funding_round() arguments: company_id, round_data, source_type,
+        confidence_score and optionally source_urls.
+        Uses COPY on PostgreSQL and a single executemany elsewhere. Returns new IDs in input order.
+        """
+        if not rounds:
+            return []
+
+        rows = [self._funding_round_row(**item) for item in rounds]
+
+        round_ids = None
+        if self.engine.dialect.name == 'postgresql':
+            round_ids = self._copy_funding_rounds(session, rows)
+        if round_ids is None:
+            round_ids = list(session.scalars(
+                insert(FundingRound).returning(FundingRound.id, sort_by_parameter_order=True), rows
+            ))
+
+        # Link investors for the whole batch: one lookup/insert for names, one INSERT for links
+        round_investor_names = []
+        for round_id, item in zip(round_ids, rounds):
+            names = item['round_data'].get('all_investors') or []
+            names = list(dict.fromkeys(name.strip() for name in names if name and name.strip()))
+            round_investor_names.append((round_id, names))
+
+        investor_ids = self.get_or_create_investors(
+            session, [name for _, names in round_investor_names for name in names]
+        )
+        links = [
+            {'round_id': round_id, 'investor_id': investor_ids[name]}
+            for round_id, names in round_investor_names
+            for name in names
+        ]
+        if links:
+            session.execute(insert(round_investors), links)
+
+        logger.debug(f"Bulk loaded {len(round_ids)} funding rounds ({len(links)} investor links)")
+        return round_ids
+
+    def _copy_funding_rounds(self, session: Session, rows: List[dict]) -> Optional[List[int]]:
+        """
+        COPY rows into funding_rounds (PostgreSQL) with IDs pre-allocated from the serial sequence.
+        Returns the new IDs, or None if the table has no sequence to allocate from.
+        """
+        sequence = session.scalar(text("SELECT pg_get_serial_sequence('funding_rounds', 'id')"))
+        if not sequence:
+            return None
+
+        round_ids = list(session.scalars(
+            text("SELECT nextval(:sequence) FROM generate_series(1, :count)"),
+            {'sequence': sequence, 'count': len(rows)}
+        ))
+
+        # created_at/updated_at are left to the column server defaults
+        columns = [column.name for column in FundingRound.__table__.columns
+                   if column.name not in ('created_at', 'updated_at')]
+
+        buffer = io.StringIO()
+        for round_id, row in zip(round_ids, rows):
+            buffer.write(self._copy_line(dict(row, id=round_id, is_duplicate=False), columns))
+        buffer.seek(0)
+
+        session.flush()  # COPY goes straight to the connection; write pending ORM changes first
+        cursor = session.connection().connection.cursor()
+        try:
+            cursor.copy_expert(
+                f"COPY funding_rounds ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer
+            )
+        finally:
+            cursor.close()
+
+        return round_ids
+
+    @staticmethod
+    def _copy_line(row: dict, columns: List[str]) -> str:
+        """
+        Render one funding_rounds row for COPY ... WITH (FORMAT csv), storing what an INSERT would.
+        NULL is the unquoted empty field, so every other value is quoted ('' stays an empty string).
+        JSON columns are encoded like the ORM does: None is JSON null unless the column type
+        stores it as SQL NULL (none_as_null).
+        """
+        fields = []
+        for column in columns:
+            value = row.get(column)
+            column_type = FundingRound.__table__.c[column].type
+            if isinstance(column_type, JSON) and not (value is None and column_type.none_as_null):
+                value = json.dumps(value)
+
+            if value is None:
+                fields.append('')
+                continue
+            if isinstance(value, bool):
+                value = 't' if value else 'f'
+            elif isinstance(value, datetime):
+                value = value.isoformat()
+            fields.append('"' + str(value).replace('"', '""') + '"')
+        return ','.join(fields) + '\n'
+
     def get_rounds_for_company(self, company_id: int, exclude_duplicates: bool = True) -> List[FundingRound]:
         """Get all funding rounds for a company"""
         with self.session_scope() as session:
-            query = session.query(FundingRound).filter_by(company_id=company_id)
+            query = session.query(FundingRound).options(*ROUND_LOAD_OPTIONS).filter_by(company_id=company_id)
             if exclude_duplicates:
                 query = query.filter_by(is_duplicate=False)
-            return query.all()
+            rounds = query.all()
+            session.expunge_all()
+            return rounds
 
-    def get_all_rounds(self, exclude_duplicates: bool = True) -> List[FundingRound]:
-        """Get all funding rounds"""
+    def iter_all_rounds(self, exclude_duplicates: bool = True) -> Iterator[FundingRound]:
+        """Stream all funding rounds in batches (session stays open while the caller iterates)"""
         with self.session_scope() as session:
-            query = session.query(FundingRound)
+            query = session.query(FundingRound).options(*ROUND_LOAD_OPTIONS)
             if exclude_duplicates:
                 query = query.filter_by(is_duplicate=False)
-            return query.all()
+            yield from query.execution_options(stream_results=True).yield_per(STREAM_BATCH_SIZE)
+
+    def get_all_rounds(self, exclude_duplicates: bool = True) -> List[FundingRound]:
+        """Get all funding rounds"""
+        return list(self.iter_all_rounds(exclude_duplicates))
 
     def mark_as_duplicate(self, session: Session, duplicate_round_id: int, original_round_id: int):
-        """Mark a round as duplicate of another"""
-        duplicate_round = session.query(FundingRound).get(duplicate_round_id)
-        if duplicate_round:
-            duplicate_round.is_duplicate = True
-            duplicate_round.duplicate_of_id = original_round_id
+        """Mark a round as duplicate of another with a single UPDATE (no SELECT)"""
+        session.execute(
+            update(FundingRound)
+            .where(FundingRound.id == duplicate_round_id)
+            .values(is_duplicate=True, duplicate_of_id=original_round_id)
+            .execution_options(synchronize_session=False)
+        )
+
+    def mark_as_duplicates(self, session: Session, pairs: List[Tuple[int, int]]):
+        """Mark many (duplicate_round_id, original_round_id) pairs in one executemany UPDATE"""
+        if not pairs:
+            return
+        session.execute(
+            update(FundingRound),
+            [{'id': duplicate_id, 'is_duplicate': True, 'duplicate_of_id': original_id}
+             for duplicate_id, original_id in pairs]
+        )
 
     # ===== INVESTOR OPERATIONS =====
 
     def get_or_create_investor(self, session: Session, name: str,
                                 investor_type: Optional[str] = None) -> Investor:
-        """Get existing investor or create new one"""
+        """Get existing investor or create new one (new investors get their ID on the next flush)"""
+        investor_id = self._investor_ids.get(name)
+        if investor_id is not None:
+            return session.get(Investor, investor_id)
+
         investor = session.query(Investor).filter_by(name=name).first()
 
-        if not investor:
+        if investor:
+            self._stage_ids(session, self._investor_ids, {name: investor.id})
+        else:
             investor = Investor(name=name, investor_type=investor_type)
             session.add(investor)
-            session.flush()
             logger.debug(f"Created new investor: {name}")
 
         return investor
 
+    def get_or_create_investors(self, session: Session, names: List[str]) -> Dict[str, int]:
+        """
+        Resolve many investor names at once: cached IDs first, then one IN() lookup, one bulk INSERT
+        for the missing ones, one lookup for their new IDs. Returns {name: investor_id}.
+        """
+        names = list(dict.fromkeys(names))
+        if not names:
+            return {}
+
+        investor_ids = self._investor_ids.get_many(names)
+
+        lookup = [name for name in names if name not in investor_ids]
+        if lookup:
+            found = dict(session.execute(
+                select(Investor.name, Investor.id).where(Investor.name.in_(lookup))
+            ).all())
+
+            missing = [name for name in lookup if name not in found]
+            if missing:
+                session.execute(self._insert_ignore(Investor, ['name']), [{'name': name} for name in missing])
+                found.update(session.execute(
+                    select(Investor.name, Investor.id).where(Investor.name.in_(missing))
+                ).all())
+                logger.debug(f"Created {len(missing)} new investors")
+
+            self._stage_ids(session, self._investor_ids, found)
+            investor_ids.update(found)
+
+        return investor_ids
+
     # ===== SOURCE OPERATIONS =====
 
     def add_source(self, session: Session, round_id: int, source_type: str,
                    url: Optional[str] = None, title: Optional[str] = None,
                    snippet: Optional[str] = None, llm_provider: Optional[str] = None,
                    llm_model: Optional[str] = None, extraction_confidence: Optional[str] = None) -> Source:
-        """Add a data source for a funding round"""
-        # Truncate to fit VARCHAR(500) column limits
-        if title and len(title) > 490:
-            title = title[:490] + '...'
+        """Add a data source for a funding round (Source.title truncates itself to 500 chars)"""
         source = Source(
             round_id=round_id,
             source_type=source_type,
@@ -274,87 +691,187 @@ class DatabaseManager:
             extraction_confidence=extraction_confidence
         )
 
+        # No flush: pending sources are batched into the session's next flush/commit
         session.add(source)
-        session.flush()
         return source
 
+    def add_sources(self, session: Session, sources: List[dict]):
+        """Insert many sources (add_source() keyword arguments) with one executemany INSERT"""
+        if sources:
+            session.execute(insert(Source), sources)
+
     # ===== LLM USAGE TRACKING =====
 
+    def _llm_usage_upsert(self):
+        """
+        INSERT ... ON CONFLICT (provider_name, model_name, date) DO UPDATE that adds one usage
+        delta to the day's counters atomically; latency aggregates are merged in SQL.
+        """
+        usage = LLMUsage.__table__
+        if self.engine.dialect.name == 'postgresql':
+            stmt = pg_insert(usage)
+        else:
+            stmt = sqlite_insert(usage)
+        new = stmt.excluded
+
+        return stmt.on_conflict_do_update(
+            index_elements=['provider_name', 'model_name', 'date'],
+            set_={
+                'total_calls': usage.c.total_calls + new.total_calls,
+                'successful_calls': usage.c.successful_calls + new.successful_calls,
+                'failed_calls': usage.c.failed_calls + new.failed_calls,
+                'rate_limited_calls': usage.c.rate_limited_calls + new.rate_limited_calls,
+                'total_input_tokens': usage.c.total_input_tokens + new.total_input_tokens,
+                'total_output_tokens': usage.c.total_output_tokens + new.total_output_tokens,
+                # Running average weighted by the calls each side's average covers
+                'latency_calls': usage.c.latency_calls + new.latency_calls,
+                'average_latency_ms': case(
+                    (new.average_latency_ms.is_(None), usage.c.average_latency_ms),
+                    (usage.c.average_latency_ms.is_(None), new.average_latency_ms),
+                    else_=(usage.c.average_latency_ms * usage.c.latency_calls
+                           + new.average_latency_ms * new.latency_calls)
+                    / func.nullif(usage.c.latency_calls + new.latency_calls, 0),
+                ),
+                'min_latency_ms': case(
+                    (or_(usage.c.min_latency_ms.is_(None), new.min_latency_ms < usage.c.min_latency_ms),
+                     new.min_latency_ms),
+                    else_=usage.c.min_latency_ms,
+                ),
+                'max_latency_ms': case(
+                    (or_(usage.c.max_latency_ms.is_(None), new.max_latency_ms > usage.c.max_latency_ms),
+                     new.max_latency_ms),
+                    else_=usage.c.max_latency_ms,
+                ),
+                'updated_at': func.now(),
+            }
+        )
+
     def log_llm_usage(self, provider_name: str, model_name: str, success: bool,
                       rate_limited: bool = False, latency_ms: Optional[float] = None,
                       input_tokens: int = 0, output_tokens: int = 0):
-        """Log LLM API usage"""
-        with self.session_scope() as session:
-            today = datetime.utcnow().strftime('%Y-%m-%d')
-
-            # Get or create usage record for today
-            usage = session.query(LLMUsage).filter_by(
-                provider_name=provider_name,
-                model_name=model_name,
-                date=today
-            ).first()
-
-            if not usage:
-                usage = LLMUsage(
-                    provider_name=provider_name,
-                    model_name=model_name,
-                    date=today
-                )
-                # Explicitly initialize integer fields to 0
-                # SQLAlchemy Column(default=0) doesn't apply to Python objects immediately
-                usage.total_calls = 0
-                usage.successful_calls = 0
-                usage.failed_calls = 0
-                usage.rate_limited_calls = 0
-                usage.total_input_tokens = 0
-                usage.total_output_tokens = 0
-                session.add(usage)
-
-            # Update metrics
-            usage.total_calls += 1
+        """
+        Log LLM API usage. Calls are aggregated in memory and written by flush_llm_usage()
+        every LLM_USAGE_FLUSH_EVENTS calls or LLM_USAGE_FLUSH_SECONDS seconds.
+        """
+        key = (provider_name, model_name, datetime.now(timezone.utc).date())
+
+        with self._usage_lock:
+            usage = self._usage_buffer.get(key)
+            if usage is None:
+                usage = self._usage_buffer[key] = {
+                    'total_calls': 0, 'successful_calls': 0, 'failed_calls': 0, 'rate_limited_calls': 0,
+                    'total_input_tokens': 0, 'total_output_tokens': 0,
+                    'latency_sum': 0.0, 'latency_calls': 0, 'min_latency_ms': None, 'max_latency_ms': None,
+                }
+
+            usage['total_calls'] += 1
             if success:
-                usage.successful_calls += 1
+                usage['successful_calls'] += 1
             else:
-                usage.failed_calls += 1
-
+                usage['failed_calls'] += 1
             if rate_limited:
-                usage.rate_limited_calls += 1
+                usage['rate_limited_calls'] += 1
+            usage['total_input_tokens'] += input_tokens
+            usage['total_output_tokens'] += output_tokens
 
-            usage.total_input_tokens += input_tokens
-            usage.total_output_tokens += output_tokens
-
-            # Update latency
             if latency_ms is not None:
-                if usage.average_latency_ms is None:
-                    usage.average_latency_ms = latency_ms
-                else:
-                    # Running average
-                    total_latency = usage.average_latency_ms * (usage.total_calls - 1) + latency_ms
-                    usage.average_latency_ms = total_latency / usage.total_calls
+                usage['latency_sum'] += latency_ms
+                usage['latency_calls'] += 1
+                if usage['min_latency_ms'] is None or latency_ms < usage['min_latency_ms']:
+                    usage['min_latency_ms'] = latency_ms
+                if usage['max_latency_ms'] is None or latency_ms > usage['max_latency_ms']:
+                    usage['max_latency_ms'] = latency_ms
+
+            self._usage_events += 1
+            flush_due = (self._usage_events >= LLM_USAGE_FLUSH_EVENTS
+                         or time.monotonic() - self._usage_last_flush >= LLM_USAGE_FLUSH_SECONDS)
+
+        if flush_due:
+            self.flush_llm_usage()
+
+    @staticmethod
+    def _merge_usage(usage: dict, other: dict):
+        """Add the buffered usage deltas in other to usage"""
+        for name, value in other.items():
+            if name == 'min_latency_ms':
+                if value is not None and (usage[name] is None or value < usage[name]):
+                    usage[name] = value
+            elif name == 'max_latency_ms':
+                if value is not None and (usage[name] is None or value > usage[name]):
+                    usage[name] = value
+            else:
+                usage[name] += value
+
+    def flush_llm_usage(self):
+        """
+        Write buffered LLM usage with one executemany upsert (one row per provider/model/day).
+        If the write fails the deltas go back into the buffer for the next flush.
+        """
+        with self._usage_lock:
+            buffer = self._usage_buffer
+            self._usage_buffer = {}
+            self._usage_events = 0
+            self._usage_last_flush = time.monotonic()
+
+        if not buffer:
+            return
+
+        rows = []
+        for (provider_name, model_name, date), usage in buffer.items():
+            row = dict(usage, provider_name=provider_name, model_name=model_name, date=date)
+            latency_sum = row.pop('latency_sum')
+            row['average_latency_ms'] = latency_sum / usage['latency_calls'] if usage['latency_calls'] else None
+            rows.append(row)
 
-                usage.min_latency_ms = min(usage.min_latency_ms or float('inf'), latency_ms)
-                usage.max_latency_ms = max(usage.max_latency_ms or 0, latency_ms)
+        try:
+            with self.session_scope() as session:
+                session.execute(self._llm_usage_upsert(), rows)
+        except Exception as e:
+            logger.warning(f"⚠️ Failed to write LLM usage for {len(rows)} provider/model(s), "
+                           f"will retry on the next flush: {str(e)}")
+            with self._usage_lock:
+                for key, usage in buffer.items():
+                    pending = self._usage_buffer.get(key)
+                    if pending is None:
+                        self._usage_buffer[key] = usage
+                    else:
+                        self._merge_usage(pending, usage)
 
     def get_llm_usage_stats(self, provider_name: Optional[str] = None) -> List[LLMUsage]:
         """Get LLM usage statistics"""
+        self.flush_llm_usage()
         with self.session_scope() as session:
             query = session.query(LLMUsage)
             if provider_name:
                 query = query.filter_by(provider_name=provider_name)
-            return query.order_by(LLMUsage.date.desc()).all()
+            usage = query.order_by(LLMUsage.date.desc()).all()
+            session.expunge_all()
+            return usage
 
     # ===== STATISTICS =====
 
     def get_statistics(self) -> Dict:
         """Get comprehensive database statistics"""
         with self.session_scope() as session:
+            # Table counts and round aggregates in a single statement
+            companies, investors, sources, total_rounds, duplicates, total_amount = session.execute(
+                select(
+                    select(func.count(Company.id)).scalar_subquery(),
+                    select(func.count(Investor.id)).scalar_subquery(),
+                    select(func.count(Source.id)).scalar_subquery(),
+                    func.count(FundingRound.id),
+                    _count_where(FundingRound.is_duplicate),
+                    func.sum(case((~FundingRound.is_duplicate, FundingRound.amount_raised_usd))),
+                ).select_from(FundingRound)
+            ).one()
+
             stats = {
-                'companies': session.query(Company).count(),
-                'funding_rounds': session.query(FundingRound).filter_by(is_duplicate=False).count(),
-                'total_rounds_including_duplicates': session.query(FundingRound).count(),
-                'investors': session.query(Investor).count(),
-                'sources': session.query(Source).count(),
-                'duplicates_found': session.query(FundingRound).filter_by(is_duplicate=True).count(),
+                'companies': companies,
+                'funding_rounds': total_rounds - duplicates,
+                'total_rounds_including_duplicates': total_rounds,
+                'investors': investors,
+                'sources': sources,
+                'duplicates_found': duplicates,
             }
 
             # Rounds by source type
@@ -366,10 +883,6 @@ class DatabaseManager:
             stats['rounds_by_source'] = {source: count for source, count in source_counts}
 
             # Total amount raised
-            total_amount = session.query(
-                func.sum(FundingRound.amount_raised_usd)
-            ).filter_by(is_duplicate=False).scalar()
-
             stats['total_amount_raised_usd'] = float(total_amount) if total_amount else 0
 
             return stats
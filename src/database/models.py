@@ -3,17 +3,45 @@ SQLAlchemy Database Models for Funding Round Collection Engine V2
 Supports both SQLite (development) and PostgreSQL (production)
 """
 
-from datetime import datetime
+import os
+import re
+from dataclasses import dataclass
+from functools import lru_cache
 from typing import Optional
 
 from sqlalchemy import (
-    Boolean, Column, DateTime, Float, ForeignKey, Integer, JSON, String, Table, Text, create_engine
+    Boolean, Column, Date, DateTime, Float, ForeignKey, Index, Integer, JSON, String, Table, Text, case, create_engine,
+    event, false, func, inspect, select, text, update
 )
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.schema import CreateColumn
+from sqlalchemy.types import TypeDecorator
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship, sessionmaker
 
 Base = declarative_base()
 
+
+def json_type(none_as_null: bool = False):
+    """Generic JSON column type, stored as binary JSONB on PostgreSQL (matches migrations/001)"""
+    return JSON(none_as_null=none_as_null).with_variant(JSONB(none_as_null=none_as_null), 'postgresql')
+
+
+class TruncatedString(TypeDecorator):
+    """String column that truncates over-long values (with an ellipsis) when bound"""
+    impl = String
+    cache_ok = True
+
+    def __init__(self, length: int, ellipsis: str = '...'):
+        super().__init__(length)
+        self.ellipsis = ellipsis
+        self.keep = length - len(ellipsis)
+
+    def process_bind_param(self, value, dialect):
+        if value is None or len(value) <= self.impl.length:
+            return value
+        return value[:self.keep] + self.ellipsis
+
 # Many-to-many relationship table for rounds and investors
 round_investors = Table(
     'round_investors',
@@ -26,19 +54,34 @@ round_investors = Table(
 class Company(Base):
     """Company entity with SEC identifiers"""
     __tablename__ = 'companies'
+    __table_args__ = (
+        # Partial indexes for the Stage 2/3 pending scans: only unfinished rows are indexed
+        Index('ix_companies_stage2_pending', 'id',
+              postgresql_where=text('NOT stage2_sec_collected'),
+              sqlite_where=text('stage2_sec_collected = 0')),
+        Index('ix_companies_stage3_pending', 'id',
+              postgresql_where=text('NOT stage3_search_extracted'),
+              sqlite_where=text('stage3_search_extracted = 0')),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     name = Column(String(500), nullable=False, unique=True, index=True)
     cik = Column(String(20), nullable=True, index=True)
     official_name = Column(String(500), nullable=True)
 
+    # Stage 2/3 completion flags, denormalized from ProcessingStatus so the
+    # pending-company scans read one table (ProcessingStatus keeps the audit trail)
+    stage2_sec_collected = Column(Boolean, default=False, server_default=false(), nullable=False)
+    stage3_search_extracted = Column(Boolean, default=False, server_default=false(), nullable=False)
+
     # Relationships
     funding_rounds = relationship('FundingRound', back_populates='company', cascade='all, delete-orphan')
     processing_status = relationship('ProcessingStatus', back_populates='company', uselist=False, cascade='all, delete-orphan')
 
     # Metadata
-    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    created_at = Column(DateTime(timezone=True), default=func.now(), server_default=func.now(), nullable=False)
+    updated_at = Column(DateTime(timezone=True), default=func.now(), server_default=func.now(),
+                        onupdate=func.now(), nullable=False)
 
     def __repr__(self):
         return f"<Company(name='{self.name}', cik='{self.cik}')>"
@@ -67,11 +110,11 @@ class FundingRound(Base):
     # Data provenance
     source_type = Column(String(50), nullable=False)  # 'SEC_FORM_D' or 'WEB_SEARCH'
     confidence_score = Column(String(20), nullable=False)  # 'HIGH', 'MEDIUM', 'LOW'
-    source_urls = Column(JSON, nullable=True)  # List of source URLs
+    source_urls = Column(json_type(), nullable=True)  # List of source URLs
 
     # Additional metadata
     notes = Column(Text, nullable=True)
-    raw_data = Column(JSON, nullable=True)  # Store original extracted data
+    raw_data = Column(json_type(none_as_null=True), nullable=True)  # Extracted fields not stored in the columns above
 
     # Deduplication tracking
     is_duplicate = Column(Boolean, default=False, nullable=False)
@@ -82,8 +125,9 @@ class FundingRound(Base):
     sources = relationship('Source', back_populates='funding_round', cascade='all, delete-orphan')
 
     # Metadata
-    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    created_at = Column(DateTime(timezone=True), default=func.now(), server_default=func.now(), nullable=False)
+    updated_at = Column(DateTime(timezone=True), default=func.now(), server_default=func.now(),
+                        onupdate=func.now(), nullable=False)
 
     def __repr__(self):
         return f"<FundingRound(company='{self.company.name if self.company else 'Unknown'}', round='{self.round_name}', amount=${self.amount_raised_usd})>"
@@ -101,8 +145,9 @@ class Investor(Base):
     funding_rounds = relationship('FundingRound', secondary=round_investors, back_populates='investors')
 
     # Metadata
-    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    created_at = Column(DateTime(timezone=True), default=func.now(), server_default=func.now(), nullable=False)
+    updated_at = Column(DateTime(timezone=True), default=func.now(), server_default=func.now(),
+                        onupdate=func.now(), nullable=False)
 
     def __repr__(self):
         return f"<Investor(name='{self.name}')>"
@@ -118,7 +163,7 @@ class Source(Base):
     # Source details
     source_type = Column(String(50), nullable=False)  # 'SEC_FORM_D', 'TECHCRUNCH', 'CRUNCHBASE', etc.
     url = Column(String(2000), nullable=True)
-    title = Column(String(500), nullable=True)
+    title = Column(TruncatedString(500), nullable=True)
     snippet = Column(Text, nullable=True)
 
     # LLM extraction details
@@ -130,7 +175,7 @@ class Source(Base):
     funding_round = relationship('FundingRound', back_populates='sources')
 
     # Metadata
-    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    created_at = Column(DateTime(timezone=True), default=func.now(), server_default=func.now(), nullable=False)
 
     def __repr__(self):
         return f"<Source(type='{self.source_type}', url='{self.url[:50]}...')>"
@@ -139,24 +184,33 @@ class Source(Base):
 class ProcessingStatus(Base):
     """Track processing progress for each company (checkpointing)"""
     __tablename__ = 'processing_status'
+    __table_args__ = (
+        # Partial indexes for the Stage 1/4 pending lookups (Stage 2/3 flags live on companies)
+        Index('ix_processing_status_stage1_pending', 'company_id',
+              postgresql_where=text('NOT stage1_resolved'),
+              sqlite_where=text('stage1_resolved = 0')),
+        Index('ix_processing_status_stage4_pending', 'company_id',
+              postgresql_where=text('NOT stage4_merged'),
+              sqlite_where=text('stage4_merged = 0')),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     company_id = Column(Integer, ForeignKey('companies.id'), nullable=False, unique=True, index=True)
 
     # Processing stages
     stage1_resolved = Column(Boolean, default=False, nullable=False)
-    stage1_completed_at = Column(DateTime, nullable=True)
+    stage1_completed_at = Column(DateTime(timezone=True), nullable=True)
 
     stage2_sec_collected = Column(Boolean, default=False, nullable=False)
-    stage2_completed_at = Column(DateTime, nullable=True)
+    stage2_completed_at = Column(DateTime(timezone=True), nullable=True)
     stage2_rounds_found = Column(Integer, default=0, nullable=False)
 
     stage3_search_extracted = Column(Boolean, default=False, nullable=False)
-    stage3_completed_at = Column(DateTime, nullable=True)
+    stage3_completed_at = Column(DateTime(timezone=True), nullable=True)
     stage3_rounds_found = Column(Integer, default=0, nullable=False)
 
     stage4_merged = Column(Boolean, default=False, nullable=False)
-    stage4_completed_at = Column(DateTime, nullable=True)
+    stage4_completed_at = Column(DateTime(timezone=True), nullable=True)
     stage4_unique_rounds = Column(Integer, default=0, nullable=False)
 
     # Error tracking
@@ -168,8 +222,9 @@ class ProcessingStatus(Base):
     company = relationship('Company', back_populates='processing_status')
 
     # Metadata
-    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    created_at = Column(DateTime(timezone=True), default=func.now(), server_default=func.now(), nullable=False)
+    updated_at = Column(DateTime(timezone=True), default=func.now(), server_default=func.now(),
+                        onupdate=func.now(), nullable=False)
 
     def __repr__(self):
         return f"<ProcessingStatus(company='{self.company.name if self.company else 'Unknown'}', stage1={self.stage1_resolved}, stage2={self.stage2_sec_collected}, stage3={self.stage3_search_extracted}, stage4={self.stage4_merged})>"
@@ -178,11 +233,15 @@ class ProcessingStatus(Base):
 class LLMUsage(Base):
     """Track LLM API usage and costs"""
     __tablename__ = 'llm_usage'
+    __table_args__ = (
+        # One row per provider/model/day; target of the log_llm_usage() upsert
+        Index('ux_llm_usage_provider_model_date', 'provider_name', 'model_name', 'date', unique=True),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
 
     # Provider details
-    provider_name = Column(String(50), nullable=False, index=True)
+    provider_name = Column(String(50), nullable=False)  # Leading column of ux_llm_usage_provider_model_date
     model_name = Column(String(100), nullable=False)
 
     # Usage metrics
@@ -196,69 +255,99 @@ class LLMUsage(Base):
     total_output_tokens = Column(Integer, default=0, nullable=False)
 
     # Performance metrics
+    latency_calls = Column(Integer, default=0, server_default=text('0'), nullable=False)  # Calls averaged below
     average_latency_ms = Column(Float, nullable=True)
     min_latency_ms = Column(Float, nullable=True)
     max_latency_ms = Column(Float, nullable=True)
 
     # Date tracking
-    date = Column(String(10), nullable=False, index=True)  # YYYY-MM-DD format
+    date = Column(Date, nullable=False, index=True)  # UTC day
 
     # Metadata
-    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    created_at = Column(DateTime(timezone=True), default=func.now(), server_default=func.now(), nullable=False)
+    updated_at = Column(DateTime(timezone=True), default=func.now(), server_default=func.now(),
+                        onupdate=func.now(), nullable=False)
 
     def __repr__(self):
         return f"<LLMUsage(provider='{self.provider_name}', calls={self.total_calls}, date='{self.date}')>"
 
 
-# Database connection helper
-def create_db_engine(db_config: dict):
-    """Create SQLAlchemy engine from configuration with automatic fallback"""
-    import os
-    import re
-    import logging
+@dataclass
+class CompanyRef:
+    """Lightweight, session-independent handle to a company (no ORM load needed)"""
+    __slots__ = ('id', 'name', 'cik')
 
-    logger = logging.getLogger(__name__)
+    id: int
+    name: str
+    cik: Optional[str]
 
-    def resolve_env_vars(value):
-        """Resolve ${VAR_NAME} patterns in strings"""
-        if not isinstance(value, str):
-            return value
 
-        # Pattern to match ${VAR_NAME}
-        pattern = r'\$\{([^}]+)\}'
+# Compiled-statement cache entries per engine (SQLAlchemy default is 500)
+QUERY_CACHE_SIZE = 1200
+
+
+# Pattern to match ${VAR_NAME}
+_ENV_PATTERN = re.compile(r'\$\{([^}]+)\}')
+
+
+def _replace_env_var(match):
+    """Environment value for a ${VAR_NAME} match (keep original if not found)"""
+    return os.getenv(match.group(1), match.group(0))
+
 
-        def replacer(match):
-            var_name = match.group(1)
-            return os.getenv(var_name, match.group(0))  # Keep original if not found
+@lru_cache(maxsize=64)
+def _resolve_env_string(value: str) -> str:
+    return _ENV_PATTERN.sub(_replace_env_var, value)
 
-        return re.sub(pattern, replacer, value)
+
+def resolve_env_vars(value):
+    """Resolve ${VAR_NAME} patterns in strings (memoized; non-strings pass through)"""
+    if not isinstance(value, str):
+        return value
+    return _resolve_env_string(value)
+
+
+# Database connection helper
+def create_db_engine(db_config: dict, pool_size: Optional[int] = None):
+    """
+    Create SQLAlchemy engine from configuration with automatic fallback.
+    pool_size sizes the PostgreSQL connection pool (postgresql.pool_size wins if set).
+    """
+    import logging
+
+    logger = logging.getLogger(__name__)
 
     db_type = db_config.get('type', 'sqlite')
     auto_fallback = db_config.get('auto_fallback', False)
 
     # Try PostgreSQL first if configured
     if db_type == 'postgresql':
-        pg_config = db_config.get('postgresql', {})
+        # Resolve ${VAR} references in every field up front
+        pg_config = {key: resolve_env_vars(value) for key, value in db_config.get('postgresql', {}).items()}
 
         # Check if raw connection string is provided
         connection_string = pg_config.get('connection_string')
 
-        if connection_string:
-            # Resolve environment variables in connection string
-            connection_string = resolve_env_vars(connection_string)
-        else:
+        if not connection_string:
             # Build from individual fields
-            host = resolve_env_vars(pg_config.get('host', 'localhost'))
+            host = pg_config.get('host', 'localhost')
             port = pg_config.get('port', 5432)
-            database = resolve_env_vars(pg_config.get('database', 'funding_rounds'))
-            user = resolve_env_vars(pg_config.get('user', 'postgres'))
-            password = resolve_env_vars(pg_config.get('password', ''))
+            database = pg_config.get('database', 'funding_rounds')
+            user = pg_config.get('user', 'postgres')
+            password = pg_config.get('password', '')
             connection_string = f'postgresql://{user}:{password}@{host}:{port}/{database}'
 
         # Try to create PostgreSQL engine
         try:
-            engine = create_engine(connection_string, echo=False)
+            engine = create_engine(
+                connection_string,
+                echo=False,
+                query_cache_size=QUERY_CACHE_SIZE,
+                pool_size=pg_config.get('pool_size', pool_size or 10),
+                max_overflow=pg_config.get('max_overflow', 10),
+                pool_pre_ping=True,  # Drop connections the server closed during long stages
+                pool_recycle=pg_config.get('pool_recycle', 1800)
+            )
             # Test the connection
             with engine.connect() as conn:
                 pass
@@ -285,19 +374,158 @@ def create_db_engine(db_config: dict):
         # Create parent directory if needed
         os.makedirs(os.path.dirname(db_path), exist_ok=True)
         connection_string = f'sqlite:///{db_path}'
-        engine = create_engine(connection_string, echo=False)
+        engine = create_engine(connection_string, echo=False, query_cache_size=QUERY_CACHE_SIZE)
+
+        # WAL lets readers run alongside the writer, so parallel stage workers
+        # don't stall on "database is locked"; NORMAL is durable enough under WAL.
+        # busy_timeout makes a blocked writer wait instead of failing, and a 64 MB
+        # page cache with in-memory temp tables keeps the small-query traffic off disk
+        @event.listens_for(engine, 'connect')
+        def set_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            cursor.execute('PRAGMA journal_mode=WAL')
+            cursor.execute('PRAGMA synchronous=NORMAL')
+            cursor.execute('PRAGMA busy_timeout=5000')
+            cursor.execute('PRAGMA cache_size=-65536')
+            cursor.execute('PRAGMA temp_store=MEMORY')
+            cursor.execute('PRAGMA foreign_keys=ON')
+            cursor.close()
+
         logger.info(f"✓ Using SQLite database: {db_path}")
         return engine
 
     raise ValueError(f"Unsupported database type: {db_type}")
 
 
+# Company columns mirrored from ProcessingStatus
+COMPANY_STAGE_FLAGS = ('stage2_sec_collected', 'stage3_search_extracted')
+
+
+def add_company_stage_flags(engine):
+    """Add and backfill the denormalized Company stage flags on databases created before they existed"""
+    existing = {column['name'] for column in inspect(engine).get_columns(Company.__tablename__)}
+    missing = [name for name in COMPANY_STAGE_FLAGS if name not in existing]
+    if not missing:
+        return
+
+    with engine.begin() as conn:
+        for name in missing:
+            column_ddl = CreateColumn(Company.__table__.c[name]).compile(dialect=engine.dialect)
+            conn.execute(text(f'ALTER TABLE {Company.__tablename__} ADD COLUMN {column_ddl}'))
+
+            status_flag = (
+                select(ProcessingStatus.__table__.c[name])
+                .where(ProcessingStatus.__table__.c.company_id == Company.__table__.c.id)
+                .scalar_subquery()
+            )
+            conn.execute(update(Company.__table__).values({name: func.coalesce(status_flag, false())}))
+
+
+def convert_llm_usage_date(engine):
+    """
+    Convert llm_usage.date to DATE on PostgreSQL databases created when it held 'YYYY-MM-DD' strings
+    (SQLite stores both the same way)
+    """
+    if engine.dialect.name != 'postgresql':
+        return
+
+    columns = {column['name']: column for column in inspect(engine).get_columns(LLMUsage.__tablename__)}
+    if isinstance(columns['date']['type'], Date):
+        return
+
+    with engine.begin() as conn:
+        conn.execute(text(f'ALTER TABLE {LLMUsage.__tablename__} ALTER COLUMN date TYPE DATE USING date::date'))
+
+
+LLM_USAGE_COUNTERS = (
+    'total_calls', 'successful_calls', 'failed_calls', 'rate_limited_calls',
+    'total_input_tokens', 'total_output_tokens', 'latency_calls',
+)
+
+
+def add_llm_usage_latency_calls(engine):
+    """
+    Add llm_usage.latency_calls (the weight of average_latency_ms) on databases created before it existed.
+    Existing averages are assumed to cover every call of their row.
+    """
+    existing = {column['name'] for column in inspect(engine).get_columns(LLMUsage.__tablename__)}
+    if 'latency_calls' in existing:
+        return
+
+    usage = LLMUsage.__table__
+    with engine.begin() as conn:
+        column_ddl = CreateColumn(usage.c.latency_calls).compile(dialect=engine.dialect)
+        conn.execute(text(f'ALTER TABLE {LLMUsage.__tablename__} ADD COLUMN {column_ddl}'))
+        conn.execute(
+            update(usage).where(usage.c.average_latency_ms.isnot(None)).values(latency_calls=usage.c.total_calls)
+        )
+
+
+def merge_duplicate_llm_usage(engine):
+    """
+    Fold duplicate provider/model/day llm_usage rows into the oldest one so the unique
+    ux_llm_usage_provider_model_date index can be built (the old SELECT-then-INSERT logger could race).
+    Counters are summed, min/max latency kept, and the average latency is weighted by latency_calls.
+    """
+    indexes = {index['name'] for index in inspect(engine).get_indexes(LLMUsage.__tablename__)}
+    if 'ux_llm_usage_provider_model_date' in indexes:
+        return
+
+    usage = LLMUsage.__table__
+    dup = usage.alias('dup')
+    same_key = (
+        (dup.c.provider_name == usage.c.provider_name)
+        & (dup.c.model_name == usage.c.model_name)
+        & (dup.c.date == usage.c.date)
+    )
+
+    def merged(expression):
+        return select(expression).where(same_key).scalar_subquery()
+
+    keepers = (
+        select(func.min(usage.c.id))
+        .group_by(usage.c.provider_name, usage.c.model_name, usage.c.date)
+    )
+    duplicated_keepers = keepers.having(func.count() > 1)
+
+    weighted_calls = func.sum(case((dup.c.average_latency_ms.isnot(None), dup.c.latency_calls)))
+    values = {name: merged(func.sum(dup.c[name])) for name in LLM_USAGE_COUNTERS}
+    values.update(
+        min_latency_ms=merged(func.min(dup.c.min_latency_ms)),
+        max_latency_ms=merged(func.max(dup.c.max_latency_ms)),
+        average_latency_ms=merged(
+            func.sum(dup.c.average_latency_ms * dup.c.latency_calls) / func.nullif(weighted_calls, 0)
+        ),
+    )
+
+    with engine.begin() as conn:
+        if conn.execute(update(usage).where(usage.c.id.in_(duplicated_keepers)).values(values)).rowcount:
+            conn.execute(usage.delete().where(usage.c.id.notin_(keepers)))
+
+
 def init_database(engine):
     """Initialize database schema"""
     Base.metadata.create_all(engine)
+    add_company_stage_flags(engine)
+    convert_llm_usage_date(engine)
+    add_llm_usage_latency_calls(engine)
+    merge_duplicate_llm_usage(engine)
+
+    # create_all() skips tables that already exist, so add any newer indexes
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+
+
+def create_session_factory(engine):
+    """
+    Create a session factory (build once, reuse for every session).
+    Objects stay loaded after commit, so results returned from a closed session remain readable.
+    """
+    return sessionmaker(bind=engine, expire_on_commit=False)
 
 
 def get_session(engine):
     """Create a new database session"""
-    Session = sessionmaker(bind=engine)
+    Session = create_session_factory(engine)
     return Session()
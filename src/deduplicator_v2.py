@@ -4,13 +4,74 @@ Identifies and marks duplicate rounds using smart matching
 """
 
 import logging
+from bisect import bisect_right
 from datetime import datetime, timedelta
-from typing import List, Optional
+from difflib import SequenceMatcher
+from functools import lru_cache
+from typing import Iterator, List, Optional
 
-from .database.models import FundingRound
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
+
+from .database.models import Company, FundingRound
 
 logger = logging.getLogger(__name__)
 
+# Date formats tried in order by parse_date()
+DATE_FORMATS = ('%Y-%m-%d', '%Y-%m', '%Y', '%m/%d/%Y', '%d/%m/%Y')
+
+# Distinct date strings / round names remembered by parse_date() and round_names_match()
+PARSE_CACHE_SIZE = 4096
+
+# Round names sharing one of these substrings match
+SERIES_KEYWORDS = ('seed', 'series a', 'series b', 'series c', 'series d',
+                   'series e', 'series f', 'series g', 'series h')
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _parse_date(date_str: str) -> Optional[datetime]:
+    """Parse a date string, trying the format its shape suggests before the full list"""
+    try:
+        if len(date_str) == 10 and date_str[4] == '-' and date_str[7] == '-':
+            return datetime.fromisoformat(date_str)
+        if len(date_str) == 7 and date_str[4] == '-':
+            return datetime.strptime(date_str, '%Y-%m')
+        if len(date_str) == 4:
+            return datetime.strptime(date_str, '%Y')
+    except ValueError:
+        pass
+
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(date_str, fmt)
+        except (ValueError, TypeError):
+            continue
+
+    return None
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _round_name_key(name: str) -> tuple:
+    """
+    (normalized name, frozenset of series keywords it contains, sorted distinct tokens),
+    computed once per distinct name
+    """
+    name_norm = name.lower().strip()
+    series = frozenset(keyword for keyword in SERIES_KEYWORDS if keyword in name_norm)
+    return name_norm, series, ' '.join(sorted(set(name_norm.split())))
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _tokens_similar(tokens1: str, tokens2: str, threshold: float) -> bool:
+    """Token-set similarity (difflib ratio of the sorted tokens) >= threshold; cheap upper bounds first"""
+    # Length bound (difflib's real_quick_ratio) without building the matcher's index
+    total_length = len(tokens1) + len(tokens2)
+    if not total_length or 2.0 * min(len(tokens1), len(tokens2)) / total_length < threshold:
+        return total_length == 0
+
+    matcher = SequenceMatcher(None, tokens1, tokens2, autojunk=False)
+    return matcher.quick_ratio() >= threshold and matcher.ratio() >= threshold
+
 
 class DeduplicatorV2:
     """Deduplicate funding rounds in the database"""
@@ -23,34 +84,21 @@ class DeduplicatorV2:
         dedup_config = config.get('deduplication', {})
         self.date_proximity_days = dedup_config.get('date_proximity_days', 90)
         self.amount_similarity_threshold = dedup_config.get('amount_similarity_threshold', 0.10)
-        self.enable_fuzzy_matching = dedup_config.get('enable_fuzzy_matching', True)
+        self.enable_fuzzy_matching = dedup_config.get('enable_fuzzy_matching', False)
+        self.fuzzy_match_threshold = dedup_config.get('fuzzy_match_threshold', 0.85)
+        self.exact_match_prefilter = dedup_config.get('exact_match_prefilter', True)
 
         logger.info(f"✓ Deduplicator initialized")
         logger.info(f"  Date proximity: {self.date_proximity_days} days")
         logger.info(f"  Amount similarity threshold: {self.amount_similarity_threshold * 100}%")
-        logger.info(f"  Fuzzy matching: {self.enable_fuzzy_matching}")
+        logger.info(f"  Fuzzy matching: {self.enable_fuzzy_matching} (threshold {self.fuzzy_match_threshold})")
+        logger.info(f"  Exact-match prefilter: {self.exact_match_prefilter}")
 
     def parse_date(self, date_str: Optional[str]) -> Optional[datetime]:
         """Parse date string to datetime object"""
         if not date_str:
             return None
-
-        # Try different date formats
-        formats = [
-            '%Y-%m-%d',
-            '%Y-%m',
-            '%Y',
-            '%m/%d/%Y',
-            '%d/%m/%Y',
-        ]
-
-        for fmt in formats:
-            try:
-                return datetime.strptime(date_str, fmt)
-            except (ValueError, TypeError):
-                continue
-
-        return None
+        return _parse_date(date_str)
 
     def dates_are_close(self, date1: Optional[str], date2: Optional[str]) -> bool:
         """Check if two dates are within proximity threshold"""
@@ -78,27 +126,25 @@ class DeduplicatorV2:
         return diff_percent <= self.amount_similarity_threshold
 
     def round_names_match(self, name1: Optional[str], name2: Optional[str]) -> bool:
-        """Check if round names match"""
+        """
+        Check if round names match: same normalized name, a series keyword in both,
+        or (with fuzzy matching) similar enough tokens
+        """
         if not name1 or not name2:
             return False
 
-        # Normalize round names
-        name1_norm = name1.lower().strip()
-        name2_norm = name2.lower().strip()
+        name1_norm, name1_series, name1_tokens = _round_name_key(name1)
+        name2_norm, name2_series, name2_tokens = _round_name_key(name2)
 
-        # Exact match
-        if name1_norm == name2_norm:
+        # Exact match, or the two names share a series keyword
+        if name1_norm == name2_norm or not name1_series.isdisjoint(name2_series):
             return True
 
-        # Extract series letter/number
-        series_keywords = ['seed', 'series a', 'series b', 'series c', 'series d',
-                          'series e', 'series f', 'series g', 'series h']
-
-        for keyword in series_keywords:
-            if keyword in name1_norm and keyword in name2_norm:
-                return True
+        # Names of different series (e.g. Series A vs Series B) are never fuzzy matches
+        if not self.enable_fuzzy_matching or (name1_series and name2_series):
+            return False
 
-        return False
+        return _tokens_similar(name1_tokens, name2_tokens, self.fuzzy_match_threshold)
 
     def are_duplicates(self, round1: FundingRound, round2: FundingRound) -> bool:
         """
@@ -112,96 +158,171 @@ class DeduplicatorV2:
         if round1.company_id != round2.company_id:
             return False
 
-        # Check date proximity
-        dates_close = self.dates_are_close(round1.date, round2.date)
+        return self._are_duplicates_parsed(self.match_key(round1), self.match_key(round2))
+
+    def day_number(self, date_str: Optional[str]) -> Optional[int]:
+        """Parsed date as a proleptic Gregorian day number (None if unparseable)"""
+        dt = self.parse_date(date_str)
+        return dt.toordinal() if dt else None
+
+    def match_key(self, funding_round: FundingRound) -> tuple:
+        """(day number, amount, round name) - the fields are_duplicates() compares, read once per round"""
+        return (self.day_number(funding_round.date), funding_round.amount_raised_usd, funding_round.round_name)
+
+    def _are_duplicates_parsed(self, key1: tuple, key2: tuple) -> bool:
+        """are_duplicates() for rounds of the same company, given their match_key()s"""
+        day1, amount1, name1 = key1
+        day2, amount2, name2 = key2
 
-        if not dates_close:
+        # Check date proximity
+        if day1 is None or day2 is None or abs(day1 - day2) > self.date_proximity_days:
             return False
 
-        # Check amount similarity or round name match
-        amounts_similar = self.amounts_are_similar(round1.amount_raised_usd, round2.amount_raised_usd)
-        names_match = self.round_names_match(round1.round_name, round2.round_name)
+        # Check amount similarity (two floats) before the round name match (lookups, maybe fuzzy)
+        return self.amounts_are_similar(amount1, amount2) or self.round_names_match(name1, name2)
 
-        return amounts_similar or names_match
+    def fingerprint(self, funding_round: FundingRound) -> Optional[tuple]:
+        """
+        Hashable exact-match key (date, round name, amount) for a round.
+        None if the round could never be a duplicate on these fields alone.
+        """
+        dt = self.parse_date(funding_round.date)
+        if not dt:
+            return None
 
-    def deduplicate_company(self, session, company) -> int:
+        name = funding_round.round_name.lower().strip() if funding_round.round_name else None
+        amount = funding_round.amount_raised_usd or None
+        if not name and not amount:
+            return None
+
+        return (dt, name, amount)
+
+    def candidate_pairs(self, rounds: List[FundingRound]) -> Iterator[tuple]:
+        """
+        Yield (round1, round2, key1, key2) for every pair whose dates are within the proximity window.
+        Each round's match_key() is built once; rounds are sorted by day and each one is only compared
+        with the rounds that follow it inside the window (found by bisection). Rounds without a
+        parseable date can never match and are skipped.
+        """
+        keyed = []
+        for funding_round in rounds:
+            key = self.match_key(funding_round)
+            if key[0] is not None:
+                keyed.append((key, funding_round))
+        keyed.sort(key=lambda item: item[0][0])
+        days = [key[0] for key, _ in keyed]
+
+        for i, (key1, round1) in enumerate(keyed):
+            end = bisect_right(days, days[i] + self.date_proximity_days, i + 1)
+            for j in range(i + 1, end):
+                key2, round2 = keyed[j]
+                yield round1, round2, key1, key2
+
+    @staticmethod
+    def keeper_rank(funding_round: FundingRound) -> tuple:
+        """
+        (is HIGH confidence, completeness, -id) - the higher rank is kept when two rounds are duplicates.
+        The id makes ties go to the older row whatever order the rounds are compared in.
+        """
+        completeness = (
+            bool(funding_round.amount_raised_usd)
+            + bool(funding_round.pre_money_valuation_usd)
+            + bool(funding_round.post_money_valuation_usd)
+            + bool(funding_round.lead_investor)
+        )
+        return (funding_round.confidence_score == 'HIGH', completeness, -funding_round.id)
+
+    def _pick_keeper(self, round1: FundingRound, round2: FundingRound, ranks: dict) -> tuple:
+        """
+        Return (keeper, duplicate): higher confidence wins, then more complete data, then the lower id.
+        ranks maps round id -> keeper_rank(), computed once per round.
+        """
+        if ranks[round1.id] >= ranks[round2.id]:
+            return round1, round2
+        return round2, round1
+
+    def _mark_duplicate(self, keeper: FundingRound, duplicate: FundingRound, marked: dict):
+        """Record duplicate as a duplicate of keeper in marked (duplicate id -> keeper id); written per company"""
+        marked[duplicate.id] = keeper.id
+        logger.debug(f"    Duplicate: {duplicate.round_name} ({duplicate.date}) -> kept {keeper.round_name} ({keeper.date})")
+
+    def remove_exact_duplicates(self, rounds: List[FundingRound], ranks: dict, marked: dict) -> tuple:
+        """
+        Collapse rounds with identical fingerprints in one hash pass.
+        Returns (remaining rounds, number of duplicates marked).
+        """
+        keepers = {}
+        remaining = []
+        duplicates_found = 0
+
+        for funding_round in rounds:
+            key = self.fingerprint(funding_round)
+            if key is None:
+                remaining.append(funding_round)
+                continue
+
+            existing = keepers.get(key)
+            if existing is None:
+                keepers[key] = funding_round
+                continue
+
+            keeper, duplicate = self._pick_keeper(existing, funding_round, ranks)
+            self._mark_duplicate(keeper, duplicate, marked)
+            keepers[key] = keeper
+            duplicates_found += 1
+
+        remaining.extend(keepers.values())
+        return remaining, duplicates_found
+
+    def deduplicate_company(self, session, company, rounds: Optional[List[FundingRound]] = None) -> int:
         """
         Deduplicate rounds for a single company.
+        rounds are the company's non-duplicate rounds if already loaded (queried otherwise).
         Returns number of duplicates found.
         """
         company_name = company.name
 
         # Check if already processed
-        status = self.db_manager.get_processing_status(session, company.id)
-        if status.stage4_merged:
+        status = company.processing_status
+        if status is not None and status.stage4_merged:
             logger.debug(f"[Stage 4] {company_name} already deduplicated, skipping")
             return 0
 
         logger.info(f"[Stage 4] Deduplicating {company_name}...")
 
         # Get all rounds for this company
-        rounds = session.query(FundingRound).filter_by(
-            company_id=company.id,
-            is_duplicate=False
-        ).all()
+        if rounds is None:
+            rounds = session.query(FundingRound).filter_by(
+                company_id=company.id,
+                is_duplicate=False
+            ).all()
 
         if len(rounds) <= 1:
             logger.info(f"  ○ {company_name} → {len(rounds)} rounds (no duplicates possible)")
             self.db_manager.update_stage4_status(session, company.id, unique_rounds=len(rounds))
             return 0
 
+        total_rounds = len(rounds)
         duplicates_found = 0
+        marked = {}
+        ranks = {funding_round.id: self.keeper_rank(funding_round) for funding_round in rounds}
+
+        # Exact duplicates are resolved by fingerprint before the pairwise pass
+        if self.exact_match_prefilter:
+            rounds, duplicates_found = self.remove_exact_duplicates(rounds, ranks, marked)
+
+        # Compare only pairs inside the date-proximity window
+        for round1, round2, key1, key2 in self.candidate_pairs(rounds):
+            if self._are_duplicates_parsed(key1, key2):
+                keeper, duplicate = self._pick_keeper(round1, round2, ranks)
+                self._mark_duplicate(keeper, duplicate, marked)
+                duplicates_found += 1
 
-        # Compare each pair of rounds
-        for i in range(len(rounds)):
-            for j in range(i + 1, len(rounds)):
-                round1 = rounds[i]
-                round2 = rounds[j]
-
-                if self.are_duplicates(round1, round2):
-                    # Keep the higher confidence one
-                    if round1.confidence_score == 'HIGH' and round2.confidence_score != 'HIGH':
-                        # Keep round1, mark round2 as duplicate
-                        self.db_manager.mark_as_duplicate(session, round2.id, round1.id)
-                        duplicates_found += 1
-                        logger.debug(f"    Duplicate: {round2.round_name} ({round2.date}) -> kept {round1.round_name} ({round1.date})")
-
-                    elif round2.confidence_score == 'HIGH' and round1.confidence_score != 'HIGH':
-                        # Keep round2, mark round1 as duplicate
-                        self.db_manager.mark_as_duplicate(session, round1.id, round2.id)
-                        duplicates_found += 1
-                        logger.debug(f"    Duplicate: {round1.round_name} ({round1.date}) -> kept {round2.round_name} ({round2.date})")
-
-                    else:
-                        # Same confidence, keep the one with more complete data
-                        round1_completeness = sum([
-                            bool(round1.amount_raised_usd),
-                            bool(round1.pre_money_valuation_usd),
-                            bool(round1.post_money_valuation_usd),
-                            bool(round1.lead_investor),
-                        ])
-
-                        round2_completeness = sum([
-                            bool(round2.amount_raised_usd),
-                            bool(round2.pre_money_valuation_usd),
-                            bool(round2.post_money_valuation_usd),
-                            bool(round2.lead_investor),
-                        ])
-
-                        if round1_completeness >= round2_completeness:
-                            self.db_manager.mark_as_duplicate(session, round2.id, round1.id)
-                            duplicates_found += 1
-                            logger.debug(f"    Duplicate: {round2.round_name} ({round2.date}) -> kept {round1.round_name} ({round1.date})")
-                        else:
-                            self.db_manager.mark_as_duplicate(session, round1.id, round2.id)
-                            duplicates_found += 1
-                            logger.debug(f"    Duplicate: {round1.round_name} ({round1.date}) -> kept {round2.round_name} ({round2.date})")
+        # One bulk UPDATE for every duplicate found in this company
+        self.db_manager.mark_as_duplicates(session, list(marked.items()))
 
         # Count unique rounds (non-duplicates)
-        unique_rounds = session.query(FundingRound).filter_by(
-            company_id=company.id,
-            is_duplicate=False
-        ).count()
+        unique_rounds = total_rounds - len(marked)
 
         # Mark stage as complete
         self.db_manager.update_stage4_status(session, company.id, unique_rounds=unique_rounds)
@@ -213,29 +334,36 @@ class DeduplicatorV2:
 
         return duplicates_found
 
-    def deduplicate_all(self, session) -> dict:
+    def deduplicate_shard(self, session, shard: int = 0, num_shards: int = 1) -> dict:
         """
-        Deduplicate all companies.
-        Returns statistics.
+        Deduplicate companies whose id falls in the given shard (company_id % num_shards).
+        Duplicates are only ever within a company, so shards can run independently.
+        Returns shard statistics.
         """
-        logger.info("=" * 80)
-        logger.info("STAGE 4: DEDUPLICATION")
-        logger.info("=" * 80)
-
-        companies = session.query(FundingRound.company_id).distinct().all()
+        # Companies with rounds, their status and non-duplicate rounds in three queries total
+        company_ids = select(FundingRound.company_id).where(FundingRound.company_id % num_shards == shard)
+        companies = session.query(Company).filter(Company.id.in_(company_ids)).options(
+            selectinload(Company.processing_status),
+            selectinload(Company.funding_rounds.and_(~FundingRound.is_duplicate)),
+        ).order_by(Company.id).all()
         total_companies = len(companies)
 
         total_duplicates = 0
 
-        for i, (company_id,) in enumerate(companies, 1):
-            company = session.query(FundingRound).filter_by(company_id=company_id).first().company
-            duplicates = self.deduplicate_company(session, company)
+        for i, company in enumerate(companies, 1):
+            duplicates = self.deduplicate_company(session, company, company.funding_rounds)
             total_duplicates += duplicates
 
             if i % 100 == 0:
                 logger.info(f"  Progress: {i}/{total_companies} companies ({i/total_companies*100:.1f}%)")
 
-        # Get final statistics
+        return {
+            'total_companies': total_companies,
+            'duplicates_removed': total_duplicates,
+        }
+
+    def summarize(self, session, total_companies: int, total_duplicates: int) -> dict:
+        """Compute and log final deduplication statistics"""
         total_rounds = session.query(FundingRound).count()
         unique_rounds = session.query(FundingRound).filter_by(is_duplicate=False).count()
 
@@ -256,3 +384,17 @@ class DeduplicatorV2:
         logger.info("")
 
         return stats
+
+    def deduplicate_all(self, session) -> dict:
+        """
+        Deduplicate all companies.
+        Returns statistics.
+        """
+        logger.info("=" * 80)
+        logger.info("STAGE 4: DEDUPLICATION")
+        logger.info("=" * 80)
+
+        shard_stats = self.deduplicate_shard(session)
+
+        # Get final statistics
+        return self.summarize(session, shard_stats['total_companies'], shard_stats['duplicates_removed'])
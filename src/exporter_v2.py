@@ -4,21 +4,56 @@ Export funding rounds from database to Excel, CSV, and JSON
 """
 
 import csv
+import itertools
 import json
 import logging
 import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import List
+from queue import Queue
+from typing import Iterable, Iterator, List, Optional
 
-import pandas as pd
-from openpyxl import load_workbook
-from openpyxl.styles import Font, PatternFill
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, PatternFill, Side
 from openpyxl.utils import get_column_letter
+from sqlalchemy import func, select
 
-from .database.models import FundingRound
+from .database.models import Company, FundingRound, Investor, round_investors
 
 logger = logging.getLogger(__name__)
 
+# Rounds fetched per batch while exporting
+EXPORT_BATCH_SIZE = 2000
+
+# Rows buffered per format writer while one database pass feeds them all
+EXPORT_QUEUE_SIZE = EXPORT_BATCH_SIZE
+
+# Queue markers: end of rows, or the database pass failed
+_END = object()
+_ABORT = object()
+
+
+def _iter_queue(rows: Queue) -> Iterator[dict]:
+    """Rows put on the queue, until the end (or abort) marker"""
+    while True:
+        row = rows.get()
+        if row is _END:
+            return
+        if row is _ABORT:
+            raise RuntimeError("Export aborted: reading funding rounds failed")
+        yield row
+
+
+def _write_from_queue(writer, rows: Queue):
+    """Run a format writer over queued rows; whatever it leaves unread is drained so the feeder never blocks"""
+    queued_rows = _iter_queue(rows)
+    try:
+        return writer(queued_rows)
+    finally:
+        for _ in queued_rows:
+            pass
+
 
 class ExporterV2:
     """Export funding rounds from database to various formats"""
@@ -49,138 +84,190 @@ class ExporterV2:
         Prepare funding rounds for export.
         Returns list of dicts with flattened data.
         """
-        # Get all non-duplicate rounds
-        rounds = session.query(FundingRound).filter_by(is_duplicate=False).all()
-
-        export_data = []
-
-        for round_obj in rounds:
-            # Flatten investor data
-            investor_names = [inv.name for inv in round_obj.investors] if round_obj.investors else []
-            all_investors_str = ', '.join(investor_names) if investor_names else ''
-
+        return list(self.iter_export_rows(session))
+
+    def iter_export_rows(self, session) -> Iterator[dict]:
+        """Stream flattened funding round dicts for export, one batch of rounds in memory at a time"""
+        # Get all non-duplicate rounds as plain rows; investor names are joined by the database
+        # (string_agg / group_concat), so no ORM objects or investor collections are built
+        query = (
+            select(
+                Company.name.label('company_name'),
+                Company.cik.label('company_cik'),
+                FundingRound.round_name,
+                FundingRound.date,
+                FundingRound.amount_raised_usd,
+                FundingRound.pre_money_valuation_usd,
+                FundingRound.post_money_valuation_usd,
+                FundingRound.lead_investor,
+                func.aggregate_strings(Investor.name, ', ').label('all_investors'),
+                FundingRound.source_type,
+                FundingRound.confidence_score,
+                FundingRound.source_urls,
+                FundingRound.notes,
+            )
+            .join(Company, FundingRound.company_id == Company.id)
+            .outerjoin(round_investors, round_investors.c.round_id == FundingRound.id)
+            .outerjoin(Investor, Investor.id == round_investors.c.investor_id)
+            .where(~FundingRound.is_duplicate)
+            .group_by(FundingRound.id, Company.id)
+            .order_by(FundingRound.id)
+            .execution_options(yield_per=EXPORT_BATCH_SIZE)
+        )
+
+        for round_row in session.execute(query):
             # Get source URLs
-            source_urls = round_obj.source_urls if round_obj.source_urls else []
+            source_urls = round_row.source_urls if round_row.source_urls else []
             source_urls_str = ', '.join(source_urls) if isinstance(source_urls, list) else str(source_urls)
 
             row = {
-                'Company Name': round_obj.company.name,
-                'Company CIK': round_obj.company.cik or '',
-                'Round Name': round_obj.round_name or '',
-                'Date': round_obj.date or '',
-                'Amount Raised (USD)': round_obj.amount_raised_usd,
-                'Pre-Money Valuation (USD)': round_obj.pre_money_valuation_usd,
-                'Post-Money Valuation (USD)': round_obj.post_money_valuation_usd,
-                'Lead Investor': round_obj.lead_investor or '',
-                'All Investors': all_investors_str,
-                'Source Type': round_obj.source_type,
-                'Confidence Score': round_obj.confidence_score,
+                'Company Name': round_row.company_name,
+                'Company CIK': round_row.company_cik or '',
+                'Round Name': round_row.round_name or '',
+                'Date': round_row.date or '',
+                'Amount Raised (USD)': round_row.amount_raised_usd,
+                'Pre-Money Valuation (USD)': round_row.pre_money_valuation_usd,
+                'Post-Money Valuation (USD)': round_row.post_money_valuation_usd,
+                'Lead Investor': round_row.lead_investor or '',
+                'All Investors': round_row.all_investors or '',
+                'Source Type': round_row.source_type,
+                'Confidence Score': round_row.confidence_score,
                 'Source URLs': source_urls_str,
-                'Notes': round_obj.notes or '',
+                'Notes': round_row.notes or '',
             }
 
-            export_data.append(row)
-
-        return export_data
+            yield row
 
     def export_to_excel(self, session) -> str:
         """Export to Excel with formatting"""
+        return self.write_excel(self.iter_export_rows(session))
+
+    def write_excel(self, rows: Iterable[dict]) -> Optional[str]:
+        """Write export rows to Excel with formatting"""
         logger.info("Exporting to Excel...")
 
-        data = self.prepare_export_data(session)
+        rows = iter(rows)
+        first_row = next(rows, None)
 
-        if not data:
+        if first_row is None:
             logger.warning("No data to export")
             return None
 
-        # Create DataFrame
-        df = pd.DataFrame(data)
-
         # Generate filename
         filename = self.get_filename('xlsx')
 
-        # Write to Excel
-        df.to_excel(filename, index=False, sheet_name='Funding Rounds')
-
-        # Apply formatting
-        wb = load_workbook(filename)
-        ws = wb.active
+        # Column widths go before the rows in a write-only sheet, so collect plain value lists
+        # first and size each column from the longest value (capped at 50)
+        headers = list(first_row.keys())
+        max_lengths = [len(header) for header in headers]
+        values = []
+        for row in itertools.chain((first_row,), rows):
+            row_values = list(row.values())
+            for i, value in enumerate(row_values):
+                if value is not None and len(str(value)) > max_lengths[i]:
+                    max_lengths[i] = len(str(value))
+            values.append(row_values)
+
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet('Funding Rounds')
+        for i, max_length in enumerate(max_lengths, 1):
+            ws.column_dimensions[get_column_letter(i)].width = min(max_length + 2, 50)
 
         # Header formatting
         header_fill = PatternFill(start_color='4472C4', end_color='4472C4', fill_type='solid')
         header_font = Font(bold=True, color='FFFFFF')
+        header_border = Border(*(Side(style='thin'),) * 4)
+        header_alignment = Alignment(horizontal='center', vertical='top')
 
-        for cell in ws[1]:
+        header_cells = []
+        for header in headers:
+            cell = WriteOnlyCell(ws, value=header)
             cell.fill = header_fill
             cell.font = header_font
+            cell.border = header_border
+            cell.alignment = header_alignment
+            header_cells.append(cell)
+        ws.append(header_cells)
 
-        # Auto-adjust column widths
-        for column in ws.columns:
-            max_length = 0
-            column_letter = get_column_letter(column[0].column)
-
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-
-            adjusted_width = min(max_length + 2, 50)  # Cap at 50
-            ws.column_dimensions[column_letter].width = adjusted_width
+        for row_values in values:
+            ws.append(row_values)
 
-        # Save
+        # Single streaming write
         wb.save(filename)
 
         logger.info(f"✓ Excel export complete: {filename}")
-        logger.info(f"  Rows: {len(data)}")
+        logger.info(f"  Rows: {len(values)}")
 
         return filename
 
     def export_to_csv(self, session) -> str:
         """Export to CSV"""
+        return self.write_csv(self.iter_export_rows(session))
+
+    def write_csv(self, rows: Iterable[dict]) -> Optional[str]:
+        """Write export rows to CSV"""
         logger.info("Exporting to CSV...")
 
-        data = self.prepare_export_data(session)
+        rows = iter(rows)
+        first_row = next(rows, None)
 
-        if not data:
+        if first_row is None:
             logger.warning("No data to export")
             return None
 
         # Generate filename
         filename = self.get_filename('csv')
 
-        # Write to CSV
+        # Write to CSV, row by row. Every row has the same keys in the same order, so the
+        # C csv.writer gets the values directly (DictWriter re-checks each row's keys in Python)
+        row_count = 0
         with open(filename, 'w', newline='', encoding='utf-8') as f:
-            if data:
-                writer = csv.DictWriter(f, fieldnames=data[0].keys())
-                writer.writeheader()
-                writer.writerows(data)
+            writer = csv.writer(f)
+            writer.writerow(first_row.keys())
+            for row_count, row in enumerate(itertools.chain((first_row,), rows), 1):
+                writer.writerow(row.values())
 
         logger.info(f"✓ CSV export complete: {filename}")
-        logger.info(f"  Rows: {len(data)}")
+        logger.info(f"  Rows: {row_count}")
 
         return filename
 
     def export_to_json(self, session) -> str:
         """Export to JSON"""
+        return self.write_json(self.iter_export_rows(session))
+
+    def write_json(self, rows: Iterable[dict]) -> Optional[str]:
+        """Write export rows to JSON"""
         logger.info("Exporting to JSON...")
 
-        data = self.prepare_export_data(session)
+        rows = iter(rows)
+        first_row = next(rows, None)
 
-        if not data:
+        if first_row is None:
             logger.warning("No data to export")
             return None
 
         # Generate filename
         filename = self.get_filename('json')
 
-        # Write to JSON
+        # Write the JSON array one element at a time (same layout as json.dump(..., indent=2)).
+        # Rows are flat dicts with the same keys, so the key prefixes are encoded once and each
+        # value goes through the C encoder (indent=... would use the pure-Python one)
+        encode = json.JSONEncoder(ensure_ascii=False).encode
+        key_prefixes = [f'\n    {encode(key)}: ' for key in first_row]
+
+        row_count = 0
         with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
+            f.write('[')
+            for row in itertools.chain((first_row,), rows):
+                f.write(',\n  {' if row_count else '\n  {')
+                f.write(','.join(prefix + encode(value) for prefix, value in zip(key_prefixes, row.values())))
+                f.write('\n  }')
+                row_count += 1
+            f.write('\n]')
 
         logger.info(f"✓ JSON export complete: {filename}")
-        logger.info(f"  Rows: {len(data)}")
+        logger.info(f"  Rows: {row_count}")
 
         return filename
 
@@ -192,16 +279,26 @@ class ExporterV2:
 
         formats = self.config.get('export', {}).get('formats', ['excel', 'csv', 'json'])
 
-        results = {}
-
-        if 'excel' in formats:
-            results['excel'] = self.export_to_excel(session)
+        writers = {'excel': self.write_excel, 'csv': self.write_csv, 'json': self.write_json}
+        selected = [fmt for fmt in writers if fmt in formats]
 
-        if 'csv' in formats:
-            results['csv'] = self.export_to_csv(session)
-
-        if 'json' in formats:
-            results['json'] = self.export_to_json(session)
+        # One streaming database pass feeds every format's writer (running in parallel)
+        # through a bounded queue, so only a few batches of rows are in memory at a time
+        results = {}
+        if selected:
+            queues = {fmt: Queue(maxsize=EXPORT_QUEUE_SIZE) for fmt in selected}
+            with ThreadPoolExecutor(max_workers=len(selected)) as executor:
+                futures = {fmt: executor.submit(_write_from_queue, writers[fmt], queues[fmt]) for fmt in selected}
+                end = _ABORT
+                try:
+                    for row in self.iter_export_rows(session):
+                        for rows in queues.values():
+                            rows.put(row)
+                    end = _END
+                finally:
+                    for rows in queues.values():
+                        rows.put(end)
+            results = {fmt: future.result() for fmt, future in futures.items()}
 
         logger.info("")
         logger.info("Export complete!")
@@ -7,15 +7,29 @@ import json
 import logging
 import os
 import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from threading import Lock
 from typing import Dict, List, Optional
 
 import requests
+from requests.adapters import HTTPAdapter
 from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential
 
 logger = logging.getLogger(__name__)
 
+# Keep-alive connections per provider (one per concurrent worker is enough)
+HTTP_POOL_SIZE = 32
+
+# Slots in LLMProvider._stats
+STAT_TOTAL_CALLS = 0
+STAT_SUCCESSFUL_CALLS = 1
+STAT_FAILED_CALLS = 2
+STAT_RATE_LIMITED_CALLS = 3
+STAT_LATENCY_SUM_US = 4
+STAT_COUNT = 5
+
 
 class RateLimitError(Exception):
     """Raised when a rate limit is hit"""
@@ -35,6 +49,7 @@ class LLMProvider:
         self.priority = config.get('priority', 999)
         self.rate_limit_rpm = config.get('rate_limit_rpm', 60)
         self.enabled = config.get('enabled', True)
+        self.json_mode = config.get('json_mode', False)  # Provider accepts a JSON-only output mode (opt-in)
 
         # Get API key from environment
         # Handle special cases for multiple accounts
@@ -47,17 +62,19 @@ class LLMProvider:
 
         self.api_key = os.getenv(api_key_env)
 
+        # Persistent HTTP session: TCP/TLS connections are reused across calls
+        self.http = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=HTTP_POOL_SIZE, max_retries=0)
+        self.http.mount('https://', adapter)
+        self.http.mount('http://', adapter)
+
         # Rate limiting
         self.calls_this_minute = 0
         self.last_minute_reset = time.time()
         self.lock = Lock()
 
-        # Statistics
-        self.total_calls = 0
-        self.successful_calls = 0
-        self.failed_calls = 0
-        self.rate_limited_calls = 0
-        self.total_latency_ms = 0
+        # Statistics (one int64 array, indexed by the STAT_* constants)
+        self._stats = array('q', [0] * STAT_COUNT)
 
     def can_make_request(self) -> bool:
         """Check if we can make a request without hitting rate limit"""
@@ -65,38 +82,59 @@ class LLMProvider:
             return False
 
         with self.lock:
-            current_time = time.time()
-
-            # Reset counter every minute
-            if current_time - self.last_minute_reset >= 60:
-                self.calls_this_minute = 0
-                self.last_minute_reset = current_time
-
+            self._reset_minute_window()
             return self.calls_this_minute < self.rate_limit_rpm
 
+    def _reset_minute_window(self):
+        """Reset the per-minute counter once a minute has passed (caller holds self.lock)"""
+        current_time = time.time()
+        if current_time - self.last_minute_reset >= 60:
+            self.calls_this_minute = 0
+            self.last_minute_reset = current_time
+
     def increment_call_count(self):
         """Increment call counter"""
         with self.lock:
             self.calls_this_minute += 1
-            self.total_calls += 1
+            self._stats[STAT_TOTAL_CALLS] += 1
+
+    def try_acquire_slot(self) -> bool:
+        """Check the rate limit and count the call in one lock acquisition; False if no slot is free"""
+        if not self.enabled or not self.api_key:
+            return False
+
+        with self.lock:
+            self._reset_minute_window()
+            if self.calls_this_minute >= self.rate_limit_rpm:
+                return False
+            self.calls_this_minute += 1
+            self._stats[STAT_TOTAL_CALLS] += 1
+            return True
 
-    def call_llm(self, prompt: str, max_tokens: int = 4000, temperature: float = 0.0) -> Optional[str]:
-        """Call the LLM provider"""
-        if not self.can_make_request():
+    def call_llm(self, prompt: str, max_tokens: int = 4000, temperature: float = 0.0,
+                 json_mode: bool = False) -> Optional[str]:
+        """Call the LLM provider (json_mode asks for a JSON object, if the provider supports it)"""
+        if not self.try_acquire_slot():
             raise RateLimitError(f"{self.name} rate limit exceeded ({self.rate_limit_rpm} RPM)")
 
-        self.increment_call_count()
         start_time = time.time()
 
         try:
-            if self.name == 'gemini':
-                response = self._call_gemini(prompt, max_tokens, temperature)
-            else:
-                response = self._call_openai_compatible(prompt, max_tokens, temperature)
+            json_mode = json_mode and self.json_mode
+            try:
+                response = self._call(prompt, max_tokens, temperature, json_mode)
+            except requests.HTTPError as e:
+                if not (json_mode and e.response is not None and e.response.status_code == 400):
+                    raise
+                # The provider/model rejects its JSON output mode: stop asking for it and retry once
+                logger.warning(f"⚠️  {self.name} rejected JSON mode (HTTP 400), retrying without it")
+                self.json_mode = False
+                response = self._call(prompt, max_tokens, temperature, False)
 
             latency_ms = (time.time() - start_time) * 1000
-            self.successful_calls += 1
-            self.total_latency_ms += latency_ms
+            with self.lock:
+                self._stats[STAT_SUCCESSFUL_CALLS] += 1
+                self._stats[STAT_LATENCY_SUM_US] += int(latency_ms * 1000)
 
             # Log to database if available
             if self.db_manager:
@@ -111,12 +149,14 @@ class LLMProvider:
             return response
 
         except RateLimitError:
-            self.rate_limited_calls += 1
+            with self.lock:
+                self._stats[STAT_RATE_LIMITED_CALLS] += 1
             raise
 
         except Exception as e:
             latency_ms = (time.time() - start_time) * 1000
-            self.failed_calls += 1
+            with self.lock:
+                self._stats[STAT_FAILED_CALLS] += 1
 
             # Log to database if available
             if self.db_manager:
@@ -130,7 +170,13 @@ class LLMProvider:
             logger.error(f"✗ {self.name} call failed: {str(e)}")
             raise
 
-    def _call_gemini(self, prompt: str, max_tokens: int, temperature: float) -> str:
+    def _call(self, prompt: str, max_tokens: int, temperature: float, json_mode: bool) -> str:
+        """Send one request in this provider's API format"""
+        if self.name == 'gemini':
+            return self._call_gemini(prompt, max_tokens, temperature, json_mode)
+        return self._call_openai_compatible(prompt, max_tokens, temperature, json_mode)
+
+    def _call_gemini(self, prompt: str, max_tokens: int, temperature: float, json_mode: bool = False) -> str:
         """Call Google Gemini API"""
         url = f"{self.endpoint}?key={self.api_key}"
 
@@ -145,18 +191,21 @@ class LLMProvider:
                 "maxOutputTokens": max_tokens
             }
         }
+        if json_mode:
+            payload["generationConfig"]["responseMimeType"] = "application/json"
 
-        response = requests.post(url, json=payload, timeout=30)
+        response = self.http.post(url, json=payload, timeout=30)
         response.raise_for_status()
 
-        data = response.json()
+        data = json.loads(response.content)
 
         if 'candidates' not in data or len(data['candidates']) == 0:
             raise ValueError("No response from Gemini")
 
         return data['candidates'][0]['content']['parts'][0]['text']
 
-    def _call_openai_compatible(self, prompt: str, max_tokens: int, temperature: float) -> str:
+    def _call_openai_compatible(self, prompt: str, max_tokens: int, temperature: float,
+                                json_mode: bool = False) -> str:
         """Call OpenAI-compatible APIs (Groq, Mistral, Fireworks, etc.)"""
         headers = {
             'Authorization': f'Bearer {self.api_key}',
@@ -171,24 +220,54 @@ class LLMProvider:
             'max_tokens': max_tokens,
             'temperature': temperature
         }
+        if json_mode:
+            payload['response_format'] = {'type': 'json_object'}
 
-        response = requests.post(self.endpoint, headers=headers, json=payload, timeout=30)
+        response = self.http.post(self.endpoint, headers=headers, json=payload, timeout=30)
         response.raise_for_status()
 
-        data = response.json()
+        data = json.loads(response.content)
         return data['choices'][0]['message']['content']
 
+    @property
+    def total_calls(self) -> int:
+        """Calls attempted (slots acquired)"""
+        return self._stats[STAT_TOTAL_CALLS]
+
+    @property
+    def successful_calls(self) -> int:
+        """Calls that returned a response"""
+        return self._stats[STAT_SUCCESSFUL_CALLS]
+
+    @property
+    def failed_calls(self) -> int:
+        """Calls that raised an error"""
+        return self._stats[STAT_FAILED_CALLS]
+
+    @property
+    def rate_limited_calls(self) -> int:
+        """Calls rejected by a provider rate limit"""
+        return self._stats[STAT_RATE_LIMITED_CALLS]
+
+    @property
+    def total_latency_ms(self) -> float:
+        """Summed latency of successful calls"""
+        return self._stats[STAT_LATENCY_SUM_US] / 1000
+
     def get_stats(self) -> Dict:
-        """Get provider statistics"""
-        avg_latency = self.total_latency_ms / self.successful_calls if self.successful_calls > 0 else 0
+        """Get provider statistics (one consistent snapshot of the counters)"""
+        with self.lock:
+            total_calls, successful_calls, failed_calls, rate_limited_calls, latency_sum_us = self._stats
+
+        avg_latency = latency_sum_us / 1000 / successful_calls if successful_calls > 0 else 0
 
         return {
             'name': self.name,
-            'total_calls': self.total_calls,
-            'successful_calls': self.successful_calls,
-            'failed_calls': self.failed_calls,
-            'rate_limited_calls': self.rate_limited_calls,
-            'success_rate': (self.successful_calls / self.total_calls * 100) if self.total_calls > 0 else 0,
+            'total_calls': total_calls,
+            'successful_calls': successful_calls,
+            'failed_calls': failed_calls,
+            'rate_limited_calls': rate_limited_calls,
+            'success_rate': (successful_calls / total_calls * 100) if total_calls > 0 else 0,
             'average_latency_ms': avg_latency,
             'enabled': self.enabled,
             'has_api_key': bool(self.api_key)
@@ -227,6 +306,9 @@ class LLMRouterV2:
             logger.info(f"✓ LLM Router initialized with {len(self.active_providers)} active providers")
             logger.info(f"✓ Rotation strategy: {self.rotation_strategy}")
 
+        # Priority order is fixed for the router's lifetime (stable for equal priorities)
+        self.providers_by_priority = sorted(self.active_providers, key=lambda p: p.priority)
+
         # Round-robin counter
         self.round_robin_index = 0
         self.round_robin_lock = Lock()
@@ -253,9 +335,7 @@ class LLMRouterV2:
 
     def _get_next_provider_priority(self) -> Optional[LLMProvider]:
         """Get next provider using priority strategy (lowest priority number first)"""
-        sorted_providers = sorted(self.active_providers, key=lambda p: p.priority)
-
-        for provider in sorted_providers:
+        for provider in self.providers_by_priority:
             if provider.can_make_request():
                 return provider
 
@@ -268,9 +348,8 @@ class LLMRouterV2:
         if not available_providers:
             return None
 
-        # Sort by usage (least used first)
-        sorted_providers = sorted(available_providers, key=lambda p: p.total_calls)
-        return sorted_providers[0]
+        # Least used first (first in list order on ties)
+        return min(available_providers, key=lambda p: p.total_calls)
 
     def get_next_provider(self) -> Optional[LLMProvider]:
         """Get next provider based on rotation strategy"""
@@ -290,8 +369,12 @@ class LLMRouterV2:
         retry=retry_if_exception_type((requests.exceptions.RequestException, RateLimitError)),
         reraise=True
     )
-    def generate(self, prompt: str, max_tokens: int = 4000, temperature: float = 0.0) -> Optional[str]:
-        """Generate response using best available provider"""
+    def generate(self, prompt: str, max_tokens: int = 4000, temperature: float = 0.0,
+                 json_mode: bool = False) -> Optional[str]:
+        """
+        Generate response using best available provider.
+        With json_mode the provider's JSON output mode is used (the prompt must ask for a JSON object).
+        """
         provider = self.get_next_provider()
 
         if not provider:
@@ -307,13 +390,34 @@ class LLMRouterV2:
         logger.debug(f"Using provider: {provider.name} ({self.rotation_strategy} strategy)")
 
         try:
-            return provider.call_llm(prompt, max_tokens, temperature)
+            return provider.call_llm(prompt, max_tokens, temperature, json_mode)
 
         except RateLimitError as e:
             logger.warning(f"Rate limit hit for {provider.name}, trying next provider...")
             # Retry will automatically try next provider
             raise
 
+    def generate_many(self, prompts: List[str], max_tokens: int = 4000,
+                      temperature: float = 0.0, json_mode: bool = False) -> List[Optional[str]]:
+        """
+        Generate responses for several prompts concurrently, spread across providers.
+        Results are in prompt order; a prompt whose generation fails gets None.
+        """
+        if not prompts:
+            return []
+
+        def generate_one(prompt: str) -> Optional[str]:
+            try:
+                return self.generate(prompt, max_tokens, temperature, json_mode)
+            except Exception as e:
+                logger.warning(f"⚠️ LLM generation failed for batched prompt: {str(e)}")
+                return None
+
+        # One in-flight call per active provider; per-provider RPM is still enforced by each call
+        max_workers = min(len(prompts), max(len(self.active_providers), 1))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(generate_one, prompts))
+
     def get_all_stats(self) -> Dict:
         """Get statistics for all providers"""
         return {
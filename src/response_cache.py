@@ -0,0 +1,105 @@
+"""
+Persistent HTTP response cache for Funding Round Collection Engine V2
+Keeps DuckDuckGo results and SEC documents in a small SQLite file so re-runs
+(resume, retry, --reset) don't refetch responses that are still fresh
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import time
+from threading import Lock
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Expired responses are deleted on open and after every N writes
+PURGE_INTERVAL_WRITES = 1000
+
+
+class ResponseCache:
+    """
+    SQLite key -> body store with per-lookup max age (thread-safe).
+    Entries older than max_age_seconds are deleted; cache errors never reach callers
+    (a failed lookup is a miss, a failed store is skipped).
+    """
+
+    def __init__(self, path: str, max_age_seconds: float = 7 * 86400):
+        """Open (or create) the cache database and drop expired entries"""
+        self.path = path
+        self.max_age_seconds = max_age_seconds
+        self.writes = 0
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+        # One connection shared by all workers; lookups are sub-millisecond
+        self.lock = Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA busy_timeout=5000")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses (key BLOB PRIMARY KEY, body BLOB NOT NULL, ts INTEGER NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS ix_responses_ts ON responses (ts)")
+        self.purge()
+
+    @staticmethod
+    def make_key(*parts: str) -> bytes:
+        """SHA-1 of the request identity (e.g. method + URL, or backend + query)"""
+        return hashlib.sha1('\x1f'.join(parts).encode('utf-8')).digest()
+
+    def get(self, key: bytes, max_age_seconds: float) -> Optional[bytes]:
+        """Cached body for key if stored less than max_age_seconds ago (None on a miss or cache error)"""
+        try:
+            with self.lock:
+                row = self.conn.execute(
+                    "SELECT body FROM responses WHERE key = ? AND ts >= ?",
+                    (key, int(time.time() - max_age_seconds))
+                ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️  Response cache lookup failed, fetching live: {e}")
+            return None
+        return row[0] if row else None
+
+    def set(self, key: bytes, body: bytes):
+        """Store (or replace) the body for key; a failed store is logged and skipped"""
+        try:
+            with self.lock:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, body, ts) VALUES (?, ?, ?)",
+                    (key, body, int(time.time()))
+                )
+                self.writes += 1
+                purge_due = self.writes % PURGE_INTERVAL_WRITES == 0
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️  Response cache store failed: {e}")
+            return
+
+        if purge_due:
+            self.purge()
+
+    def purge(self) -> int:
+        """Delete entries older than max_age_seconds; returns how many were removed"""
+        try:
+            with self.lock:
+                return self.conn.execute(
+                    "DELETE FROM responses WHERE ts < ?", (int(time.time() - self.max_age_seconds),)
+                ).rowcount
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️  Response cache purge failed: {e}")
+            return 0
+
+
+def open_response_cache(config: dict) -> Optional[ResponseCache]:
+    """ResponseCache from the response_cache config section, or None if disabled/unavailable"""
+    cache_config = config.get('response_cache', {})
+    if not cache_config.get('enabled', True):
+        return None
+
+    path = cache_config.get('path', 'data/cache/responses.db')
+    try:
+        return ResponseCache(path, cache_config.get('max_age_days', 7) * 86400)
+    except (OSError, sqlite3.Error) as e:
+        logger.warning(f"⚠️  Response cache unavailable ({path}): {e}")
+        return None
@@ -5,15 +5,168 @@ Uses DuckDuckGo search + LLM extraction, stores directly in database
 
 import json
 import logging
+import re
 import time
-from typing import Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from itertools import cycle
+from threading import BoundedSemaphore, Lock, local
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit
 
 from ddgs import DDGS
+from ddgs.exceptions import RatelimitException, TimeoutException
 
 from .llm_router_v2 import LLMRouterV2
+from .response_cache import ResponseCache, open_response_cache
 
 logger = logging.getLogger(__name__)
 
+# ",]" / ",}" - the most common way LLMs break otherwise valid JSON
+TRAILING_COMMA_RE = re.compile(r',\s*([\]}])')
+
+_json_decoder = json.JSONDecoder()
+
+# First retry delay after a rate-limited/timed-out search (doubles per attempt)
+SEARCH_BACKOFF_SECONDS = 2
+
+# Per-result snippet budget in the extraction prompt (characters)
+SNIPPET_MAX_CHARS = 300
+
+# Snippets sharing at least this fraction of their word 5-grams count as duplicates
+SNIPPET_DUPLICATE_JACCARD = 0.8
+
+# Keys requested for each extracted round
+ROUND_FIELDS = ('round_name ("Seed", "Series A", ...), date (YYYY-MM-DD, YYYY-MM or YYYY), '
+                'amount_raised_usd (USD number), pre_money_valuation_usd (number or null), '
+                'post_money_valuation_usd (number or null), lead_investor (string or null), '
+                'all_investors (list of strings), source_url (URL of the result it came from).')
+
+# Search queries per company, in priority order ({c} is the company name)
+SEARCH_QUERY_TEMPLATES = (
+    'site:techcrunch.com "{c}" funding raised Series',
+    'site:crunchbase.com "{c}" funding rounds',
+    'site:reuters.com OR site:bloomberg.com "{c}" raises funding',
+    'site:pitchbook.com OR site:cbinsights.com "{c}" venture capital',
+    'site:theinformation.com OR site:axios.com "{c}" funding',
+    'site:venturebeat.com OR site:geekwire.com "{c}" raises',
+    'site:wsj.com OR site:ft.com OR site:forbes.com "{c}" investment',
+    '"{c}" funding history seed series valuation investors',
+)
+
+# Extraction prompts, assembled once; each call only fills the placeholders with str.format
+EXTRACTION_PROMPT = (
+    "Extract every funding round of {company_name} mentioned in these search results.\n\n"
+    "{search_text}Return ONLY a JSON object {{\"rounds\": [...]}} whose array ([] if none) holds objects "
+    "with keys: " + ROUND_FIELDS + "\n\n"
+    "JSON object:"
+)
+BATCH_EXTRACTION_PROMPT = (
+    "Extract every funding round of each company below from its search results.\n\n"
+    "{sections}Return ONLY a JSON object mapping each company name exactly as written above to a JSON array "
+    "([] if none) of objects with keys: " + ROUND_FIELDS + "\n\n"
+    "JSON object:"
+)
+BATCH_SECTION = "### Company: {company_name}\n\n{search_text}"
+
+WHITESPACE_RE = re.compile(r'\s+')
+NON_WORD_RE = re.compile(r'[\W_]+')
+READ_MORE_RE = re.compile(r'\s*(?:\.\.\.|…)?\s*(?:read more|continue reading)\W*$', re.IGNORECASE)
+
+
+def _parse_llm_json(text: str, expected: type = list):
+    """
+    Parse the JSON array (or, with expected=dict, object of arrays) in an LLM
+    response. Tries the whole text, then the first matching value starting at
+    any '[' / '{' (raw_decode stops at the end of the value, so brackets in
+    prose, markdown fences or investor names don't matter), then the same with
+    trailing commas removed. Raises json.JSONDecodeError if nothing parses.
+    """
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError as e:
+        error = e
+
+    opener = '[' if expected is list else '{'
+    for candidate in (text, TRAILING_COMMA_RE.sub(r'\1', text)):
+        start = candidate.find(opener)
+        while start != -1:
+            try:
+                value = _json_decoder.raw_decode(candidate, start)[0]
+                items = value if isinstance(value, list) else value.values()
+                item_type = dict if expected is list else list
+                # An empty object says nothing; keep looking (e.g. for the array it precedes)
+                if (isinstance(value, expected) and (expected is list or value)
+                        and all(isinstance(item, item_type) for item in items)):
+                    return value
+            except json.JSONDecodeError:
+                pass
+            start = candidate.find(opener, start + 1)
+
+    raise error
+
+
+def _fold_name(name: str) -> str:
+    """Company name without case, whitespace or punctuation ("Acme, Inc." -> "acmeinc")"""
+    return NON_WORD_RE.sub('', name.casefold())
+
+
+def _compact_url(url: str) -> str:
+    """scheme://host/path - query strings and fragments only cost prompt tokens"""
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}{parts.path}" if parts.netloc else url
+
+
+def _canonical_url(url: str) -> str:
+    """URL identity for de-duplication: lowercase host, no utm_* params, fragment or trailing slash"""
+    parts = urlsplit(url)
+    query = urlencode([(key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+                       if not key.lower().startswith('utm_')])
+    path = parts.path.rstrip('/')
+    return f"{parts.scheme.lower()}://{parts.netloc.lower()}{path}" + (f"?{query}" if query else '')
+
+
+def _shingles(text: str) -> set:
+    """Word 5-grams of a snippet (empty for an empty snippet)"""
+    words = text.lower().split()
+    return {tuple(words[i:i + 5]) for i in range(max(len(words) - 4, 1))} if words else set()
+
+
+def _summarize_results(results: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    """
+    Compact search results for the LLM prompt: bare URLs, whitespace-collapsed
+    snippets without "Read more" tails, truncated to SNIPPET_MAX_CHARS, and
+    near-duplicate snippets (syndicated press releases) dropped.
+    """
+    summaries = []
+    seen_shingles = []
+
+    for result in results:
+        snippet = READ_MORE_RE.sub('', WHITESPACE_RE.sub(' ', result.get('snippet') or '').strip())
+        if len(snippet) > SNIPPET_MAX_CHARS:
+            snippet = snippet[:SNIPPET_MAX_CHARS].rsplit(' ', 1)[0] + '…'
+
+        shingles = _shingles(snippet)
+        if shingles and any(len(shingles & seen) >= SNIPPET_DUPLICATE_JACCARD * len(shingles | seen)
+                            for seen in seen_shingles):
+            continue
+        seen_shingles.append(shingles)
+
+        summaries.append({
+            'title': WHITESPACE_RE.sub(' ', result.get('title') or '').strip(),
+            'url': _compact_url(result.get('url') or ''),
+            'snippet': snippet
+        })
+
+    return summaries
+
+
+def _format_results(results: List[Dict[str, str]]) -> str:
+    """Search results as numbered prompt text"""
+    return "".join(
+        f"[{i}] {result['title']}\n{result['url']}\n{result['snippet']}\n\n"
+        for i, result in enumerate(_summarize_results(results), 1)
+    )
+
 
 class SearchExtractorV2:
     """Extract funding data using web search and LLM analysis with database storage"""
@@ -28,31 +181,75 @@ class SearchExtractorV2:
         self.max_results_per_query = search_config.get('max_results_per_query', 4)
         self.queries_per_company = search_config.get('queries_per_company', 8)
         self.politeness_delay = search_config.get('politeness_delay_seconds', 1)
+        self.concurrent_queries = max(1, search_config.get('concurrent_queries', 3))
+        self.max_concurrent_searches = max(1, search_config.get('max_concurrent_searches', 2))
         self.authoritative_sources = search_config.get('authoritative_sources', [])
+        self.llm_batch_companies = max(1, search_config.get('llm_batch_companies', 3))
+        self.llm_batch_max_chars = search_config.get('llm_batch_max_chars', 12000)
+        self.llm_max_tokens_per_company = search_config.get('llm_max_tokens_per_company', 4000)
 
         logger.info(f"✓ Search Extractor initialized")
         logger.info(f"  Max results per query: {self.max_results_per_query}")
         logger.info(f"  Queries per company: {self.queries_per_company}")
         logger.info(f"  Politeness delay: {self.politeness_delay}s")
+        logger.info(f"  Concurrent queries per company: {self.concurrent_queries}")
+        logger.info(f"  Max concurrent searches (all companies): {self.max_concurrent_searches}")
+        logger.info(f"  Companies per LLM call: {self.llm_batch_companies} (max {self.llm_batch_max_chars} chars)")
+
+        # Shared by every Stage 3 worker, so DuckDuckGo load stays bounded
+        # however many companies are in flight
+        self.search_slots = BoundedSemaphore(self.max_concurrent_searches)
+
+        # The first queries_per_company templates, chosen once
+        self.query_templates = SEARCH_QUERY_TEMPLATES[:self.queries_per_company]
+
+        # Search results are reused across runs while younger than cache_max_age_hours
+        self.response_cache = open_response_cache(config)
+        self.cache_max_age_hours = search_config.get('cache_max_age_hours', 1)
+
+        # ddgs clients are reused per worker thread (keeps their HTTP sessions warm);
+        # a rate-limited client is dropped and replaced on the next proxy
+        self.backend = search_config.get('backend', 'auto')
+        self.search_retries = search_config.get('max_retries', 2)
+        self.proxies = search_config.get('proxies') or [None]
+        self._proxy_cycle = cycle(self.proxies)
+        self._proxy_lock = Lock()
+        self._clients = local()
+        logger.info(f"  Search backend: {self.backend} ({len(self.proxies)} proxies, {self.search_retries} retries)")
 
     def generate_search_queries(self, company_name: str) -> List[str]:
         """Generate targeted search queries for a company"""
-        return [
-            f'site:techcrunch.com "{company_name}" funding raised Series',
-            f'site:crunchbase.com "{company_name}" funding rounds',
-            f'site:reuters.com OR site:bloomberg.com "{company_name}" raises funding',
-            f'site:pitchbook.com OR site:cbinsights.com "{company_name}" venture capital',
-            f'site:theinformation.com OR site:axios.com "{company_name}" funding',
-            f'site:venturebeat.com OR site:geekwire.com "{company_name}" raises',
-            f'site:wsj.com OR site:ft.com OR site:forbes.com "{company_name}" investment',
-            f'"{company_name}" funding history seed series valuation investors'
-        ]
+        return [template.format(c=company_name) for template in self.query_templates]
+
+    def _search_cache_key(self, query: str) -> bytes:
+        """Response cache key for a query (result count is part of the identity)"""
+        return ResponseCache.make_key('ddgs.text', self.backend, str(self.max_results_per_query), query)
+
+    def _client(self) -> DDGS:
+        """This thread's ddgs client, created on the next proxy in rotation"""
+        client = getattr(self._clients, 'ddgs', None)
+        if client is None:
+            with self._proxy_lock:
+                proxy = next(self._proxy_cycle)
+            client = self._clients.ddgs = DDGS(proxy=proxy)
+        return client
 
     def perform_search(self, query: str) -> List[Dict[str, str]]:
-        """Perform DuckDuckGo search and return results"""
+        """Perform DuckDuckGo search and return results (successful searches are cached)"""
         try:
-            ddgs = DDGS()
-            results = ddgs.text(query, max_results=self.max_results_per_query)
+            for attempt in range(self.search_retries + 1):
+                try:
+                    results = self._client().text(query, max_results=self.max_results_per_query,
+                                                  backend=self.backend)
+                    break
+                except (RatelimitException, TimeoutException) as e:
+                    # Rotate to a fresh client/proxy and back off before retrying
+                    self._clients.ddgs = None
+                    if attempt == self.search_retries:
+                        raise
+                    delay = SEARCH_BACKOFF_SECONDS * 2 ** attempt
+                    logger.debug(f"  Search throttled ({e}), retrying in {delay}s")
+                    time.sleep(delay)
 
             search_results = []
             for result in results:
@@ -62,63 +259,64 @@ class SearchExtractorV2:
                     'snippet': result.get('body', '')
                 })
 
+            if self.response_cache:
+                self.response_cache.set(self._search_cache_key(query), json.dumps(search_results).encode('utf-8'))
+
             return search_results
 
         except Exception as e:
             logger.error(f"Search error for query '{query}': {str(e)}")
             return []
 
+    def _search_politely(self, query: str) -> List[Dict[str, str]]:
+        """Run one search, then hold the slot for the politeness delay (cache hits skip both)"""
+        if self.response_cache:
+            cached = self.response_cache.get(self._search_cache_key(query), self.cache_max_age_hours * 3600)
+            if cached is not None:
+                logger.debug(f"  Cached: {query[:80]}")
+                return json.loads(cached)
+
+        with self.search_slots:
+            logger.debug(f"  Searching: {query[:80]}...")
+            results = self.perform_search(query)
+            time.sleep(self.politeness_delay)
+        return results
+
+    def search_all(self, queries: List[str]) -> List[Dict[str, str]]:
+        """
+        Run a company's queries concurrently (at most concurrent_queries in flight, each
+        followed by the politeness delay). Results are returned in query order, with
+        URLs already returned by an earlier query dropped.
+        """
+        all_search_results = []
+        seen_urls = set()
+
+        with ThreadPoolExecutor(max_workers=min(self.concurrent_queries, len(queries) or 1)) as executor:
+            for results in executor.map(self._search_politely, queries):
+                if results:
+                    logger.debug(f"    Found {len(results)} results")
+                    for result in results:
+                        url = _canonical_url(result['url'])
+                        if url not in seen_urls:
+                            seen_urls.add(url)
+                            all_search_results.append(result)
+
+        return all_search_results
+
     def extract_funding_rounds_from_search(self, company_name: str, search_results: List[Dict]) -> List[Dict]:
         """Use LLM to extract funding rounds from search results"""
         if not search_results:
             return []
 
         # Build search results text for LLM
-        search_text = ""
-        for i, result in enumerate(search_results, 1):
-            search_text += f"\n\n--- Result {i} ---\n"
-            search_text += f"Title: {result['title']}\n"
-            search_text += f"URL: {result['url']}\n"
-            search_text += f"Snippet: {result['snippet']}\n"
+        search_text = _format_results(search_results)
 
         # LLM prompt
-        prompt = f"""You are a financial data analyst extracting funding round information from web search results.
-
-Company: {company_name}
-
-Search Results:
-{search_text}
-
-Extract ALL funding rounds mentioned for {company_name}. For each round, extract:
-- round_name (e.g., "Seed", "Series A", "Series B", "Series C", etc.)
-- date (YYYY-MM-DD or YYYY-MM or YYYY)
-- amount_raised_usd (number only, in USD)
-- pre_money_valuation_usd (if mentioned, number only)
-- post_money_valuation_usd (if mentioned, number only)
-- lead_investor (primary investor if mentioned)
-- all_investors (list of all investors mentioned)
-- source_url (which URL this data came from)
-
-Return ONLY a valid JSON array of funding rounds. If no funding rounds are found, return an empty array [].
-
-Example format:
-[
-  {{{{
-    "round_name": "Series A",
-    "date": "2020-05-15",
-    "amount_raised_usd": 50000000,
-    "pre_money_valuation_usd": null,
-    "post_money_valuation_usd": 250000000,
-    "lead_investor": "Sequoia Capital",
-    "all_investors": ["Sequoia Capital", "Andreessen Horowitz"],
-    "source_url": "https://techcrunch.com/..."
-  }}}}
-]
-
-JSON array:"""
+        prompt = EXTRACTION_PROMPT.format(company_name=company_name, search_text=search_text)
 
         try:
-            response = self.llm_router.generate(prompt, max_tokens=4000, temperature=0.0)
+            response = self.llm_router.generate(prompt, max_tokens=self.llm_max_tokens_per_company,
+                                               temperature=0.0, json_mode=True)
 
             if not response:
                 logger.warning(f"No LLM response for {company_name}")
@@ -127,16 +325,22 @@ JSON array:"""
             # Extract JSON from response
             response = response.strip()
 
-            # Try to find JSON array in response
-            start_idx = response.find('[')
-            end_idx = response.rfind(']')
-
-            if start_idx == -1 or end_idx == -1:
+            if '[' not in response:
                 logger.warning(f"No JSON array found in LLM response for {company_name}")
                 return []
 
-            json_str = response[start_idx:end_idx + 1]
-            rounds = json.loads(json_str)
+            # JSON mode answers {"rounds": [...]}; providers without it (or ignoring it)
+            # answer a bare array, possibly inside a markdown fence or prose
+            try:
+                rounds = _parse_llm_json(response, expected=dict)
+            except json.JSONDecodeError:
+                rounds = None
+
+            if isinstance(rounds, dict):
+                rounds = rounds.get('rounds')
+
+            if not isinstance(rounds, list):
+                rounds = _parse_llm_json(response, expected=list)
 
             if not isinstance(rounds, list):
                 logger.warning(f"LLM response is not a list for {company_name}")
@@ -158,10 +362,84 @@ JSON array:"""
             logger.error(f"LLM extraction error for {company_name}: {str(e)}")
             return []
 
-    def process_company(self, session, company) -> int:
+    def extract_funding_rounds_batch(self, companies_and_results: List[Tuple[str, str]]) -> Optional[Dict[str, List[Dict]]]:
         """
-        Process a single company: search the web and extract funding rounds.
-        Returns number of rounds found.
+        Extract funding rounds for several companies with one LLM call.
+        Takes (company name, formatted search results) pairs and returns
+        {company name: rounds}, or None if the response could not be used.
+        Companies the response has no usable entry for are left out of the
+        result, so the caller can extract them on their own.
+        """
+        company_names = [company_name for company_name, _ in companies_and_results]
+
+        # LLM prompt
+        sections = "".join(
+            BATCH_SECTION.format(company_name=company_name, search_text=search_text)
+            for company_name, search_text in companies_and_results
+        )
+        prompt = BATCH_EXTRACTION_PROMPT.format(sections=sections)
+
+        try:
+            # Output budget grows with the batch so long round histories aren't cut off mid-JSON
+            max_tokens = self.llm_max_tokens_per_company * len(company_names)
+            response = self.llm_router.generate(prompt, max_tokens=max_tokens, temperature=0.0, json_mode=True)
+
+            if not response:
+                logger.warning(f"No LLM response for batch of {len(company_names)} companies")
+                return None
+
+            rounds_by_key = _parse_llm_json(response.strip(), expected=dict)
+            if not isinstance(rounds_by_key, dict):
+                logger.warning(f"LLM response is not an object for batch of {len(company_names)} companies")
+                return None
+
+            # Exact keys first; models sometimes change the case, spacing or punctuation
+            # of a name, so a key that folds to exactly one company's name counts too
+            names_by_fold = {}
+            for company_name in company_names:
+                names_by_fold.setdefault(_fold_name(company_name), []).append(company_name)
+
+            matched = {key: key for key in rounds_by_key if key in company_names}
+            for key in rounds_by_key:
+                candidates = names_by_fold.get(_fold_name(key), [])
+                if key not in matched and len(candidates) == 1 and candidates[0] not in matched.values():
+                    matched[key] = candidates[0]
+
+            rounds_by_company = {}
+            for key, company_name in matched.items():
+                rounds = rounds_by_key[key]
+                if not isinstance(rounds, list):
+                    continue
+
+                # Add company name to each round
+                rounds = [round_data for round_data in rounds if isinstance(round_data, dict)]
+                for round_data in rounds:
+                    round_data['company_name'] = company_name
+
+                rounds_by_company[company_name] = rounds
+
+            missing = [company_name for company_name in company_names if company_name not in rounds_by_company]
+            if missing:
+                logger.warning(f"Batched LLM response has no usable entry for {', '.join(missing)}")
+
+            logger.debug(f"Extracted {sum(map(len, rounds_by_company.values()))} rounds for "
+                         f"{len(company_names)} companies from one LLM call")
+            return rounds_by_company
+
+        except json.JSONDecodeError as e:
+            logger.error(f"JSON decode error for batch of {len(company_names)} companies: {str(e)}")
+            logger.debug(f"Raw response: {response[:500]}")
+            return None
+
+        except Exception as e:
+            logger.error(f"LLM extraction error for batch of {len(company_names)} companies: {str(e)}")
+            return None
+
+    def search_company(self, session, company) -> Optional[List[Dict]]:
+        """
+        Stage 3.1-3.2: search the web for a company.
+        Returns the search results, or None when there is nothing to extract
+        (already processed, or no results - then the stage is marked complete).
         """
         company_name = company.name
 
@@ -169,7 +447,7 @@ JSON array:"""
         status = self.db_manager.get_processing_status(session, company.id)
         if status.stage3_search_extracted:
             logger.debug(f"[Stage 3] {company_name} already processed, skipping")
-            return status.stage3_rounds_found
+            return None
 
         logger.info(f"[Stage 3] Processing {company_name}...")
 
@@ -177,64 +455,61 @@ JSON array:"""
         queries = self.generate_search_queries(company_name)
 
         # Stage 3.2: Perform searches
-        all_search_results = []
-
-        for query in queries:
-            logger.debug(f"  Searching: {query[:80]}...")
-            results = self.perform_search(query)
-
-            if results:
-                all_search_results.extend(results)
-                logger.debug(f"    Found {len(results)} results")
-
-            # Politeness delay
-            time.sleep(self.politeness_delay)
+        all_search_results = self.search_all(queries)
 
         if not all_search_results:
             logger.warning(f"  ✗ {company_name} → No search results found")
             self.db_manager.update_stage3_status(session, company.id, rounds_found=0)
-            return 0
+            return None
 
         logger.info(f"  Found {len(all_search_results)} total search results")
+        return all_search_results
 
-        # Stage 3.3: Extract funding rounds using LLM
-        rounds = self.extract_funding_rounds_from_search(company_name, all_search_results)
+    def save_company_rounds(self, session, company, rounds: List[Dict], all_search_results: List[Dict]) -> int:
+        """
+        Stage 3.4: store extracted rounds and their sources, and mark the stage complete.
+        Returns number of rounds saved.
+        """
+        company_name = company.name
 
         if not rounds:
             logger.warning(f"  ✗ {company_name} → No funding rounds extracted")
             self.db_manager.update_stage3_status(session, company.id, rounds_found=0)
             return 0
 
-        # Stage 3.4: Save to database
-        for round_data in rounds:
-            funding_round = self.db_manager.add_funding_round(
-                session=session,
-                company_id=company.id,
-                round_data=round_data,
-                source_type='WEB_SEARCH',
-                confidence_score='MEDIUM',
-                source_urls=[round_data.get('source_url')] if round_data.get('source_url') else None
-            )
-
-            # Add source
+        results_by_url = {}
+        for result in all_search_results:
+            results_by_url.setdefault(_compact_url(result.get('url') or ''), result)
+
+        # All rounds, then all sources, in one statement each
+        round_ids = self.db_manager.bulk_load_funding_rounds(session, [
+            {
+                'company_id': company.id,
+                'round_data': round_data,
+                'source_type': 'WEB_SEARCH',
+                'confidence_score': 'MEDIUM',
+                'source_urls': [round_data.get('source_url')] if round_data.get('source_url') else None
+            }
+            for round_data in rounds
+        ])
+
+        sources = []
+        for round_id, round_data in zip(round_ids, rounds):
             source_url = round_data.get('source_url')
             if source_url:
-                # Find the search result that matches this URL
-                matching_result = next(
-                    (r for r in all_search_results if r.get('url') == source_url),
-                    None
-                )
-
-                self.db_manager.add_source(
-                    session=session,
-                    round_id=funding_round.id,
-                    source_type='WEB_SEARCH',
-                    url=source_url,
-                    title=matching_result.get('title') if matching_result else None,
-                    snippet=matching_result.get('snippet') if matching_result else None,
-                    llm_provider=self.llm_router.rotation_strategy,
-                    extraction_confidence='MEDIUM'
-                )
+                # Find the search result that matches this URL (the prompt shows compact URLs)
+                matching_result = results_by_url.get(_compact_url(source_url))
+
+                sources.append({
+                    'round_id': round_id,
+                    'source_type': 'WEB_SEARCH',
+                    'url': source_url,
+                    'title': matching_result.get('title') if matching_result else None,
+                    'snippet': matching_result.get('snippet') if matching_result else None,
+                    'llm_provider': self.llm_router.rotation_strategy,
+                    'extraction_confidence': 'MEDIUM'
+                })
+        self.db_manager.add_sources(session, sources)
 
         # Mark stage as complete
         self.db_manager.update_stage3_status(session, company.id, rounds_found=len(rounds))
@@ -242,3 +517,79 @@ JSON array:"""
         logger.info(f"  ✓ {company_name} → {len(rounds)} rounds extracted")
 
         return len(rounds)
+
+    def process_company(self, session, company) -> int:
+        """
+        Process a single company: search the web and extract funding rounds.
+        Returns number of rounds found.
+        """
+        all_search_results = self.search_company(session, company)
+        if not all_search_results:
+            return 0
+
+        # Stage 3.3: Extract funding rounds using LLM
+        rounds = self.extract_funding_rounds_from_search(company.name, all_search_results)
+
+        # Stage 3.4: Save to database
+        return self.save_company_rounds(session, company, rounds, all_search_results)
+
+    def _save_batch(self, batch: List[Tuple[object, List[Dict], str]]) -> int:
+        """Extract a batch of searched companies with one LLM call and save each in its own transaction"""
+        rounds_by_company = None
+        if len(batch) > 1:
+            rounds_by_company = self.extract_funding_rounds_batch(
+                [(company.name, search_text) for company, _, search_text in batch]
+            )
+
+        rounds_found = 0
+        for company, all_search_results, _ in batch:
+            try:
+                with self.db_manager.session_scope() as session:
+                    if rounds_by_company is not None and company.name in rounds_by_company:
+                        rounds = rounds_by_company[company.name]
+                    else:
+                        # Single company, or the batch response was unusable/had no entry for it
+                        rounds = self.extract_funding_rounds_from_search(company.name, all_search_results)
+                    rounds_found += self.save_company_rounds(session, company, rounds, all_search_results)
+            except Exception as e:
+                logger.error("  Error processing %s: %s", company.name, e)
+        return rounds_found
+
+    def process_companies(self, companies: List) -> int:
+        """
+        Process several companies, packing up to llm_batch_companies of them (and at
+        most llm_batch_max_chars of search results) into each LLM call. Each company's
+        writes are committed on their own, after its network calls, so SQLite's single
+        write lock is never held across a search or LLM request.
+        Returns number of rounds found.
+        """
+        rounds_found = 0
+        batch = []
+        batch_chars = 0
+
+        for company in companies:
+            try:
+                # Own transaction per company so one failure doesn't roll back the batch
+                with self.db_manager.session_scope() as session:
+                    all_search_results = self.search_company(session, company)
+            except Exception as e:
+                logger.error("  Error processing %s: %s", company.name, e)
+                continue
+
+            if not all_search_results:
+                continue
+
+            search_text = _format_results(all_search_results)
+            if batch and (len(batch) >= self.llm_batch_companies
+                          or batch_chars + len(search_text) > self.llm_batch_max_chars):
+                rounds_found += self._save_batch(batch)
+                batch = []
+                batch_chars = 0
+
+            batch.append((company, all_search_results, search_text))
+            batch_chars += len(search_text)
+
+        if batch:
+            rounds_found += self._save_batch(batch)
+
+        return rounds_found
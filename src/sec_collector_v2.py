@@ -3,20 +3,109 @@ SEC EDGAR Form D Collector V2 with Multiple User Agent Rotation
 Rotates between multiple SEC accounts to avoid rate limits
 """
 
+import json
 import logging
+import os
 import time
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime
+from itertools import zip_longest
+from email.utils import formatdate
 from threading import Lock
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Set, Tuple
 from xml.etree import ElementTree as ET
 
 import requests
+from requests.adapters import HTTPAdapter
+
+from .response_cache import ResponseCache, open_response_cache
 
 logger = logging.getLogger(__name__)
 
+# SEC fair-access limit per user agent. The burst is kept small so a
+# one-second window never sees much more than the limit
+SEC_REQUESTS_PER_SECOND = 10
+SEC_MAX_BURST = 3
+
+# A Form D row in submissions JSON always contains this exact token
+FORM_D_MARKER = b'"D"'
+
+# Keep-alive connections per SEC host (one per concurrent Stage 2 worker is enough)
+HTTP_POOL_SIZE = 16
+
+# SEC ticker universe (name -> CIK), a multi-megabyte file that changes at most daily
+COMPANY_TICKERS_URL = "https://www.sec.gov/files/company_tickers.json"
+COMPANY_TICKERS_FILE = 'company_tickers.json'
+
+# Form D elements in Clark notation ({namespace}tag), matched with the C-level Element.iter()
+FORM_D_NAMESPACE = 'http://www.sec.gov/edgar/document/thirtypartyfiler/formsubmission'
+OFFERING_DATA_TAG = f'{{{FORM_D_NAMESPACE}}}offeringData'
+TOTAL_OFFERING_AMOUNT_TAG = f'{{{FORM_D_NAMESPACE}}}totalOfferingAmount'
+
+
+@dataclass
+class TickerIndex:
+    """Lookup structures over company_tickers.json (titles lowercased, in file order)"""
+    __slots__ = ('entries', 'positions', 'titles_text', 'title_starts', 'title_lengths')
+
+    entries: List[Dict]
+    positions: Dict[str, int]  # title -> position of the first entry with that title
+    titles_text: str  # all titles joined by newlines, for one C-level substring search
+    title_starts: List[int]  # offset of each entry's title in titles_text
+    title_lengths: Set[int]
+
+    @classmethod
+    def build(cls, companies: Dict) -> 'TickerIndex':
+        """Index the entries of company_tickers.json"""
+        entries = list(companies.values())
+        titles = [entry['title'].lower() for entry in entries]
+
+        positions = {}
+        title_starts = []
+        offset = 0
+        for position, title_lower in enumerate(titles):
+            positions.setdefault(title_lower, position)
+            title_starts.append(offset)
+            offset += len(title_lower) + 1
+
+        return cls(
+            entries=entries,
+            positions=positions,
+            titles_text='\n'.join(titles),
+            title_starts=title_starts,
+            title_lengths={len(title_lower) for title_lower in positions}
+        )
+
+    def find(self, company_lower: str) -> Optional[Dict]:
+        """
+        The first entry (file order) whose title contains the name or is contained
+        in it - an exact title gets no priority over an earlier partial match, same
+        as a scan over every entry - found with a substring search plus dict lookups.
+        """
+        position = None
+
+        # First title containing the name: locate the match in the joined titles
+        offset = self.titles_text.find(company_lower)
+        if offset != -1:
+            position = bisect_right(self.title_starts, offset) - 1
+
+        # Titles inside the name: look up each substring of a possible title length
+        name_length = len(company_lower)
+        for length in self.title_lengths:
+            if length > name_length:
+                continue
+            for start in range(name_length - length + 1):
+                candidate = self.positions.get(company_lower[start:start + length])
+                if candidate is not None and (position is None or candidate < position):
+                    position = candidate
+
+        return self.entries[position] if position is not None else None
+
 
 class SECUserAgent:
-    """Individual SEC user agent with rate limiting"""
+    """Individual SEC user agent with token-bucket rate limiting"""
 
     def __init__(self, name: str, user_agent: str):
         self.name = name
@@ -25,29 +114,40 @@ class SECUserAgent:
         self.last_call_time = 0
         self.lock = Lock()
 
-        # SEC rate limit: 10 requests per second
-        self.min_delay_seconds = 0.1  # 100ms between requests
+        # SEC rate limit: 10 requests per second, refilled continuously
+        self.requests_per_second = SEC_REQUESTS_PER_SECOND
+        self.burst = SEC_MAX_BURST
+        self._tokens = float(self.burst)
+        self._refilled_at = time.monotonic()
+
+    def _refill(self, now: float):
+        """Add the tokens earned since the last refill (caller holds the lock)"""
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.requests_per_second)
+        self._refilled_at = now
 
     def can_make_request(self) -> bool:
-        """Check if enough time has passed since last request"""
+        """Check if a request token is available right now"""
         with self.lock:
-            current_time = time.time()
-            time_since_last_call = current_time - self.last_call_time
-            return time_since_last_call >= self.min_delay_seconds
+            self._refill(time.monotonic())
+            return self._tokens >= 1
 
     def wait_if_needed(self):
-        """Wait if necessary to respect rate limit"""
+        """
+        Take a token, waiting only for the deficit. The token is reserved under
+        the lock (the balance may go negative) and the sleep happens after it is
+        released, so concurrent workers queue up instead of blocking each other.
+        """
         with self.lock:
-            current_time = time.time()
-            time_since_last_call = current_time - self.last_call_time
+            self._refill(time.monotonic())
+            self._tokens -= 1
+            wait_time = max(0.0, -self._tokens / self.requests_per_second)
 
-            if time_since_last_call < self.min_delay_seconds:
-                wait_time = self.min_delay_seconds - time_since_last_call
-                time.sleep(wait_time)
-
-            self.last_call_time = time.time()
+            self.last_call_time = time.time() + wait_time
             self.calls_made += 1
 
+        if wait_time:
+            time.sleep(wait_time)
+
     def get_headers(self) -> Dict[str, str]:
         """Get request headers with User-Agent"""
         return {
@@ -62,7 +162,6 @@ class SECCollectorV2:
 
     def __init__(self, config: dict, db_manager=None):
         """Initialize SEC collector with configuration"""
-        import os
         self.config = config
         self.db_manager = db_manager
 
@@ -104,6 +203,27 @@ class SECCollectorV2:
         self.current_agent_index = 0
         self.rotation_lock = Lock()
 
+        # Persistent HTTP session shared by all workers: TCP/TLS connections to
+        # www.sec.gov and data.sec.gov are reused instead of re-established per request
+        self.http = requests.Session()
+        self.http.mount('https://', HTTPAdapter(pool_maxsize=HTTP_POOL_SIZE, max_retries=0))
+
+        # company_tickers.json is cached on disk and loaded once per process
+        sec_config = config.get('sec', {})
+        self.cache_directory = sec_config.get('cache_directory', 'data/cache')
+        self.tickers_max_age_hours = sec_config.get('tickers_max_age_hours', 24)
+        os.makedirs(self.cache_directory, exist_ok=True)
+        self._ticker_index = None
+        self._ticker_lock = Lock()
+
+        # Submissions and Form D documents are kept in the response cache between runs
+        self.response_cache = open_response_cache(config)
+        self.submissions_max_age_hours = sec_config.get('submissions_max_age_hours', 24)
+        self.filing_max_age_days = sec_config.get('filing_max_age_days', 7)
+
+        # Form D documents of one company are fetched concurrently (still paced by the agent)
+        self.concurrent_filings = max(1, sec_config.get('concurrent_filings', 4))
+
     def get_next_user_agent(self) -> SECUserAgent:
         """Get next user agent using round-robin"""
         with self.rotation_lock:
@@ -111,40 +231,90 @@ class SECCollectorV2:
             self.current_agent_index = (self.current_agent_index + 1) % len(self.user_agents)
             return agent
 
-    def resolve_cik(self, company_name: str) -> Optional[Dict[str, str]]:
-        """
-        Resolve company name to CIK using SEC EDGAR API.
-        Returns dict with 'cik' and 'official_name' or None if not found.
-        """
-        agent = self.get_next_user_agent()
+    def _get(self, url: str, agent: SECUserAgent, max_age_seconds: float) -> bytes:
+        """GET url and return the body, served from the response cache while fresh"""
+        key = ResponseCache.make_key('GET', url)
+        if self.response_cache:
+            body = self.response_cache.get(key, max_age_seconds)
+            if body is not None:
+                return body
+
         agent.wait_if_needed()
+        response = self.http.get(url, headers=agent.get_headers(), timeout=10)
+        response.raise_for_status()
 
-        try:
-            # Use SEC's company tickers JSON endpoint
-            url = "https://www.sec.gov/files/company_tickers.json"
+        if self.response_cache:
+            self.response_cache.set(key, response.content)
+        return response.content
 
-            response = requests.get(url, headers=agent.get_headers(), timeout=10)
-            response.raise_for_status()
+    def _fetch_company_tickers(self) -> Dict:
+        """
+        Read company_tickers.json from the disk cache, downloading it when the
+        cached copy is older than tickers_max_age_hours (conditional GET).
+        """
+        path = os.path.join(self.cache_directory, COMPANY_TICKERS_FILE)
+        agent = self.get_next_user_agent()
+        headers = agent.get_headers()
 
-            companies = response.json()
+        if os.path.exists(path):
+            modified = os.path.getmtime(path)
+            if time.time() - modified < self.tickers_max_age_hours * 3600:
+                try:
+                    with open(path, 'rb') as f:
+                        return json.load(f)
+                except ValueError:
+                    logger.warning(f"⚠️  Ignoring corrupt SEC ticker cache: {path}")
+            else:
+                headers['If-Modified-Since'] = formatdate(modified, usegmt=True)
 
-            # Search for company name
-            company_lower = company_name.lower()
+        agent.wait_if_needed()
+        response = self.http.get(COMPANY_TICKERS_URL, headers=headers, timeout=10)
+
+        if response.status_code == 304:
+            # Unchanged upstream: keep the cached copy for another max-age period
+            os.utime(path)
+            with open(path, 'rb') as f:
+                return json.load(f)
+
+        response.raise_for_status()
+        companies = json.loads(response.content)
+
+        # Write-then-rename so concurrent runs never read a partial file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(response.content)
+        os.replace(tmp_path, path)
+
+        logger.info(f"✓ Downloaded SEC company tickers ({len(companies)} entries)")
+        return companies
+
+    def _load_ticker_index(self) -> TickerIndex:
+        """Return the TickerIndex, built once per process"""
+        if self._ticker_index is None:
+            with self._ticker_lock:
+                if self._ticker_index is None:
+                    self._ticker_index = TickerIndex.build(self._fetch_company_tickers())
+        return self._ticker_index
 
-            for entry in companies.values():
-                title_lower = entry['title'].lower()
+    def resolve_cik(self, company_name: str) -> Optional[Dict[str, str]]:
+        """
+        Resolve company name to CIK using SEC's company tickers list.
+        Returns dict with 'cik' and 'official_name' or None if not found.
+        """
+        try:
+            # Search for company name (exact title, else title/name substring match)
+            entry = self._load_ticker_index().find(company_name.lower())
 
-                # Match if company name is in the title
-                if company_lower in title_lower or title_lower in company_lower:
-                    cik = str(entry['cik_str']).zfill(10)  # Pad to 10 digits
-                    official_name = entry['title']
+            if entry is not None:
+                cik = str(entry['cik_str']).zfill(10)  # Pad to 10 digits
+                official_name = entry['title']
 
-                    logger.info(f"  ✓ {company_name} → CIK: {cik} ({official_name})")
+                logger.info(f"  ✓ {company_name} → CIK: {cik} ({official_name})")
 
-                    return {
-                        'cik': cik,
-                        'official_name': official_name
-                    }
+                return {
+                    'cik': cik,
+                    'official_name': official_name
+                }
 
             logger.warning(f"  ✗ {company_name} → Not found in SEC database")
             return None
@@ -153,41 +323,55 @@ class SECCollectorV2:
             logger.error(f"  ✗ {company_name} → Error resolving CIK: {str(e)}")
             return None
 
+    @staticmethod
+    def _form_d_filings(body: bytes) -> List[Tuple[str, Optional[str]]]:
+        """
+        (accession number, filing date) of each Form D in a submissions JSON body.
+        Most companies never filed one, so the multi-megabyte document is only
+        decoded when it contains a "D" token at all.
+        """
+        if FORM_D_MARKER not in body:
+            return []
+
+        recent_filings = json.loads(body).get('filings', {}).get('recent', {})
+        return [
+            (accession_number, filing_date)
+            for form, filing_date, accession_number in zip_longest(
+                recent_filings.get('form', []),
+                recent_filings.get('filingDate', []),
+                recent_filings.get('accessionNumber', [])
+            )
+            if form == 'D' and accession_number
+        ]
+
     def fetch_form_d_filings(self, cik: str, company_name: str) -> List[Dict]:
         """
         Fetch Form D filings for a company.
         Returns list of funding rounds extracted from Form D filings.
         """
         agent = self.get_next_user_agent()
-        agent.wait_if_needed()
 
         try:
             # Get recent filings
             url = f"https://data.sec.gov/submissions/CIK{cik}.json"
 
-            response = requests.get(url, headers=agent.get_headers(), timeout=10)
-            response.raise_for_status()
-
-            data = response.json()
-            recent_filings = data.get('filings', {}).get('recent', {})
+            body = self._get(url, agent, self.submissions_max_age_hours * 3600)
 
-            forms = recent_filings.get('form', [])
-            filing_dates = recent_filings.get('filingDate', [])
-            accession_numbers = recent_filings.get('accessionNumber', [])
+            # Find Form D filings
+            filings = self._form_d_filings(body)
 
-            rounds = []
+            # Fetch Form D details (in filing order)
+            def parse(filing):
+                accession_number, filing_date = filing
+                return self._parse_form_d(cik, accession_number, filing_date, company_name, agent)
 
-            # Find Form D filings
-            for i, form in enumerate(forms):
-                if form == 'D':
-                    filing_date = filing_dates[i] if i < len(filing_dates) else None
-                    accession_number = accession_numbers[i] if i < len(accession_numbers) else None
+            if len(filings) > 1 and self.concurrent_filings > 1:
+                with ThreadPoolExecutor(max_workers=min(self.concurrent_filings, len(filings))) as executor:
+                    parsed = list(executor.map(parse, filings))
+            else:
+                parsed = [parse(filing) for filing in filings]
 
-                    if accession_number:
-                        # Fetch Form D details
-                        round_data = self._parse_form_d(cik, accession_number, filing_date, company_name, agent)
-                        if round_data:
-                            rounds.append(round_data)
+            rounds = [round_data for round_data in parsed if round_data]
 
             if rounds:
                 logger.info(f"  ✓ {company_name} → Found {len(rounds)} Form D filings")
@@ -203,30 +387,25 @@ class SECCollectorV2:
     def _parse_form_d(self, cik: str, accession_number: str, filing_date: str,
                       company_name: str, agent: SECUserAgent) -> Optional[Dict]:
         """Parse a single Form D filing"""
-        agent.wait_if_needed()
-
         try:
             # Construct Form D document URL
             accession_clean = accession_number.replace('-', '')
             url = f"https://www.sec.gov/Archives/edgar/data/{int(cik)}/{accession_clean}/primary_doc.xml"
 
-            response = requests.get(url, headers=agent.get_headers(), timeout=10)
-            response.raise_for_status()
+            # Filed documents never change; only the cache age bounds them
+            content = self._get(url, agent, self.filing_max_age_days * 86400)
 
             # Parse XML
-            root = ET.fromstring(response.content)
-
-            # Define XML namespace
-            ns = {'edgarSubmission': 'http://www.sec.gov/edgar/document/thirtypartyfiler/formsubmission'}
+            root = ET.fromstring(content)
 
             # Extract offering data
-            offering_data = root.find('.//edgarSubmission:offeringData', ns)
+            offering_data = next(root.iter(OFFERING_DATA_TAG), None)
 
             if offering_data is None:
                 return None
 
             # Extract amount
-            total_offering_amount = offering_data.find('.//edgarSubmission:totalOfferingAmount', ns)
+            total_offering_amount = next(offering_data.iter(TOTAL_OFFERING_AMOUNT_TAG), None)
             amount_usd = None
 
             if total_offering_amount is not None and total_offering_amount.text:
@@ -235,9 +414,8 @@ class SECCollectorV2:
                 except (ValueError, TypeError):
                     pass
 
-            # Extract investors (if available)
+            # Investors are not listed in Form D
             investors = []
-            issuer_info = root.find('.//edgarSubmission:issuer', ns)
 
             round_data = {
                 'company_name': company_name,
@@ -276,39 +454,46 @@ class SECCollectorV2:
         logger.info(f"[Stage 2] Processing {company_name}...")
 
         # Stage 2.1: Resolve CIK if not already done
+        cik_data = None
         if not company.cik:
             cik_data = self.resolve_cik(company_name)
-            if cik_data:
-                company.cik = cik_data['cik']
-                company.official_name = cik_data['official_name']
-            else:
+            if not cik_data:
                 # Mark as processed even if CIK not found
                 self.db_manager.update_stage2_status(session, company.id, rounds_found=0)
                 return 0
+            company.cik = cik_data['cik']
 
         # Stage 2.2: Fetch Form D filings
         rounds = self.fetch_form_d_filings(company.cik, company_name)
 
-        # Stage 2.3: Save to database
-        for round_data in rounds:
-            funding_round = self.db_manager.add_funding_round(
-                session=session,
-                company_id=company.id,
-                round_data=round_data,
-                source_type='SEC_FORM_D',
-                confidence_score='HIGH',
-                source_urls=[round_data.get('source_url')]
+        # Stage 2.3: Save to database after all network calls, so the write transaction stays short
+        if cik_data:
+            self.db_manager.update_company_identifiers(
+                session, company.id, cik_data['cik'], cik_data['official_name']
             )
 
-            # Add source
-            self.db_manager.add_source(
-                session=session,
-                round_id=funding_round.id,
-                source_type='SEC_FORM_D',
-                url=round_data.get('source_url'),
-                title=f"SEC Form D - {round_data.get('date')}",
-                snippet=round_data.get('notes')
-            )
+        # All rounds, then all sources, in one statement each
+        round_ids = self.db_manager.bulk_load_funding_rounds(session, [
+            {
+                'company_id': company.id,
+                'round_data': round_data,
+                'source_type': 'SEC_FORM_D',
+                'confidence_score': 'HIGH',
+                'source_urls': [round_data.get('source_url')]
+            }
+            for round_data in rounds
+        ])
+
+        self.db_manager.add_sources(session, [
+            {
+                'round_id': round_id,
+                'source_type': 'SEC_FORM_D',
+                'url': round_data.get('source_url'),
+                'title': f"SEC Form D - {round_data.get('date')}",
+                'snippet': round_data.get('notes')
+            }
+            for round_id, round_data in zip(round_ids, rounds)
+        ])
 
         # Mark stage as complete
         self.db_manager.update_stage2_status(session, company.id, rounds_found=len(rounds))
@@ -0,0 +1,35 @@
+"""Shared fixtures for the Funding Round Collection Engine V2 tests"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.database import DatabaseManager
+
+
+@pytest.fixture
+def db_manager(tmp_path):
+    """DatabaseManager on a fresh SQLite file"""
+    return DatabaseManager({'database': {'type': 'sqlite', 'sqlite': {'path': str(tmp_path / 'test.db')}}})
+
+
+class FakeRouter:
+    """LLM router stand-in: returns queued responses (or a function of the prompt) and records calls"""
+
+    rotation_strategy = 'test'
+
+    def __init__(self, respond):
+        self.respond = respond
+        self.calls = []
+
+    def generate(self, prompt, **kwargs):
+        self.calls.append((prompt, kwargs))
+        return self.respond(prompt)
+
+
+@pytest.fixture
+def make_router():
+    return FakeRouter
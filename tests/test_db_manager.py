@@ -0,0 +1,84 @@
+"""DatabaseManager bulk writes and LLM usage accounting"""
+
+from datetime import datetime, timezone
+
+from src.database import DatabaseManager, FundingRound
+
+COLUMNS = ['id', 'round_name', 'lead_investor', 'notes', 'amount_raised_usd', 'is_duplicate',
+           'source_urls', 'raw_data']
+
+
+def copy_fields(**values):
+    """The COPY line for a row, split into its (raw, still quoted) fields"""
+    row = dict({'id': 7, 'round_name': None, 'lead_investor': None, 'notes': None, 'amount_raised_usd': None,
+                'is_duplicate': False, 'source_urls': None, 'raw_data': None}, **values)
+    line = DatabaseManager._copy_line(row, COLUMNS)
+    assert line.endswith('\n')
+    return dict(zip(COLUMNS, line[:-1].split(',')))
+
+
+def test_copy_line_keeps_empty_strings_apart_from_null():
+    fields = copy_fields(round_name='', lead_investor=None)
+
+    assert fields['round_name'] == '""'
+    assert fields['lead_investor'] == ''
+
+
+def test_copy_line_encodes_json_none_like_the_orm():
+    assert FundingRound.__table__.c.source_urls.type.none_as_null is False
+    assert FundingRound.__table__.c.raw_data.type.none_as_null is True
+
+    fields = copy_fields()
+
+    assert fields['source_urls'] == '"null"'
+    assert fields['raw_data'] == ''
+
+
+def test_copy_line_quotes_values():
+    line = DatabaseManager._copy_line(
+        {'id': 1, 'round_name': 'Series "A", 2nd close', 'amount_raised_usd': 2.5e6, 'is_duplicate': False,
+         'source_urls': ['https://a', 'https://b'], 'raw_data': {'k': 'v'}},
+        ['id', 'round_name', 'amount_raised_usd', 'is_duplicate', 'source_urls', 'raw_data']
+    )
+
+    assert line == ('"1","Series ""A"", 2nd close","2500000.0","f",'
+                    '"[""https://a"", ""https://b""]","{""k"": ""v""}"\n')
+
+
+def usage_rows(db_manager):
+    return [(row.total_calls, row.failed_calls, row.latency_calls, row.average_latency_ms,
+             row.min_latency_ms, row.max_latency_ms) for row in db_manager.get_llm_usage_stats()]
+
+
+def test_llm_usage_average_is_weighted_by_calls_that_reported_latency(db_manager):
+    db_manager.log_llm_usage('gemini', 'flash', success=True, latency_ms=100.0)
+    db_manager.log_llm_usage('gemini', 'flash', success=True, latency_ms=100.0)
+    db_manager.log_llm_usage('gemini', 'flash', success=False)
+    db_manager.flush_llm_usage()
+    db_manager.log_llm_usage('gemini', 'flash', success=True, latency_ms=400.0)
+    db_manager.flush_llm_usage()
+
+    assert usage_rows(db_manager) == [(4, 1, 3, 200.0, 100.0, 400.0)]
+
+
+def test_llm_usage_is_kept_for_the_next_flush_when_a_write_fails(db_manager, monkeypatch):
+    db_manager.log_llm_usage('gemini', 'flash', success=True, latency_ms=50.0)
+
+    def failing_session_scope():
+        raise RuntimeError('database unavailable')
+
+    monkeypatch.setattr(db_manager, 'session_scope', failing_session_scope)
+    db_manager.flush_llm_usage()
+    monkeypatch.undo()
+
+    db_manager.log_llm_usage('gemini', 'flash', success=True, latency_ms=150.0)
+    db_manager.flush_llm_usage()
+
+    assert usage_rows(db_manager) == [(2, 0, 2, 100.0, 50.0, 150.0)]
+
+
+def test_llm_usage_is_recorded_under_the_utc_day(db_manager):
+    db_manager.log_llm_usage('gemini', 'flash', success=True)
+
+    (key,) = db_manager._usage_buffer
+    assert key[2] == datetime.now(timezone.utc).date()
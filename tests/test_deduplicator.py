@@ -0,0 +1,58 @@
+"""Stage 4 round matching and keeper selection"""
+
+import pytest
+from sqlalchemy import select
+
+from src.database import Company, FundingRound
+from src.deduplicator_v2 import DeduplicatorV2
+
+# (name1, name2, merged at the default fuzzy_match_threshold with fuzzy matching enabled)
+FUZZY_CASES = [
+    ('Convertible Note', 'Convertible Notes', True),
+    ('Debt Financing', 'Financing - Debt', True),
+    ('Equity Crowdfunding', 'Crowdfunding Equity', True),
+    ('Series A Extension', 'Series A-1', True),
+    ('Series A', 'Series B', False),
+    ('Bridge Round', 'Bridge Loan', False),
+    ('Venture Round', 'Venture Debt', False),
+    ('Angel Round', 'Angel', False),
+    ('Private Equity', 'Private Placement', False),
+    ('Grant', 'Debt Financing', False),
+]
+
+
+@pytest.mark.parametrize('name1, name2, merged', FUZZY_CASES)
+def test_fuzzy_round_names_at_default_threshold(name1, name2, merged):
+    deduplicator = DeduplicatorV2({'deduplication': {'enable_fuzzy_matching': True}})
+
+    assert deduplicator.round_names_match(name1, name2) is merged
+    assert deduplicator.round_names_match(name2, name1) is merged
+
+
+def test_fuzzy_matching_is_off_by_default():
+    deduplicator = DeduplicatorV2({})
+
+    assert not deduplicator.enable_fuzzy_matching
+    assert not deduplicator.round_names_match('Convertible Note', 'Convertible Notes')
+    # Exact and shared-series matches don't depend on it
+    assert deduplicator.round_names_match('Series A', 'series a extension')
+
+
+def test_tied_duplicates_keep_the_lower_id_not_the_earlier_date(db_manager):
+    with db_manager.session_scope() as session:
+        db_manager.bulk_create_companies(session, ['Acme'])
+        company_id = session.scalar(select(Company.id))
+        round_ids = db_manager.bulk_load_funding_rounds(session, [
+            {'company_id': company_id, 'source_type': 'WEB_SEARCH', 'confidence_score': 'MEDIUM',
+             'round_data': {'round_name': 'Series A', 'date': date, 'amount_raised_usd': 5e6}}
+            for date in ('2020-03-01', '2020-01-15')
+        ])
+
+    with db_manager.session_scope() as session:
+        stats = DeduplicatorV2({}, db_manager).deduplicate_shard(session)
+
+    with db_manager.session_scope() as session:
+        rows = dict(session.execute(select(FundingRound.id, FundingRound.duplicate_of_id)).all())
+
+    assert stats['duplicates_removed'] == 1
+    assert rows == {round_ids[0]: None, round_ids[1]: round_ids[0]}
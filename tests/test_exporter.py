@@ -0,0 +1,58 @@
+"""Export streams one database pass into every format writer"""
+
+import csv
+import json
+
+import pytest
+from sqlalchemy import select
+
+from src import exporter_v2
+from src.database import Company
+from src.exporter_v2 import ExporterV2
+
+ROUND_COUNT = 25
+
+
+@pytest.fixture
+def exporter(db_manager, tmp_path):
+    with db_manager.session_scope() as session:
+        db_manager.bulk_create_companies(session, ['Acme'])
+        company_id = session.scalar(select(Company.id))
+        db_manager.bulk_load_funding_rounds(session, [
+            {'company_id': company_id, 'source_type': 'WEB_SEARCH', 'confidence_score': 'MEDIUM',
+             'round_data': {'round_name': f'Round {i}', 'amount_raised_usd': i * 1e6, 'all_investors': ['X', 'Y']},
+             'source_urls': [f'https://news/{i}']}
+            for i in range(ROUND_COUNT)
+        ])
+    return ExporterV2({'export': {'output_directory': str(tmp_path / 'exports'), 'formats': ['csv', 'json']}},
+                      db_manager)
+
+
+def test_export_all_formats_streams_rows_without_building_a_list(exporter, db_manager, monkeypatch):
+    # A queue smaller than the export forces the writers to consume while rows are still being read
+    monkeypatch.setattr(exporter_v2, 'EXPORT_QUEUE_SIZE', 2)
+    monkeypatch.setattr(exporter, 'prepare_export_data', lambda session: pytest.fail('rows were materialized'))
+
+    with db_manager.session_scope() as session:
+        files = exporter.export_all_formats(session)
+
+    with open(files['csv'], newline='', encoding='utf-8') as f:
+        csv_rows = list(csv.DictReader(f))
+    with open(files['json'], encoding='utf-8') as f:
+        json_rows = json.load(f)
+
+    assert [row['Round Name'] for row in csv_rows] == [f'Round {i}' for i in range(ROUND_COUNT)]
+    assert [row['Round Name'] for row in json_rows] == [f'Round {i}' for i in range(ROUND_COUNT)]
+    assert json_rows[3]['Amount Raised (USD)'] == 3e6
+
+
+def test_export_all_formats_fails_when_reading_rounds_fails(exporter, db_manager, monkeypatch):
+    def broken_rows(session):
+        yield from exporter_v2.ExporterV2.iter_export_rows(exporter, session)
+        raise RuntimeError('connection lost')
+
+    monkeypatch.setattr(exporter_v2, 'EXPORT_QUEUE_SIZE', 2)
+    monkeypatch.setattr(exporter, 'iter_export_rows', broken_rows)
+
+    with db_manager.session_scope() as session, pytest.raises(RuntimeError, match='connection lost'):
+        exporter.export_all_formats(session)
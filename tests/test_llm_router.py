@@ -0,0 +1,80 @@
+"""LLM provider JSON output mode"""
+
+import json
+
+import pytest
+import requests
+
+from src.llm_router_v2 import LLMProvider
+
+ANSWER = '{"rounds": []}'
+
+
+class FakeHTTP:
+    """requests.Session stand-in: answers 400 to response_format if reject_json_mode, records payloads"""
+
+    def __init__(self, reject_json_mode=False):
+        self.reject_json_mode = reject_json_mode
+        self.payloads = []
+
+    def post(self, url, **kwargs):
+        payload = kwargs['json']
+        self.payloads.append(payload)
+        response = requests.Response()
+        if self.reject_json_mode and 'response_format' in payload:
+            response.status_code = 400
+            response._content = b'{"error": "response_format is not supported"}'
+        else:
+            response.status_code = 200
+            response._content = json.dumps({'choices': [{'message': {'content': ANSWER}}]}).encode()
+        return response
+
+
+def make_provider(monkeypatch, http, **config):
+    monkeypatch.setenv('OPENROUTER_API_KEY', 'test-key')
+    provider = LLMProvider('openrouter', dict({'endpoint': 'https://llm/chat', 'model': 'free-model'}, **config))
+    provider.http = http
+    return provider
+
+
+def test_json_mode_is_off_unless_the_provider_enables_it(monkeypatch):
+    http = FakeHTTP()
+    provider = make_provider(monkeypatch, http)
+
+    assert provider.call_llm('Return JSON', json_mode=True) == ANSWER
+    assert 'response_format' not in http.payloads[0]
+
+
+def test_enabled_json_mode_sends_response_format(monkeypatch):
+    http = FakeHTTP()
+    provider = make_provider(monkeypatch, http, json_mode=True)
+
+    provider.call_llm('Return JSON', json_mode=True)
+
+    assert http.payloads[0]['response_format'] == {'type': 'json_object'}
+
+
+def test_http_400_to_json_mode_retries_without_it_and_turns_it_off(monkeypatch):
+    http = FakeHTTP(reject_json_mode=True)
+    provider = make_provider(monkeypatch, http, json_mode=True)
+
+    assert provider.call_llm('Return JSON', json_mode=True) == ANSWER
+    assert provider.call_llm('Return JSON', json_mode=True) == ANSWER
+
+    assert ['response_format' in payload for payload in http.payloads] == [True, False, False]
+    assert not provider.json_mode
+
+
+def test_http_400_is_raised_when_json_mode_was_not_requested(monkeypatch):
+    provider = make_provider(monkeypatch, FakeHTTP(), json_mode=True)
+
+    def bad_request(*args, **kwargs):
+        response = requests.Response()
+        response.status_code = 400
+        raise requests.HTTPError(response=response)
+
+    monkeypatch.setattr(provider, '_call_openai_compatible', bad_request)
+
+    with pytest.raises(requests.HTTPError):
+        provider.call_llm('Plain text please')
+    assert provider.json_mode
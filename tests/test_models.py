@@ -0,0 +1,94 @@
+"""init_database() upgrades databases created by earlier versions"""
+
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import Date, Integer, String, create_engine, inspect, text
+
+from src.database import models
+from src.database.models import init_database
+
+LEGACY_LLM_USAGE = '''
+CREATE TABLE llm_usage (
+    id INTEGER PRIMARY KEY,
+    provider_name VARCHAR(50) NOT NULL,
+    model_name VARCHAR(100) NOT NULL,
+    total_calls INTEGER NOT NULL,
+    successful_calls INTEGER NOT NULL,
+    failed_calls INTEGER NOT NULL,
+    rate_limited_calls INTEGER NOT NULL,
+    total_input_tokens INTEGER NOT NULL,
+    total_output_tokens INTEGER NOT NULL,
+    average_latency_ms FLOAT,
+    min_latency_ms FLOAT,
+    max_latency_ms FLOAT,
+    date VARCHAR(10) NOT NULL,
+    created_at DATETIME,
+    updated_at DATETIME
+)
+'''
+
+
+def legacy_engine(tmp_path, rows):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with engine.begin() as conn:
+        conn.execute(text(LEGACY_LLM_USAGE))
+        conn.execute(text(
+            "INSERT INTO llm_usage VALUES (:id, :provider, 'm', :calls, :calls, 0, 0, 1, 1, :average, :average, "
+            ":average, '2026-01-01', CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)"
+        ), rows)
+    return engine
+
+
+def llm_usage(engine):
+    with engine.connect() as conn:
+        return conn.execute(text(
+            "SELECT id, provider_name, total_calls, latency_calls, average_latency_ms, min_latency_ms, "
+            "max_latency_ms FROM llm_usage ORDER BY id"
+        )).all()
+
+
+def test_init_database_merges_racing_llm_usage_duplicates(tmp_path):
+    engine = legacy_engine(tmp_path, [
+        {'id': 1, 'provider': 'g', 'calls': 2, 'average': 100.0},
+        {'id': 2, 'provider': 'g', 'calls': 3, 'average': 200.0},
+        {'id': 3, 'provider': 'g', 'calls': 1, 'average': None},
+        {'id': 4, 'provider': 'h', 'calls': 1, 'average': 10.0},
+    ])
+
+    init_database(engine)
+    init_database(engine)
+
+    assert llm_usage(engine) == [(1, 'g', 6, 5, 160.0, 100.0, 200.0), (4, 'h', 1, 1, 10.0, 10.0, 10.0)]
+    assert 'ux_llm_usage_provider_model_date' in {index['name'] for index in inspect(engine).get_indexes('llm_usage')}
+
+
+class RecordingEngine:
+    """Just enough of a PostgreSQL engine to record the DDL convert_llm_usage_date() runs"""
+
+    class dialect:
+        name = 'postgresql'
+
+    def __init__(self):
+        self.statements = []
+
+    @contextmanager
+    def begin(self):
+        yield self
+
+    def execute(self, statement):
+        self.statements.append(str(statement))
+
+
+@pytest.mark.parametrize('column_type, converted', [(String(10), True), (Date(), False)])
+def test_init_converts_postgresql_llm_usage_date_strings(monkeypatch, column_type, converted):
+    inspector = SimpleNamespace(get_columns=lambda table: [{'name': 'id', 'type': Integer()},
+                                                           {'name': 'date', 'type': column_type}])
+    monkeypatch.setattr(models, 'inspect', lambda engine: inspector)
+    engine = RecordingEngine()
+
+    models.convert_llm_usage_date(engine)
+
+    expected = ['ALTER TABLE llm_usage ALTER COLUMN date TYPE DATE USING date::date'] if converted else []
+    assert engine.statements == expected
@@ -0,0 +1,28 @@
+"""Company list loading from CSV"""
+
+from run_pipeline_v2 import load_companies_from_csv
+
+
+def write_csv(tmp_path, text):
+    path = tmp_path / 'companies.csv'
+    path.write_text(text, encoding='utf-8')
+    return str(path)
+
+
+def test_each_row_falls_back_to_the_next_name_column(tmp_path):
+    path = write_csv(tmp_path, 'Company,Companies,Sector\nAcme,,SaaS\n,Beta Corp,Bio\nGamma,Gamma Inc,AI\n')
+
+    assert load_companies_from_csv(path) == ['Acme', 'Beta Corp', 'Gamma Inc']
+
+
+def test_names_are_stripped_deduplicated_and_limited(tmp_path):
+    path = write_csv(tmp_path, '﻿company\n Acme \nAcme\n\nBeta\nGamma\n')
+
+    assert load_companies_from_csv(path) == ['Acme', 'Beta', 'Gamma']
+    assert load_companies_from_csv(path, limit=2) == ['Acme', 'Beta']
+
+
+def test_file_without_a_name_column_has_no_companies(tmp_path):
+    path = write_csv(tmp_path, 'Name\nAcme\n')
+
+    assert load_companies_from_csv(path) == []
@@ -0,0 +1,71 @@
+"""Stage 2/3 workers commit each company on its own (SQLite allows a single writer)"""
+
+import json
+import os
+import time
+
+import yaml
+from sqlalchemy import func, select
+
+import run_pipeline_v2
+from src.database import Company
+from src.search_extractor_v2 import SearchExtractorV2
+from src.sec_collector_v2 import SECCollectorV2
+
+NETWORK_DELAY = 0.2
+CONFIG_PATH = os.path.join(os.path.dirname(__file__), '..', 'config', 'config.yaml')
+
+
+def configured_workers():
+    """(stage2_workers, stage3_workers) as shipped in config/config.yaml"""
+    with open(CONFIG_PATH) as f:
+        parallel = yaml.safe_load(f)['parallel']
+    return parallel['stage2_workers'], parallel['stage3_workers']
+
+
+def completed(db_manager, flag):
+    with db_manager.session_scope() as session:
+        return session.scalar(select(func.count()).where(flag))
+
+
+def test_stage2_parallel_workers_do_not_hold_the_sqlite_write_lock(db_manager, tmp_path):
+    names = [f'Company {i}' for i in range(16)]
+    with db_manager.session_scope() as session:
+        db_manager.bulk_create_companies(session, names)
+
+    collector = SECCollectorV2({'sec': {'cache_directory': str(tmp_path / 'sec')},
+                                'response_cache': {'enabled': False}}, db_manager)
+    collector.resolve_cik = lambda name: {'cik': name.split()[-1].zfill(10), 'official_name': name}
+
+    def fetch_form_d_filings(cik, company_name):
+        time.sleep(NETWORK_DELAY)
+        return [{'company_name': company_name, 'round_name': 'Form D Filing', 'date': '2020-01-01',
+                 'amount_raised_usd': 1e6, 'all_investors': ['Investor'], 'source_url': f'https://sec/{cik}'}]
+
+    collector.fetch_form_d_filings = fetch_form_d_filings
+
+    run_pipeline_v2.run_stage2_parallel(db_manager, collector, workers=configured_workers()[0], batch_size=4)
+
+    assert completed(db_manager, Company.stage2_sec_collected) == len(names)
+
+
+def test_stage3_parallel_workers_do_not_hold_the_sqlite_write_lock(db_manager, make_router):
+    names = [f'Company {i}' for i in range(24)]
+    with db_manager.session_scope() as session:
+        db_manager.bulk_create_companies(session, names)
+
+    def respond(prompt):
+        time.sleep(NETWORK_DELAY)
+        return json.dumps({name: [{'round_name': 'Seed'}] for name in names if f'Company: {name}\n' in prompt})
+
+    extractor = SearchExtractorV2({'response_cache': {'enabled': False}}, make_router(respond), db_manager)
+
+    def search_all(queries):
+        time.sleep(NETWORK_DELAY)
+        return [{'title': 'Funding news', 'url': 'https://news/1', 'snippet': 'raised a seed round'}]
+
+    extractor.search_all = search_all
+
+    run_pipeline_v2.run_stage3_parallel(db_manager, extractor, workers=configured_workers()[1], batch_size=3)
+
+    assert completed(db_manager, Company.stage3_search_extracted) == len(names)
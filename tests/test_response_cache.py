@@ -0,0 +1,59 @@
+"""Persistent response cache: expiry and failure handling"""
+
+from src import response_cache
+from src.response_cache import ResponseCache
+
+KEY = ResponseCache.make_key('GET', 'https://www.sec.gov/example')
+
+
+def stored_keys(cache):
+    with cache.lock:
+        return [row[0] for row in cache.conn.execute("SELECT key FROM responses")]
+
+
+def age_entries(cache, seconds):
+    with cache.lock:
+        cache.conn.execute("UPDATE responses SET ts = ts - ?", (seconds,))
+
+
+def test_expired_entries_are_deleted_when_the_cache_is_opened(tmp_path):
+    path = str(tmp_path / 'responses.db')
+    cache = ResponseCache(path, max_age_seconds=3600)
+    cache.set(KEY, b'old')
+    age_entries(cache, 7200)
+
+    reopened = ResponseCache(path, max_age_seconds=3600)
+
+    assert stored_keys(reopened) == []
+
+
+def test_expired_entries_are_deleted_every_n_writes(tmp_path, monkeypatch):
+    monkeypatch.setattr(response_cache, 'PURGE_INTERVAL_WRITES', 3)
+    cache = ResponseCache(str(tmp_path / 'responses.db'), max_age_seconds=3600)
+    cache.set(KEY, b'old')
+    age_entries(cache, 7200)
+
+    cache.set(b'fresh-1', b'body')
+    assert KEY in stored_keys(cache)
+    cache.set(b'fresh-2', b'body')
+
+    assert sorted(stored_keys(cache)) == [b'fresh-1', b'fresh-2']
+
+
+def test_lookup_honours_the_per_call_max_age(tmp_path):
+    cache = ResponseCache(str(tmp_path / 'responses.db'))
+    cache.set(KEY, b'body')
+    age_entries(cache, 120)
+
+    assert cache.get(KEY, max_age_seconds=3600) == b'body'
+    assert cache.get(KEY, max_age_seconds=60) is None
+
+
+def test_cache_errors_fall_back_to_a_miss(tmp_path):
+    cache = ResponseCache(str(tmp_path / 'responses.db'))
+    cache.set(KEY, b'body')
+    cache.conn.close()
+
+    assert cache.get(KEY, max_age_seconds=3600) is None
+    cache.set(KEY, b'body')  # logged and skipped
+    assert cache.purge() == 0
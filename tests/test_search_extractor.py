@@ -0,0 +1,106 @@
+"""Batched Stage 3 extraction: matching the LLM's keys back to companies"""
+
+import json
+
+import pytest
+from sqlalchemy import select
+
+from src.database import Company, CompanyRef, FundingRound
+from src.search_extractor_v2 import SearchExtractorV2, _format_results
+
+SEARCH_RESULTS = [{'title': 'Funding news', 'url': 'https://news/1', 'snippet': 'raised a round'}]
+
+
+def single_company_response(round_name):
+    """Answer for a single-company extraction prompt"""
+    return json.dumps({'rounds': [{'round_name': round_name}]})
+
+
+@pytest.fixture
+def companies(db_manager):
+    def create(*names):
+        with db_manager.session_scope() as session:
+            db_manager.bulk_create_companies(session, list(names))
+            rows = session.execute(select(Company.id, Company.name, Company.cik).order_by(Company.id)).all()
+        return [CompanyRef(*row) for row in rows]
+    return create
+
+
+def make_extractor(db_manager, router):
+    return SearchExtractorV2({'response_cache': {'enabled': False}}, router, db_manager)
+
+
+def batch_of(company_refs):
+    return [(company, SEARCH_RESULTS, _format_results(SEARCH_RESULTS)) for company in company_refs]
+
+
+def saved_rounds(db_manager):
+    with db_manager.session_scope() as session:
+        rows = session.execute(
+            select(Company.name, FundingRound.round_name).join(FundingRound.company).order_by(Company.name)
+        ).all()
+    return [tuple(row) for row in rows]
+
+
+def test_batch_matches_keys_with_changed_punctuation(db_manager, make_router):
+    extractor = make_extractor(db_manager, make_router(lambda prompt: json.dumps({
+        'Acme Inc': [{'round_name': 'Seed'}],
+        'Beta Corp': [],
+        'Gamma': [{'round_name': 'Series A'}],
+    })))
+
+    rounds = extractor.extract_funding_rounds_batch([('Acme, Inc.', 'r'), ('Beta Corp', 'r'), ('Gamma', 'r')])
+
+    assert {name: [r['round_name'] for r in found] for name, found in rounds.items()} == {
+        'Acme, Inc.': ['Seed'], 'Beta Corp': [], 'Gamma': ['Series A'],
+    }
+
+
+def test_batch_leaves_out_companies_without_a_usable_key(db_manager, make_router):
+    extractor = make_extractor(db_manager, make_router(lambda prompt: json.dumps({
+        'Acme Holdings': [{'round_name': 'Seed'}],
+        'Beta Corp': 'none',
+        'Gamma': [],
+    })))
+
+    rounds = extractor.extract_funding_rounds_batch([('Acme, Inc.', 'r'), ('Beta Corp', 'r'), ('Gamma', 'r')])
+
+    assert rounds == {'Gamma': []}
+
+
+def test_batch_does_not_merge_names_differing_only_by_case(db_manager, make_router):
+    extractor = make_extractor(db_manager, make_router(lambda prompt: json.dumps({
+        'ACME': [{'round_name': 'Seed'}],
+        'acme ': [{'round_name': 'Series B'}],
+    })))
+
+    rounds = extractor.extract_funding_rounds_batch([('ACME', 'r'), ('Acme', 'r')])
+
+    assert list(rounds) == ['ACME']
+    assert [r['round_name'] for r in rounds['ACME']] == ['Seed']
+
+
+def test_unmatched_company_is_extracted_alone_not_saved_as_no_rounds(db_manager, make_router, companies):
+    def respond(prompt):
+        if 'Company: ' in prompt:
+            return json.dumps({'Acme Inc': [{'round_name': 'Seed'}], 'Gamma': []})
+        return single_company_response('Series A')
+
+    router = make_router(respond)
+    extractor = make_extractor(db_manager, router)
+
+    extractor._save_batch(batch_of(companies('Acme, Inc.', 'Beta Corp', 'Gamma')))
+
+    # One batched call, then Beta Corp (missing from the answer) on its own
+    assert len(router.calls) == 2
+    assert 'Beta Corp' in router.calls[1][0]
+    assert saved_rounds(db_manager) == [('Acme, Inc.', 'Seed'), ('Beta Corp', 'Series A')]
+
+
+def test_batch_output_budget_scales_with_batch_size(db_manager, make_router):
+    router = make_router(lambda prompt: json.dumps({'A': [], 'B': [], 'C': []}))
+    extractor = make_extractor(db_manager, router)
+
+    extractor.extract_funding_rounds_batch([('A', 'r'), ('B', 'r'), ('C', 'r')])
+
+    assert router.calls[0][1]['max_tokens'] == 3 * extractor.llm_max_tokens_per_company